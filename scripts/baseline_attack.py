@@ -3,17 +3,53 @@
 from argparse import ArgumentParser
 from functools import partial
 from itertools import product
-from multiprocessing import Pool
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 from pynvml import nvmlDeviceGetCount, nvmlInit, nvmlShutdown
 
 from go_attack.adversarial_policy import POLICIES
 from go_attack.baseline_attack import (
     ENGINE_TYPES,
+    OUTPUT_FORMATS,
     PASSING_BEHAVIOR,
+    VICTIM_BACKENDS,
+    default_engine_pool,
     run_baseline_attack,
 )
+from go_attack.sweep import (
+    WorkUnit,
+    assign_to_queues,
+    make_work_units,
+    run_work_stealing,
+)
+
+
+def run_with_warm_engines(*args, **kwargs):
+    """Run `run_baseline_attack`, reusing engines across runs in this process."""
+    return run_baseline_attack(*args, engine_pool=default_engine_pool(), **kwargs)
+
+
+def expected_game_cost(config: Tuple) -> float:
+    """Expected cost of a game of `config`, dominated by the victim's visits."""
+    _, _, num_visits, *_ = config
+    return float(num_visits or 1)
+
+
+def run_unit(baseline_fn: partial, unit: WorkUnit, gpu: int) -> List[float]:
+    """Play the games of `unit` on `gpu` and return their win margins for black."""
+    games = run_with_warm_engines(
+        *baseline_fn.args,
+        *unit.config,
+        gpu,
+        **{
+            **baseline_fn.keywords,
+            "first_game": unit.first_game,
+            "num_games": unit.num_games,
+            "progress_bar": False,
+        },
+    )
+    return [black - white for black, white in (game.score() for game in games)]
 
 
 def main():  # noqa: D103
@@ -76,6 +112,16 @@ def main():  # noqa: D103
         default=None,
         help="Where to save logged games",
     )
+    parser.add_argument(
+        "--nn-cache",
+        action="store_true",
+        help=(
+            "Cache KataGo's raw NN outputs for the white-box policies by "
+            "position, up to symmetry. Faster, but only approximately "
+            "reproduces uncached runs, and runs split into units of work or "
+            "resumed from a journal may play different games"
+        ),
+    )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
     parser.add_argument("--size", type=int, default=19, help="Board size")
     parser.add_argument(
@@ -109,12 +155,41 @@ def main():  # noqa: D103
         help="The color the victim plays as (black or white)",
         nargs="+",
     )
+    parser.add_argument(
+        "--victim-backend",
+        choices=VICTIM_BACKENDS,
+        default="gtp",
+        help=(
+            "How to run the victim. 'analysis' plays all games concurrently "
+            "through one KataGo analysis engine (KataGo only)"
+        ),
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="sgf",
+        help=(
+            "How to store games. 'sgfs' appends them all to one .sgfs file per "
+            "unit of work"
+        ),
+    )
     parser.add_argument(
         "--parallel-runs-per-gpu",
         type=int,
         default=5,
         help="Number of parallel jobs to run per GPU",
     )
+    parser.add_argument(
+        "--games-per-unit",
+        type=int,
+        default=None,
+        help=(
+            "Number of games per unit of work; configurations are split into "
+            "units that idle workers can steal. Defaults to 10 with several "
+            "configurations. A single configuration is only split if this is "
+            "set, and the analysis backend is never split"
+        ),
+    )
     args = parser.parse_args()
     if args.engine == "katago":
         if args.num_visits is None:
@@ -174,8 +249,11 @@ def main():  # noqa: D103
         log_root=args.log_dir,
         moves_before_pass=args.moves_before_pass,
         num_games=args.num_games,
+        output_format=args.output_format,
         seed=args.seed,
+        use_nn_cache=args.nn_cache,
         verbose=args.verbose,
+        victim_backend=args.victim_backend,
     )
 
     configs = list(
@@ -192,30 +270,65 @@ def main():  # noqa: D103
         ),
     )
 
-    if len(configs) > 1:
-        print(f"Running {len(configs)} configurations in parallel")
-        if args.engine != "katago":
-            print(
-                f"WARNING: {args.engine} is not set up for parallel runs, as the "
-                f"`socat` setup for {args.engine} does not support scheduling runs "
-                "on different GPUs. Parallelize runs by launching a separate "
-                "instance of baseline_attack vs. a separate instance of "
-                f"{args.engine}.",
-            )
-            raise ValueError(f"Parallel runs not supported for engine: {args.engine}")
-
-        nvmlInit()
-        num_devices = min(len(configs), nvmlDeviceGetCount())
-        print(f"Using {num_devices} GPU devices")
+    if len(configs) > 1 and args.engine != "katago":
+        print(
+            f"WARNING: {args.engine} is not set up for parallel runs, as the "
+            f"`socat` setup for {args.engine} does not support scheduling runs "
+            "on different GPUs. Parallelize runs by launching a separate "
+            "instance of baseline_attack vs. a separate instance of "
+            f"{args.engine}.",
+        )
+        raise ValueError(f"Parallel runs not supported for engine: {args.engine}")
 
-        with Pool(args.parallel_runs_per_gpu * num_devices) as p:
-            baseline_fn = partial(baseline_fn, progress_bar=False)
-            configs = [(*config, i % num_devices) for i, config in enumerate(configs)]
-            p.starmap(baseline_fn, configs)
+    if args.engine != "katago":
+        baseline_fn(*configs[0])
+        return
 
-        nvmlShutdown()
-    else:
+    games_per_unit = args.games_per_unit
+    if args.victim_backend == "analysis":
+        # The analysis backend batches the positions of all the games of a run.
+        games_per_unit = max(args.num_games, 1)
+    elif games_per_unit is None:
+        games_per_unit = 10 if len(configs) > 1 else max(args.num_games, 1)
+    units = make_work_units(
+        configs,
+        args.num_games,
+        games_per_unit,
+        expected_game_cost,
+    )
+    if not units:
+        print("No games to play")
+        return
+    if len(units) == 1:
         baseline_fn(*configs[0])
+        return
+
+    print(f"Running {len(configs)} configurations as {len(units)} units of work")
+    nvmlInit()
+    num_devices = min(len(units), nvmlDeviceGetCount())
+    nvmlShutdown()
+    print(f"Using {num_devices} GPU devices")
+
+    # Each worker keeps its engines running between units, so units that share
+    # a victim only pay the startup cost once.
+    queues = assign_to_queues(units, num_devices)
+    results = run_work_stealing(
+        queues,
+        partial(run_unit, baseline_fn),
+        args.parallel_runs_per_gpu,
+    )
+
+    margins: Dict[int, List[float]] = {}
+    for unit, unit_margins in results:
+        margins.setdefault(unit.config_idx, []).extend(unit_margins)
+    for config_idx, config in enumerate(configs):
+        config_margins = margins.get(config_idx, [])
+        if not config_margins:
+            print(f"{config}: no games")
+            continue
+        print(
+            f"{config}: average win margin {sum(config_margins) / len(config_margins)}",
+        )
 
 
 if __name__ == "__main__":
@@ -4,37 +4,89 @@ KataGo scoring clears out opposite-color stones within pass-alive groups. For
 consistency throughout experiments, we should use KataGo scoring everywhere
 (including in experiments where otherwise KataGo isn't involved at all like
 baseline attacks vs. ELF).
+
+Games are rescored in batches, each sent to an engine in one go. With
+`--num-workers`, several worker processes each run their own engine, and the
+games are still written out in the order they were read.
+
+Each game reaches the engine either through a temporary file and `loadsgf`,
+or by replaying its moves over GTP with `--load-mode replay`. Which is faster
+depends on the filesystem of the temporary files and hasn't been measured with
+KataGo, so `loadsgf` remains the default.
 """
 
 import argparse
+import collections
+import hashlib
+import itertools
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.util
 import os
 import subprocess
 import tempfile
+import time
 from pathlib import Path
+from typing import (
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 import sgfmill.sgf
+from sgfmill.common import format_vertex
 
+from go_attack.go import IllegalMoveError
+from go_attack.gtp import GTPClient
+from go_attack.scoring import SCORER_VERSION, ScoreCache, score_sgf
 
-def get_sgfs_in_file(sgf_file: Path):
-    """Get all SGFs in a file."""
+
+class RescoredGame(NamedTuple):
+    """The result of rescoring one game."""
+
+    sgf: bytes  # The game with KataGo's result
+    original_score: float  # The original score for white
+    katago_score_str: str
+    key: str  # See `game_key`
+    cached: bool  # Whether the result came from the cache
+
+
+def get_sgf_strings_in_file(sgf_file: Path) -> Iterator[str]:
+    """Get all SGFs in a file, unparsed."""
     if sgf_file.suffix == ".sgf":
         # Assume entire file is one SGF.
         with open(sgf_file) as f:
-            yield sgfmill.sgf.Sgf_game.from_string(f.read())
+            yield f.read()
     elif sgf_file.suffix == ".sgfs":
         # Assume each line in the file is an SGF.
         with open(sgf_file) as f:
-            for line in f:
-                yield sgfmill.sgf.Sgf_game.from_string(line)
+            yield from f
+
+
+def get_sgf_strings_in_path(path: Path) -> Iterator[str]:
+    """Recursively get all SGFs in a path, unparsed."""
+    yield from get_sgf_strings_in_file(path)
+    for dirpath, _, filenames in sorted(os.walk(path)):
+        for f in sorted(filenames):
+            child_path = Path(os.path.join(dirpath, f))
+            yield from get_sgf_strings_in_file(child_path)
+
+
+def get_sgfs_in_file(sgf_file: Path):
+    """Get all SGFs in a file."""
+    for sgf_str in get_sgf_strings_in_file(sgf_file):
+        yield sgfmill.sgf.Sgf_game.from_string(sgf_str)
 
 
 def get_sgfs_in_path(path: Path):
     """Recursively get all SGFs in a path."""
-    yield from get_sgfs_in_file(path)
-    for dirpath, _, filenames in os.walk(path):
-        for f in filenames:
-            child_path = Path(os.path.join(dirpath, f))
-            yield from get_sgfs_in_file(child_path)
+    for sgf_str in get_sgf_strings_in_path(path):
+        yield sgfmill.sgf.Sgf_game.from_string(sgf_str)
 
 
 def score_str_to_white_score(score_str: str) -> float:
@@ -52,6 +104,226 @@ def get_white_score(game: sgfmill.sgf.Sgf_game) -> float:
     return score_str_to_white_score(score_str)
 
 
+# Bounds the bytes waiting in the engine's pipes, which must stay below their
+# capacity (often 64 KiB) since we don't read while writing commands.
+MAX_COMMANDS_IN_FLIGHT = 1000
+
+# Set in each worker process by `_init_worker`.
+_cache: Optional[ScoreCache] = None
+_gtp: Optional[GTPClient] = None
+_load_mode = "loadsgf"
+_scorer = f"python {SCORER_VERSION}"  # Which scorer and version, see `game_key`
+_tmp_dir: Optional[Path] = None
+
+
+def _start_katago(executable: str, tmp_dir: Path) -> GTPClient:
+    """Start a KataGo GTP engine that only needs to score games."""
+    katago_command = (
+        f"{executable} gtp "
+        "-config /engines/KataGo-raw/cpp/configs/gtp_example.cfg "
+        "-model /dev/null"
+    )
+    with open(tmp_dir / f"stderr_{os.getpid()}.log", "w") as stderr:
+        proc = subprocess.Popen(
+            katago_command,
+            bufsize=0,
+            shell=True,
+            stderr=stderr,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+    assert proc.stdin is not None and proc.stdout is not None
+    return GTPClient(proc.stdin, proc.stdout)
+
+
+def _quit_katago(gtp: GTPClient) -> None:
+    gtp.command("quit")
+
+
+def _init_worker(
+    executable: Optional[str],
+    load_mode: str,
+    tmp_dir: Path,
+    cache_path: Optional[Path],
+) -> None:
+    global _cache, _gtp, _load_mode, _scorer, _tmp_dir
+    _load_mode, _tmp_dir = load_mode, tmp_dir
+    if cache_path is not None:
+        _cache = ScoreCache(cache_path)
+    if executable is None:
+        return  # Games are scored in Python
+
+    _gtp = _start_katago(executable, tmp_dir)
+    _scorer = f"katago {_gtp.command('version')}"
+    # Quit the engine when the worker exits, including the main process when
+    # it scores the games itself.
+    multiprocessing.util.Finalize(_gtp, _quit_katago, args=(_gtp,), exitpriority=1)
+
+
+def replay_commands(sgf: sgfmill.sgf.Sgf_game) -> List[str]:
+    """Return the GTP commands that set up the main line of `sgf` on the board.
+
+    The rules are set first, so that KataGo accepts every move that's legal
+    under Tromp-Taylor rules.
+    """
+    commands = [
+        f"boardsize {sgf.get_size()}",
+        "clear_board",
+        "kata-set-rules Tromp-Taylor",
+        f"komi {sgf.get_komi()}",
+    ]
+    black_stones, white_stones, _ = sgf.get_root().get_setup_stones()
+    for color, points in (("b", black_stones), ("w", white_stones)):
+        commands.extend(f"play {color} {format_vertex(p)}" for p in sorted(points))
+    for node in sgf.get_main_sequence():
+        color, point = node.get_move()
+        if color is not None:
+            commands.append(f"play {color} {format_vertex(point)}")
+    return commands
+
+
+def game_key(sgf: sgfmill.sgf.Sgf_game, scorer: str) -> str:
+    """Return a hash of everything the score of `sgf` depends on.
+
+    That's the scorer, e.g. `katago 1.12.4` or `python 1`, and the board size,
+    komi, rules and moves, which are exactly what `replay_commands` sends to
+    the engine. The scorer is part of the key so that the results of KataGo
+    and of `go_attack.scoring` are never mixed in a cache, and neither are
+    those of different versions.
+    """
+    commands = "\n".join([scorer, *replay_commands(sgf)])
+    return hashlib.blake2b(commands.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def rescore_batch(sgf_strs: Sequence[str]) -> List[Optional[RescoredGame]]:
+    """Rescore a batch of games with this worker's engine, if any.
+
+    Commands are pipelined across the games of the batch, so the engine never
+    waits on us between games. At most `MAX_COMMANDS_IN_FLIGHT` commands are
+    unanswered at a time, which keeps both pipes from filling up. Without an
+    engine, games are scored with `go_attack.scoring.score_sgf` instead. Games
+    whose results are in the cache aren't scored again.
+
+    Args:
+        sgf_strs: The games to rescore.
+
+    Returns:
+        For each game, the rescored game, or `None` if it has no result or
+        can't be scored without an engine.
+    """
+    assert _tmp_dir is not None
+    games = []
+    for i, sgf_str in enumerate(sgf_strs):
+        sgf = sgfmill.sgf.Sgf_game.from_string(sgf_str)
+        try:
+            original_score = get_white_score(sgf)
+        except KeyError:
+            print("Skipping game due to no result")
+            continue
+        try:
+            key = game_key(sgf, _scorer)
+        except ValueError:
+            print("Skipping game with a malformed move")
+            continue
+        games.append((i, sgf_str, sgf, original_score, key))
+    cached = _cache.get_many([key for *_, key in games]) if _cache else {}
+
+    rescored: List[Optional[RescoredGame]] = [None] * len(sgf_strs)
+    in_flight: Deque[Tuple[int, sgfmill.sgf.Sgf_game, float, str, list]] = (
+        collections.deque()
+    )
+    num_in_flight = 0
+
+    def finish(i, sgf, original_score, key, katago_score_str):
+        sgf.get_root().set("RE", katago_score_str)
+        rescored[i] = RescoredGame(
+            sgf.serialise(wrap=None),
+            original_score,
+            katago_score_str,
+            key,
+            cached=key in cached,
+        )
+
+    def finish_oldest():
+        nonlocal num_in_flight
+        i, sgf, original_score, key, responses = in_flight.popleft()
+        num_in_flight -= len(responses)
+        *_, katago_score_str = [response.result() for response in responses]
+        finish(i, sgf, original_score, key, katago_score_str)
+
+    for i, sgf_str, sgf, original_score, key in games:
+        if key in cached:
+            finish(i, sgf, original_score, key, cached[key])
+            continue
+        if _gtp is None:
+            try:
+                katago_score_str = score_sgf(sgf_str)
+            except (IllegalMoveError, ValueError) as e:
+                print(f"Skipping game that can't be scored: {e}")
+                continue
+            finish(i, sgf, original_score, key, katago_score_str)
+            continue
+
+        if _load_mode == "replay":
+            commands = replay_commands(sgf)
+        else:
+            tmp_sgf_path = _tmp_dir / f"game_{os.getpid()}_{i}.sgf"
+            with open(tmp_sgf_path, "wb") as katago_input_sgf_file:
+                katago_input_sgf_file.write(sgf.serialise())
+            commands = [f"loadsgf {tmp_sgf_path}", "kata-set-rules Tromp-Taylor"]
+        commands += [
+            # We need to make sure KataGo thinks the game has ended or else
+            # it may estimate the score using its model (which in this case
+            # is /dev/null, a random model).
+            "play b pass",
+            "play w pass",
+            "final_score",
+        ]
+        # Any failure is raised when reading the responses.
+        responses = [_gtp.send(command) for command in commands]
+        in_flight.append((i, sgf, original_score, key, responses))
+        num_in_flight += len(responses)
+
+        # Make room for the next game.
+        while num_in_flight > MAX_COMMANDS_IN_FLIGHT:
+            finish_oldest()
+
+    while in_flight:
+        finish_oldest()
+    return rescored
+
+
+def _batches(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def rescore_in_order(
+    pool: Optional[multiprocessing.pool.Pool],
+    batches: Iterable[List[str]],
+    max_pending: int,
+) -> Iterator[Optional[RescoredGame]]:
+    """Rescore `batches` on `pool`, yielding the games in their original order.
+
+    At most `max_pending` batches are in flight, so memory use stays bounded
+    however many games there are. Without a pool, games are rescored in this
+    process.
+    """
+    if pool is None:
+        for batch in batches:
+            yield from rescore_batch(batch)
+        return
+
+    pending: Deque[multiprocessing.pool.AsyncResult] = collections.deque()
+    for batch in batches:
+        pending.append(pool.apply_async(rescore_batch, (batch,)))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
+
+
 def main():
     """Entrypoint for script."""
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -82,76 +354,87 @@ def main():
                 "humancompatibleai/goattack:cpp /engines/KataGo-raw/cpp/katago"
             ),
         )
+        parser.add_argument(
+            "--scorer",
+            choices=("katago", "python"),
+            default="katago",
+            help=(
+                "Score with KataGo, or with go_attack.scoring, which reproduces "
+                "KataGo's scoring without starting an engine"
+            ),
+        )
+        parser.add_argument(
+            "-j",
+            "--num-workers",
+            type=int,
+            default=1,
+            help="Number of KataGo engines to rescore games with in parallel",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=64,
+            help="Number of games whose commands are sent to an engine at once",
+        )
+        parser.add_argument(
+            "--load-mode",
+            choices=("loadsgf", "replay"),
+            default="loadsgf",
+            help=(
+                "How to give KataGo each game: write it to a temporary file for "
+                "'loadsgf', or 'replay' its moves with 'play' commands, which "
+                "needs no shared filesystem"
+            ),
+        )
+        parser.add_argument(
+            "--cache",
+            type=Path,
+            help=(
+                "SQLite database of results keyed by a hash of each game and the "
+                "scorer, so a rerun only scores new games. With a cache, an "
+                "existing output file is replaced once the run completes"
+            ),
+        )
         args = parser.parse_args()
-        if args.output.is_file():
+        if args.output.is_file() and args.cache is None:
             raise ValueError(f"Output file already exists: {args.output}")
 
-        katago_command = (
-            f"{args.executable} gtp "
-            "-config /engines/KataGo-raw/cpp/configs/gtp_example.cfg "
-            "-model /dev/null"
-        )
-        proc = subprocess.Popen(
-            katago_command,
-            bufsize=0,
-            shell=True,
-            stderr=open(tmp_dir / "stderr.log", "w"),
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-        )
-        to_engine = proc.stdin
-        from_engine = proc.stdout
-        assert to_engine is not None
-
-        def send_command(message, assert_success=True):
-            to_engine.write(f"{message}\n".encode("ascii"))
-            output = ""
-            found_output_start = False
-            success = False
-            for i, line in enumerate(from_engine):
-                line = line.decode("ascii")
-
-                if found_output_start and line.strip() == "":
-                    # Blank line signals the end of a response.
-                    break
-
-                if not found_output_start:
-                    if line[0] == "?":
-                        # Error response, no success.
-                        found_output_start = True
-                        output += line[1:]
-                    elif line[0] == "=":
-                        success = True
-                        found_output_start = True
-                        output += line[1:]
-                else:
-                    output += line
-            if assert_success:
-                assert success
-            return output.lstrip().strip()
+        executable = args.executable if args.scorer == "katago" else None
+        pool = None
+        if args.num_workers > 1:
+            pool = multiprocessing.Pool(
+                args.num_workers,
+                initializer=_init_worker,
+                initargs=(executable, args.load_mode, tmp_dir, args.cache),
+            )
+        else:
+            _init_worker(executable, args.load_mode, tmp_dir, args.cache)
+        cache = ScoreCache(args.cache) if args.cache is not None else None
+        new_results: List[Tuple[str, str]] = []
 
+        start_time = time.monotonic()
         num_games = 0
         num_flipped_games = 0
         squared_error_sum = 0
-        tmp_sgf_path = tmp_dir / "game.sgf"
-        with open(args.output, "wb") as output_file:
-            for sgf in get_sgfs_in_path(args.sgf_path):
-                try:
-                    original_score = get_white_score(sgf)
-                except KeyError:
-                    print("Skipping game due to no result")
+        batches = _batches(get_sgf_strings_in_path(args.sgf_path), args.batch_size)
+        num_cached = 0
+        # Write to a temporary file first, so that a failed rerun doesn't
+        # clobber the previous output.
+        output_path = args.output
+        if output_path != Path(os.devnull):
+            output_path = args.output.with_name(args.output.name + ".tmp")
+        with open(output_path, "wb") as output_file:
+            for rescored in rescore_in_order(pool, batches, 4 * args.num_workers):
+                if rescored is None:
                     continue
-
-                with open(tmp_sgf_path, "wb") as katago_input_sgf_file:
-                    katago_input_sgf_file.write(sgf.serialise())
-                send_command(f"loadsgf {tmp_sgf_path}")
-                send_command("kata-set-rules Tromp-Taylor")
-                # We need to make sure KataGo thinks the game has ended or else it may
-                # estimate the score using its model (which in this case is /dev/null, a
-                # random model).
-                send_command("play b pass")
-                send_command("play w pass")
-                katago_score_str = send_command("final_score")
+                output_sgf, original_score, katago_score_str, key, cached = rescored
+                if cached:
+                    num_cached += 1
+                elif cache is not None:
+                    new_results.append((key, katago_score_str))
+                    if len(new_results) >= args.batch_size:
+                        cache.put_many(new_results)
+                        new_results.clear()
 
                 katago_score = score_str_to_white_score(katago_score_str)
                 squared_error_sum += (katago_score - original_score) ** 2
@@ -159,9 +442,20 @@ def main():
                 if katago_score * original_score < 0:
                     num_flipped_games += 1
 
-                sgf.get_root().set("RE", katago_score_str)
-                output_file.write(sgf.serialise(wrap=None))
+                output_file.write(output_sgf)
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.put_many(new_results)
+            cache.close()
+        if output_path != args.output:
+            os.replace(output_path, args.output)
+
+        elapsed = time.monotonic() - start_time
         if num_games > 0:
+            print(f"Rescored {num_games / elapsed:.1f} games/s")
+            print(f"Results taken from the cache: {num_cached}/{num_games}")
             print(f"Games that changed winners: {num_flipped_games}/{num_games}")
             print(f"Mean squared error: {squared_error_sum / num_games}")
         else:
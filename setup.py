@@ -50,6 +50,7 @@ setup(
         "matplotlib",
         "numpy",
         "pandas[html]",
+        "pyarrow",
         "pynvml",
         "scipy",
         "seaborn",
@@ -3,12 +3,15 @@
 import random
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import IO, ClassVar, Dict, Optional, Type
+from typing import ClassVar, Dict, List, Optional, Type
 
 import numpy as np
 
-from .board_utils import l1_distance, mirror_move, parse_array
+from .batch import GameBatch
+from .board_utils import l1_distance, mirror_move, parse_raw_nn
 from .go import Color, Game, Move
+from .gtp import GTPClient
+from .nn_cache import NNEvalCache, RawNNOutputs
 
 
 class AdversarialPolicy(ABC):
@@ -26,6 +29,34 @@ class AdversarialPolicy(ABC):
 POLICIES: Dict[str, Type["BasicPolicy"]] = {}
 
 
+def _legal_masks_xy(batch: GameBatch, allow_suicide: bool) -> np.ndarray:
+    """Return the legal move masks of `batch` indexed by [game, x, y]."""
+    masks = batch.legal_move_masks(allow_suicide=allow_suicide).astype(bool)
+    # Flip the rows so the masks are indexed by [y, x], then swap the axes.
+    return masks[:, ::-1, :].transpose(0, 2, 1)
+
+
+def _sample_moves(masks: np.ndarray) -> List[Optional[Move]]:
+    """Pick a uniformly random move from each [x, y] mask, or pass if empty."""
+    # Derive the generator from `random` so that `random.seed` applies here too.
+    rng = np.random.default_rng(random.getrandbits(64))
+    flat = masks.reshape(len(masks), -1)
+    choices = np.where(flat, rng.random(flat.shape), -1.0).argmax(axis=1)
+    return _flat_to_moves(choices, flat.any(axis=1), masks.shape[-1])
+
+
+def _flat_to_moves(
+    flat_idxs: np.ndarray,
+    valid: np.ndarray,
+    size: int,
+) -> List[Optional[Move]]:
+    """Convert flat [x, y] indices into moves, passing where `valid` is False."""
+    return [
+        Move(*divmod(int(idx), size)) if is_valid else None
+        for idx, is_valid in zip(flat_idxs, valid)
+    ]
+
+
 @dataclass
 class BasicPolicy(AdversarialPolicy, ABC):
     """Base class for adversarial policies that aren't wrappers."""
@@ -85,6 +116,45 @@ class EdgePolicy(BasicPolicy):
 
         return Move(*coords) if coords is not None else None
 
+    @classmethod
+    def batch_next_moves(
+        cls,
+        batch: GameBatch,
+        allow_suicide: bool,
+    ) -> List[Optional[Move]]:
+        """Return the next move to play in every game of `batch`.
+
+        Args:
+            batch: The games to play in.
+            allow_suicide: Whether the adversary may play suicide moves.
+
+        Returns:
+            One move per game, or None to pass.
+
+        Raises:
+            ValueError: If the board size is even.
+        """
+        size = batch.board_size
+        if size % 2 == 0:
+            raise ValueError(f"{cls.__name__} only works on odd board sizes")
+
+        masks = _legal_masks_xy(batch, allow_suicide)
+        centered = np.indices((size, size)) - size // 2
+        inf_norm = np.abs(centered).max(axis=0)
+
+        # Only consider vertices that are in the outermost L-inf box
+        ring = np.where(masks, inf_norm, -1)
+        max_norm = ring.reshape(len(masks), -1).max(axis=1)
+        masks &= ring == max_norm[:, None, None]
+
+        # Randomly select from this box
+        if cls.randomized:
+            return _sample_moves(masks)
+
+        angles = np.arctan2(centered[1], centered[0])
+        flat = np.where(masks, angles, -np.inf).reshape(len(masks), -1)
+        return _flat_to_moves(flat.argmax(axis=1), max_norm >= 0, size)
+
 
 class MirrorPolicy(BasicPolicy):
     """Adversarial policy that mirrors the board across the y = x diagonal.
@@ -124,6 +194,51 @@ class MirrorPolicy(BasicPolicy):
             center = Move(size // 2, size // 2)
             return center
 
+    @classmethod
+    def batch_next_moves(
+        cls,
+        batch: GameBatch,
+        allow_suicide: bool,
+    ) -> List[Optional[Move]]:
+        """Return the next move to play in every game of `batch`.
+
+        Args:
+            batch: The games to play in.
+            allow_suicide: Whether the adversary may play suicide moves.
+
+        Returns:
+            One move per game, or None to pass.
+        """
+        size = batch.board_size
+        masks = _legal_masks_xy(batch, allow_suicide)
+        random_moves = _sample_moves(masks)
+
+        # Mirror positions; games where the opponent passed play randomly.
+        targets = np.full((len(masks), 2), size // 2)
+        for game_idx, moves in enumerate(batch.moves):
+            if moves and moves[-1] is not None:
+                targets[game_idx] = mirror_move(moves[-1], size)
+
+        # Return the closest legal move to the mirror position
+        xs, ys = np.indices((size, size))
+        dists = np.abs(xs - targets[:, 0, None, None])
+        dists += np.abs(ys - targets[:, 1, None, None])
+        flat = np.where(masks, dists, np.iinfo(dists.dtype).max)
+        closest = flat.reshape(len(masks), -1).argmin(axis=1)
+        has_legal = masks.reshape(len(masks), -1).any(axis=1)
+        moves = _flat_to_moves(closest, has_legal, size)
+
+        for game_idx, past_moves in enumerate(batch.moves):
+            if not has_legal[game_idx]:
+                continue
+            if not past_moves:
+                # Mirror is playing first move as black. Play in the center.
+                moves[game_idx] = Move(size // 2, size // 2)
+            elif past_moves[-1] is None:
+                moves[game_idx] = random_moves[game_idx]
+
+        return moves
+
 
 class PassingPolicy(BasicPolicy):
     """Adversarial policy that always passes."""
@@ -138,6 +253,23 @@ class PassingPolicy(BasicPolicy):
         """
         return None  # Pass
 
+    @classmethod
+    def batch_next_moves(
+        cls,
+        batch: GameBatch,
+        allow_suicide: bool,
+    ) -> List[Optional[Move]]:
+        """Return the next move to play in every game of `batch`.
+
+        Args:
+            batch: The games to play in.
+            allow_suicide: Whether the adversary may play suicide moves.
+
+        Returns:
+            None for every game, i.e. always pass.
+        """
+        return [None] * len(batch)
+
 
 class RandomPolicy(BasicPolicy):
     """Adversarial policy that plays random moves."""
@@ -153,6 +285,23 @@ class RandomPolicy(BasicPolicy):
         legal_moves = list(self.game.legal_moves(allow_suicide=self.allow_suicide))
         return random.choice(legal_moves) if legal_moves else None
 
+    @classmethod
+    def batch_next_moves(
+        cls,
+        batch: GameBatch,
+        allow_suicide: bool,
+    ) -> List[Optional[Move]]:
+        """Return the next move to play in every game of `batch`.
+
+        Args:
+            batch: The games to play in.
+            allow_suicide: Whether the adversary may play suicide moves.
+
+        Returns:
+            One move per game, or None to pass.
+        """
+        return _sample_moves(_legal_masks_xy(batch, allow_suicide))
+
 
 class SpiralPolicy(EdgePolicy):
     """Adversarial policy that plays moves in a spiral pattern."""
@@ -161,13 +310,26 @@ class SpiralPolicy(EdgePolicy):
     randomized: bool = False
 
 
+def _raw_nn(
+    gtp: GTPClient,
+    game: Game,
+    nn_cache: Optional[NNEvalCache],
+) -> RawNNOutputs:
+    """Evaluate the current position of `game` with `kata-raw-nn`, or the cache."""
+
+    def query():
+        return parse_raw_nn(gtp.command("kata-raw-nn 0"), game.board_size)
+
+    return query() if nn_cache is None else nn_cache.evaluate(game, query)
+
+
 @dataclass
 class MyopicWhiteBoxPolicy(BasicPolicy):
     """Plays least likely moves from KataGo's policy net."""
 
     name: ClassVar[str] = "myopic-whitebox"
-    gtp_stdin: IO[bytes]
-    gtp_stdout: IO[bytes]
+    gtp: GTPClient
+    nn_cache: Optional[NNEvalCache] = None
 
     def next_move(self) -> Optional[Move]:
         """Return the next move to play.
@@ -175,9 +337,18 @@ class MyopicWhiteBoxPolicy(BasicPolicy):
         Returns:
             The adversarial move to play. If None, we pass.
         """
-        self.gtp_stdin.write(b"kata-raw-nn 0\n")
+        move = self._least_likely_move(self.nn_cache)
+        if move is not None and self.nn_cache is not None:
+            # A cached policy may come from a game with a different history,
+            # where superko allowed moves that are illegal here.
+            if not self.game.is_legal(move):
+                move = self._least_likely_move(None)
+        return move
+
+    def _least_likely_move(self, nn_cache: Optional[NNEvalCache]) -> Optional[Move]:
+        """Return the legal move the policy net likes least, or None if none."""
         size = self.game.board_size
-        policy_dist = parse_array(self.gtp_stdout, "policy", size)
+        policy_dist = _raw_nn(self.gtp, self.game, nn_cache)["policy"]
 
         try:
             flat_idx = np.nanargmin(policy_dist)
@@ -193,8 +364,8 @@ class NonmyopicWhiteBoxPolicy(BasicPolicy):
     """Plays vertices that KataGo predicts the attacker will not own."""
 
     name: ClassVar[str] = "nonmyopic-whitebox"
-    gtp_stdin: IO[bytes]
-    gtp_stdout: IO[bytes]
+    gtp: GTPClient
+    nn_cache: Optional[NNEvalCache] = None
 
     def next_move(self) -> Optional[Move]:
         """Return the next move to play.
@@ -202,9 +373,8 @@ class NonmyopicWhiteBoxPolicy(BasicPolicy):
         Returns:
             The adversarial move to play. If None, we pass.
         """
-        self.gtp_stdin.write(b"kata-raw-nn 0\n")
         size = self.game.board_size
-        ownership_dist = parse_array(self.gtp_stdout, "whiteOwnership", size)
+        ownership_dist = _raw_nn(self.gtp, self.game, self.nn_cache)["whiteOwnership"]
         ownership_dist += (
             1 - self.game.legal_move_mask(allow_suicide=self.allow_suicide).T
         ) * np.inf
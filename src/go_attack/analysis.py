@@ -1,35 +1,242 @@
-"""Utilities for loading and manipulating KataGo analyses."""
+"""Utilities for storing and loading KataGo analyses.
 
+The analysis KataGo prints for each victim move, e.g. in response to
+`kata-genmove_analyze`, is parsed once when it's captured into one row per
+candidate move. The rows of each game are stored as one row group of a Parquet
+file, so `load_analysis` can skip the games and columns it doesn't need
+without reading them.
+"""
+
+import os
 import re
 from pathlib import Path
-from typing import Union
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
+AnalysisRow = Dict[str, Any]
 
-def load_analysis(path: Union[Path, str]) -> pd.DataFrame:
-    """Loads a newline-delimited file of KataGo analyses into a DataFrame."""
-    # space-delimited key-value pairs, where keys start with lowercase letters
-    # and are at least 3 characters long.
-    parser = re.compile(r"([a-z][a-zA-Z]{2,}) ([A-Z0-9-.]+)")
-    return pd.concat(
-        [
-            pd.DataFrame(
-                [
-                    {k: maybe_to_float(v) for k, v in parser.findall(move)}
-                    for move in line.split("info ")
-                    if move
-                ],
-            ).assign(turn=i)
-            for i, line in enumerate(open(path).readlines())
-            if len(line) > 1  # Skip empty / newlines
-        ],
-    )
+ANALYSIS_SCHEMA = pa.schema(
+    [
+        ("game", pa.int32()),
+        ("turn", pa.int32()),  # Number of moves played before the analysis
+        ("move", pa.string()),
+        ("visits", pa.int64()),
+        ("winrate", pa.float64()),
+        ("scoreLead", pa.float64()),
+        ("prior", pa.float64()),
+        ("lcb", pa.float64()),
+        ("order", pa.int32()),
+        ("pvLength", pa.int32()),
+    ],
+)
+_INT_FIELDS = ("visits", "order")
+_FLOAT_FIELDS = ("winrate", "scoreLead", "prior", "lcb")
+_VERTEX = re.compile(r"[A-Z]+[0-9]+|pass")
+
+
+def parse_analysis(
+    line: str,
+    turn: Optional[int],
+    *,
+    extra_fields: bool = False,
+) -> List[AnalysisRow]:
+    """Parse one line of KataGo analysis into one row per candidate move.
 
+    Args:
+        line: A line of `info move ... visits ... pv ...` entries.
+        turn: The number of moves played before the analyzed position.
+        extra_fields: Whether to keep the fields that aren't in
+            `ANALYSIS_SCHEMA` too, e.g. `utility`, as floats where they parse.
 
-def maybe_to_float(s: str) -> Union[float, str]:
-    """Converts a string to a float if possible."""
+    Returns:
+        Rows with the fields of `ANALYSIS_SCHEMA` other than `game`. Fields
+        missing from the analysis are `None`.
+    """
+    rows = []
+    for info in line.split("info ")[1:]:
+        fields = info.split()
+        row: AnalysisRow = {"turn": turn, "move": None, "pvLength": None}
+        row.update(dict.fromkeys(_INT_FIELDS + _FLOAT_FIELDS))
+        i = 0
+        while i < len(fields):
+            key = fields[i]
+            if key == "pv":
+                # The PV runs until the next field, e.g. `pvVisits`, if any.
+                end = i + 1
+                while end < len(fields) and _VERTEX.fullmatch(fields[end]):
+                    end += 1
+                row["pvLength"] = end - i - 1
+                break
+            if i + 1 == len(fields):
+                break
+            if key == "move":
+                row["move"] = fields[i + 1]
+            elif key in _INT_FIELDS:
+                row[key] = int(fields[i + 1])
+            elif key in _FLOAT_FIELDS:
+                row[key] = float(fields[i + 1])
+            elif extra_fields:
+                row[key] = _parse_number(fields[i + 1])
+            i += 2
+        rows.append(row)
+    return rows
+
+
+def _parse_number(value: str) -> Union[float, str]:
     try:
-        return float(s)
+        return float(value)
     except ValueError:
-        return s
+        return value
+
+
+def analysis_table(game_idx: Optional[int], rows: Sequence[AnalysisRow]) -> pa.Table:
+    """Return the rows of `parse_analysis` for game `game_idx` as a table."""
+    return pa.Table.from_pylist(
+        [{"game": game_idx, **row} for row in rows],
+        schema=ANALYSIS_SCHEMA,
+    )
+
+
+def write_analyses(path: Path, tables: Iterable[pa.Table]) -> None:
+    """Durably write `tables` to a Parquet file, each as its own row group.
+
+    The file is written under a temporary name and then renamed, so `path` is
+    either missing or complete even if the process dies while writing.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        with pq.ParquetWriter(f, ANALYSIS_SCHEMA) as writer:
+            for table in tables:
+                writer.write_table(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def compact_analyses(
+    paths: Sequence[Path],
+    path: Path,
+    keep_games: Optional[Collection[int]] = None,
+) -> None:
+    """Merge the files `paths` written by `write_analyses` into one, `path`.
+
+    The row groups are copied in order, and then the other files are deleted.
+    A game whose rows are in an earlier file is skipped in later ones, so
+    merging again after a crash between the write and the deletions adds no
+    duplicates, as long as the merged file comes first.
+
+    Args:
+        paths: The files to merge; `path` may be one of them.
+        path: The merged file, written like `write_analyses` does.
+        keep_games: If given, the rows of other games are dropped.
+    """
+
+    def tables() -> Iterator[pa.Table]:
+        earlier: Set[int] = set()
+        for source in paths:
+            games = set()
+            with pq.ParquetFile(source) as parquet:
+                for i in range(parquet.num_row_groups):
+                    table = parquet.read_row_group(i)
+                    if not len(table):
+                        continue
+                    game = table["game"][0].as_py()
+                    if game in earlier or (
+                        keep_games is not None and game not in keep_games
+                    ):
+                        continue
+                    games.add(game)
+                    yield table
+            earlier |= games
+
+    write_analyses(path, tables())
+    for source in paths:
+        if source != path:
+            source.unlink()
+
+
+def load_analysis(
+    path: Union[Path, str],
+    *,
+    columns: Optional[Sequence[str]] = None,
+    games: Optional[Iterable[int]] = None,
+    turns: Optional[Iterable[int]] = None,
+) -> pd.DataFrame:
+    """Load stored KataGo analyses into a DataFrame.
+
+    The filters are pushed down into the Parquet reader, so row groups of
+    other games are skipped using their statistics rather than read.
+
+    Args:
+        path: A Parquet file written by `write_analyses`, or a directory to
+            search for them, e.g. the `analyses` directory of a run. The
+            newline-delimited text files of older runs can be loaded too,
+            see `_text_analysis_table`.
+        columns: The columns to load, by default all of them.
+        games: If given, only load the rows of these games.
+        turns: If given, only load the rows of these turns.
+
+    Returns:
+        One row per candidate move of each analyzed position.
+    """
+    path = Path(path)
+    if path.is_file() and path.suffix != ".parquet":
+        dataset = ds.dataset(_text_analysis_table(path))
+    else:
+        files = sorted(path.rglob("*.parquet")) if path.is_dir() else [path]
+        dataset = ds.dataset(
+            [str(file) for file in files],
+            schema=ANALYSIS_SCHEMA,
+            format="parquet",
+        )
+
+    expression = None
+    for name, values in (("game", games), ("turn", turns)):
+        if values is not None:
+            condition = ds.field(name).isin(list(values))
+            expression = condition if expression is None else expression & condition
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+def _text_analysis_table(path: Path) -> pa.Table:
+    """Load a text file of analyses written by older runs, one line per analysis.
+
+    These files don't record the game, and they skip the victim's moves that
+    KataGo returned without an analysis, so the number of moves played before
+    each analysis is unknown. `game` and `turn` are null, and the extra
+    `analysis_index` column counts the analyses in the file instead. Every
+    other field KataGo printed, e.g. `utility` or `scoreMean`, is kept as an
+    extra column after those of `ANALYSIS_SCHEMA`.
+    """
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    rows = [
+        {**row, "analysis_index": i}
+        for i, line in enumerate(lines)
+        for row in parse_analysis(line, None, extra_fields=True)
+    ]
+    table = analysis_table(None, rows).append_column(
+        pa.field("analysis_index", pa.int32()),
+        pa.array([row["analysis_index"] for row in rows], pa.int32()),
+    )
+    extras = dict.fromkeys(key for row in rows for key in row)
+    for name in extras:
+        if name not in table.schema.names:
+            table = table.append_column(name, pa.array([row.get(name) for row in rows]))
+    return table
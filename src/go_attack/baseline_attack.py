@@ -1,11 +1,24 @@
 """Functions for running baseline attacks against KataGo."""
 
-import itertools
+import asyncio
+import atexit
+import contextlib
 import random
-import re
 from pathlib import Path
-from subprocess import PIPE, Popen
-from typing import IO, AnyStr, Literal, Optional, Sequence, Tuple, cast
+from subprocess import PIPE, Popen, TimeoutExpired
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 from tqdm import tqdm
 
@@ -16,7 +29,18 @@ from go_attack.adversarial_policy import (
     NonmyopicWhiteBoxPolicy,
     PassingWrapper,
 )
+from go_attack.analysis import (
+    AnalysisRow,
+    analysis_table,
+    parse_analysis,
+    write_analyses,
+)
+from go_attack.game_log import SgfLocation, SgfsGames, SgfsWriter, load_game
 from go_attack.go import Color, Game, Move
+from go_attack.gtp import AsyncGTPEngine, GTPClient, GTPError, PendingResponse
+from go_attack.journal import GameJournal, game_result
+from go_attack.katago_analysis import AsyncAnalysisEngine, best_move, move_query
+from go_attack.nn_cache import NNEvalCache
 from go_attack.utils import select_best_gpu
 
 ENGINE_TYPES = (
@@ -25,6 +49,16 @@ ENGINE_TYPES = (
     "katago",
 )
 
+OUTPUT_FORMATS = (
+    "sgf",
+    "sgfs",
+)
+
+VICTIM_BACKENDS = (
+    "gtp",
+    "analysis",
+)
+
 PASSING_BEHAVIOR = (
     "standard",
     "avoid-pass-alive-territory",
@@ -35,12 +69,7 @@ PASSING_BEHAVIOR = (
 )
 
 
-def send_msg(to_engine: IO[AnyStr], msg: str) -> None:
-    """Sends message `msg` to game engine `to_engine`."""
-    to_engine.write(f"{msg}\n".encode("ascii"))
-
-
-def start_engine(
+def _spawn_engine(
     executable_path: Path,
     engine_type: str,
     config_path: Optional[Path] = None,
@@ -49,8 +78,8 @@ def start_engine(
     passing_behavior: Optional[str] = None,
     gpu: Optional[int] = None,
     verbose: bool = False,
-) -> Tuple[IO[bytes], IO[bytes]]:
-    """Starts the engine, returning a tuple with the engines stdin and stdout."""
+) -> Popen:
+    """Starts the engine, returning the process; see `start_engine`."""
     katago_required_args = {
         "config_path": config_path,
         "model_path": model_path,
@@ -104,10 +133,313 @@ def start_engine(
         stdin=PIPE,
         stdout=PIPE,
     )
-    to_engine = proc.stdin
-    from_engine = proc.stdout
-    assert to_engine is not None and from_engine is not None
-    return to_engine, from_engine
+    assert proc.stdin is not None and proc.stdout is not None
+    return proc
+
+
+def _analysis_engine_args(
+    executable_path: Path,
+    config_path: Optional[Path],
+    model_path: Optional[Path],
+    gpu: Optional[int],
+    num_parallel_queries: int,
+) -> Tuple[List[str], Dict[str, str]]:
+    """Return the command line and environment for `katago analysis`."""
+    if config_path is None or model_path is None:
+        raise ValueError("config_path and model_path must not be None")
+    if gpu is None:
+        gpu = select_best_gpu(10)
+
+    # Search every game in parallel so that their NN evaluations get batched.
+    num_threads = max(1, min(num_parallel_queries, 64))
+    args = [
+        str(executable_path),
+        "analysis",
+        "-model",
+        str(model_path),
+        "-config",
+        str(config_path),
+        "-override-config",
+        f"numAnalysisThreads={num_threads},numSearchThreadsPerAnalysisThread=1",
+    ]
+    return args, {"CUDA_VISIBLE_DEVICES": str(gpu)}
+
+
+def start_engine(
+    executable_path: Path,
+    engine_type: str,
+    config_path: Optional[Path] = None,
+    model_path: Optional[Path] = None,
+    num_visits: Optional[int] = None,
+    passing_behavior: Optional[str] = None,
+    gpu: Optional[int] = None,
+    verbose: bool = False,
+) -> Tuple[IO[bytes], IO[bytes]]:
+    """Starts the engine, returning a tuple with the engines stdin and stdout."""
+    proc = _spawn_engine(
+        executable_path,
+        engine_type,
+        config_path,
+        model_path,
+        num_visits,
+        passing_behavior,
+        gpu,
+        verbose,
+    )
+    return proc.stdin, proc.stdout
+
+
+class EngineError(Exception):
+    """Raised when a GTP engine has crashed or doesn't respond as expected."""
+
+
+# Everything that determines how an engine process is started.
+EngineKey = Tuple[
+    Path,
+    str,
+    Optional[Path],
+    Optional[Path],
+    Optional[int],
+    Optional[str],
+    Optional[int],
+]
+
+
+class Engine:
+    """A running GTP engine process, as leased out by `EnginePool`."""
+
+    def __init__(self, key: EngineKey, verbose: bool = False):
+        """Start an engine with the `start_engine` arguments in `key`."""
+        self.key = key
+        self.proc = _spawn_engine(*key, verbose=verbose)
+        self.gtp = GTPClient(self.proc.stdin, self.proc.stdout)
+
+    @property
+    def to_engine(self) -> IO[bytes]:
+        """The engine's stdin."""
+        return self.proc.stdin
+
+    @property
+    def from_engine(self) -> IO[bytes]:
+        """The engine's stdout."""
+        return self.proc.stdout
+
+    def is_alive(self) -> bool:
+        """Return `True` iff the engine process hasn't exited."""
+        return self.proc.poll() is None
+
+    def command(self, msg: str, timeout: Optional[float] = None) -> str:
+        """Send the GTP command `msg` and return its response.
+
+        Responses to earlier commands that were left unread, e.g. by a
+        previous user of the engine, are read and discarded first.
+
+        Args:
+            msg: The command to send, without an id.
+            timeout: Maximum number of seconds to wait for each line of output.
+
+        Returns:
+            The response text after the `=<id>` prefix, with whitespace stripped.
+
+        Raises:
+            EngineError: If the engine exits, doesn't respond within `timeout`,
+                or responds with an error.
+        """
+        return self._wait(self.gtp.send(msg), timeout)
+
+    def _wait(self, response: PendingResponse, timeout: Optional[float]) -> str:
+        """Return the text of `response`, translating errors to `EngineError`."""
+        try:
+            return response.result(timeout)
+        except (BrokenPipeError, ValueError) as e:
+            raise EngineError(f"Engine is not running: {e}") from e
+        except EOFError as e:
+            raise EngineError(f"Engine exited with code {self.proc.poll()}") from e
+        except (GTPError, TimeoutError) as e:
+            raise EngineError(str(e)) from e
+
+    def reset(
+        self,
+        board_size: int,
+        komi: float,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Clear the board and set the board size and komi.
+
+        Since this waits for the engine to respond, it doubles as a health
+        check: it raises `EngineError` if the engine is not responsive.
+
+        Args:
+            board_size: The board size to set.
+            komi: The komi to set.
+            timeout: Maximum number of seconds to wait for each line of output.
+        """
+        responses = [
+            self.gtp.send(f"boardsize {board_size}"),
+            self.gtp.send(f"komi {komi}"),
+            self.gtp.send("clear_board"),
+        ]
+        for response in responses:
+            self._wait(response, timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Ask the engine to quit, and kill it if it doesn't exit in time."""
+        if self.is_alive():
+            try:
+                self.gtp.send("quit")
+                self.gtp.flush()
+                self.to_engine.close()
+            except (BrokenPipeError, ValueError):
+                pass
+            try:
+                self.proc.wait(timeout)
+            except TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+        self.from_engine.close()
+
+
+class EnginePool:
+    """Keeps GTP engines warm so they can be reused by several runs.
+
+    Starting KataGo means loading the model and initializing the GPU backend,
+    which can take longer than a short baseline run. Engines are keyed by the
+    arguments they were started with and are reset between leases, so runs
+    with the same executable, model, config and overrides share processes.
+
+    Before an idle engine is leased out again it is reset, which also serves
+    as a health check. Engines that crashed or stopped responding are killed
+    and replaced by fresh ones.
+    """
+
+    def __init__(self, max_idle: int = 4, health_check_timeout: float = 60.0):
+        """Create an empty pool.
+
+        Args:
+            max_idle: Maximum number of idle engines to keep running. When more
+                engines are returned, the least recently used ones are closed.
+            health_check_timeout: Seconds to wait for each response when
+                resetting an idle engine before declaring it unresponsive.
+                Freshly started engines may take arbitrarily long to load.
+        """
+        self.max_idle = max_idle
+        self.health_check_timeout = health_check_timeout
+        # Idle engines, from least to most recently returned.
+        self._idle: List[Engine] = []
+
+    def __enter__(self) -> "EnginePool":
+        """Return the pool; it is closed when the `with` block exits."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close all idle engines."""
+        self.close()
+
+    @contextlib.contextmanager
+    def lease(
+        self,
+        executable_path: Path,
+        engine_type: str,
+        config_path: Optional[Path] = None,
+        model_path: Optional[Path] = None,
+        num_visits: Optional[int] = None,
+        passing_behavior: Optional[str] = None,
+        gpu: Optional[int] = None,
+        *,
+        board_size: int,
+        komi: float,
+        verbose: bool = False,
+    ) -> Iterator[Engine]:
+        """Lease an engine started with the given `start_engine` arguments.
+
+        The engine's board is cleared and set to `board_size` and `komi` before
+        it's handed out. It goes back to the pool when the `with` block exits
+        normally, and is closed if the block raises, since its state is then
+        unknown.
+
+        Args:
+            executable_path: See `start_engine`.
+            engine_type: See `start_engine`.
+            config_path: See `start_engine`.
+            model_path: See `start_engine`.
+            num_visits: See `start_engine`.
+            passing_behavior: See `start_engine`.
+            gpu: See `start_engine`.
+            board_size: The board size to set up.
+            komi: The komi to set up.
+            verbose: Whether to print when engines are started or restarted.
+
+        Yields:
+            A reset engine, for exclusive use within the `with` block.
+        """
+        key: EngineKey = (
+            executable_path,
+            engine_type,
+            config_path,
+            model_path,
+            num_visits,
+            passing_behavior,
+            gpu,
+        )
+        engine = self._acquire(key, board_size, komi, verbose)
+        try:
+            yield engine
+        except BaseException:
+            engine.close()
+            raise
+
+        if not engine.is_alive():
+            engine.close()
+            return
+        self._idle.append(engine)
+        while len(self._idle) > self.max_idle:
+            self._idle.pop(0).close()
+
+    def close(self) -> None:
+        """Close all idle engines."""
+        while self._idle:
+            self._idle.pop().close()
+
+    def _acquire(
+        self,
+        key: EngineKey,
+        board_size: int,
+        komi: float,
+        verbose: bool,
+    ) -> Engine:
+        """Return a healthy engine for `key`, reusing an idle one if possible."""
+        for i in reversed(range(len(self._idle))):
+            if self._idle[i].key != key:
+                continue
+
+            engine = self._idle.pop(i)
+            try:
+                engine.reset(board_size, komi, self.health_check_timeout)
+                return engine
+            except EngineError as e:
+                print(f"Warning: Restarting unhealthy engine: {e}")
+                engine.close(timeout=0)
+
+        engine = Engine(key, verbose)
+        try:
+            engine.reset(board_size, komi)
+        except BaseException:
+            engine.close(timeout=0)
+            raise
+        return engine
+
+
+_default_engine_pool: Optional[EnginePool] = None
+
+
+def default_engine_pool() -> EnginePool:
+    """Return an `EnginePool` shared by all runs in the current process."""
+    global _default_engine_pool
+    if _default_engine_pool is None:
+        _default_engine_pool = EnginePool()
+        atexit.register(_default_engine_pool.close)
+    return _default_engine_pool
 
 
 def make_log_dir(
@@ -136,85 +468,89 @@ def make_log_dir(
     return log_dir
 
 
+def _run_config(
+    adversarial_policy: str,
+    model_path: Optional[Path],
+    num_visits: Optional[int],
+    passing_behavior: Optional[str],
+    victim_color_str: Literal["B", "W"],
+    **settings: Any,
+) -> Dict[str, Any]:
+    """Return the settings that a run's journal records, see `GameJournal`.
+
+    They include everything that changes how games are played or stored,
+    but not the seed, first game or number of games, since runs that only
+    differ in those share a journal.
+    """
+    return dict(
+        adversarial_policy=adversarial_policy,
+        model_path=str(model_path) if model_path is not None else None,
+        num_visits=num_visits,
+        passing_behavior=passing_behavior,
+        victim_color=victim_color_str,
+        **settings,
+    )
+
+
 def rollout_policy(
     game: Game,
     policy: AdversarialPolicy,
     victim_color: Color,
     engine_type: str,
-    from_engine: IO[AnyStr],
-    to_engine: IO[AnyStr],
+    gtp: GTPClient,
     log_analysis: bool,
     verbose: bool,
-) -> Tuple[Game, Sequence[str]]:
-    """Rollouts `policy` against engine with pipe `from_engine`."""
-    # Regex that matches the "=" printed after a successful command that has no
-    # output.
-    SUCCESS_REGEX = re.compile(r"^=")
-    LEELA_SHOWBOARD_END_REGEX = re.compile(r"^Black time:")
-    from_engine_lines = map(lambda line: line.decode("ascii").strip(), from_engine)
+) -> Tuple[Game, Sequence[AnalysisRow]]:
+    """Rollouts `policy` against the engine behind `gtp`.
+
+    Each adversary move is pipelined with the victim's `genmove`, so a turn
+    takes a single round trip to the engine.
+    """
 
     def maybe_print(msg):
         if verbose:
             print(msg)
 
     def print_engine_board():
-        send_msg(to_engine, "showboard")
-        # The different engines have different showboard formats.
-        predicates = {
-            "elf": lambda _, msg: not SUCCESS_REGEX.fullmatch(msg),
-            "leela": lambda _, msg: not LEELA_SHOWBOARD_END_REGEX.match(msg),
-            "katago": lambda index, _: index < game.board_size + 3,
-        }
-        for _, msg in itertools.takewhile(
-            lambda tup: predicates[engine_type](*tup),
-            enumerate(from_engine_lines),
-        ):
-            print(msg)
-
-    def get_msg(pattern: re.Pattern) -> re.Match:
-        while True:
-            msg = next(from_engine_lines)
-            if hit := pattern.fullmatch(msg):
-                return hit
+        # Some engines print the board as part of the response, and others
+        # just before it.
+        response = gtp.send("showboard")
+        text = response.result()
+        print("\n".join([*response.preamble, text]))
 
     def take_turn():
         move = policy.next_move()
         game.play_move(move)
 
         vertex = str(move) if move else "pass"
-        send_msg(to_engine, f"play {victim_color.opponent()} {vertex}")
+        # Sent along with the next command; `result` raises if it failed.
+        played.append(gtp.send(f"play {victim_color.opponent()} {vertex}"))
         maybe_print("Passing" if move is None else f"Playing {vertex}")
 
-        get_msg(SUCCESS_REGEX)
+    played: List[PendingResponse] = []
 
     # Play first iff we're black
     if victim_color.opponent() == Color.BLACK:
         take_turn()
 
-    analyses = []  # Only used when --analysis-log-dir is set
+    analyses: List[AnalysisRow] = []  # Only used when log_analysis is set
     turn = 1
     while not game.is_over():
         if log_analysis:
             # Ask for the analysis as well as the move
-            send_msg(to_engine, f"kata-genmove_analyze {victim_color}")
-            analysis_regex = re.compile(r"info.*|play pass")
-
-            # For some reason pytype thinks this is `bytes` but it's definitely `str`;
-            # see https://docs.python.org/3/library/re.html?highlight=re#re.Match.group
-            analysis = cast(str, get_msg(analysis_regex).group(0))
-
-            # Weird special case where the engine returns "play pass"
-            # and no actual analysis
-            if analysis == "play pass":
-                victim_move = "pass"
-            else:
-                analyses.append(analysis)
-                analysis_move_regex = re.compile(r"play ([A-Z][0-9]{1,2}|pass)")
-                victim_move = get_msg(analysis_move_regex).group(1)
+            lines = gtp.command(f"kata-genmove_analyze {victim_color}").splitlines()
+            # The engine doesn't print any analysis when it passes right away.
+            analysis = next((line for line in lines if line.startswith("info")), None)
+            if analysis is not None:
+                analyses.extend(parse_analysis(analysis, len(game.moves)))
+            play_line = next(line for line in lines if line.startswith("play "))
+            victim_move = play_line.split()[1]
         else:
-            send_msg(to_engine, f"genmove {victim_color}")
-            move_regex = re.compile(r"= ([A-Z][0-9]{1,2}|pass)", re.IGNORECASE)
-            victim_move = get_msg(move_regex).group(1)
+            victim_move = gtp.command(f"genmove {victim_color}")
+
+        for response in played:
+            response.result()
+        played.clear()
 
         maybe_print(f"\nTurn {turn}")
         maybe_print(f"{engine_type} played: {victim_move}")
@@ -227,6 +563,9 @@ def rollout_policy(
 
         turn += 1
 
+    for response in played:
+        response.result()
+
     # ELF automatically resets the game when the game is over, so printing the
     # board for ELF would just give a blank new board.
     if verbose and engine_type != "elf":
@@ -242,11 +581,183 @@ def rollout_policy(
     else:
         maybe_print("Tie")
 
-    send_msg(to_engine, "clear_board")
+    gtp.send("clear_board")
+    gtp.flush()
 
     return game, analyses
 
 
+async def rollout_policy_async(
+    game: Game,
+    policy: AdversarialPolicy,
+    victim_color: Color,
+    engine: AsyncGTPEngine,
+    log_analysis: bool = False,
+    verbose: bool = False,
+) -> Tuple[Game, Sequence[AnalysisRow]]:
+    """Rollouts `policy` against `engine`, like `rollout_policy` but with asyncio.
+
+    The engine's board is set up from `game` before the rollout and cleared
+    afterwards, so an engine can be reused for any number of rollouts. Policies
+    that query the engine themselves, i.e. the white-box policies, are not
+    supported, since they read from the engine's pipes synchronously.
+
+    Args:
+        game: The game to play, usually empty.
+        policy: The adversarial policy.
+        victim_color: The color played by the engine.
+        engine: The victim engine.
+        log_analysis: Whether to collect KataGo's analysis of each victim move.
+        verbose: Whether to print every move.
+
+    Returns:
+        The finished game, and the rows of `parse_analysis` for every victim
+        move if `log_analysis` is set.
+
+    Raises:
+        ValueError: If the policy is a white-box policy.
+    """
+    inner = policy.inner if isinstance(policy, PassingWrapper) else policy
+    if isinstance(inner, (MyopicWhiteBoxPolicy, NonmyopicWhiteBoxPolicy)):
+        raise ValueError("White-box policies are not supported in async rollouts")
+
+    def maybe_print(msg):
+        if verbose:
+            print(msg)
+
+    async def take_turn():
+        move = policy.next_move()
+        game.play_move(move)
+
+        vertex = str(move) if move else "pass"
+        maybe_print("Passing" if move is None else f"Playing {vertex}")
+        await engine.command(f"play {victim_color.opponent()} {vertex}")
+
+    await engine.command(f"boardsize {game.board_size}")
+    await engine.command(f"komi {game.komi}")
+    await engine.command("clear_board")
+    for move_idx, move in enumerate(game.moves):
+        color = Color.BLACK if move_idx % 2 == 0 else Color.WHITE
+        await engine.command(f"play {color} {str(move) if move else 'pass'}")
+
+    # Play first iff it's our turn
+    if game.current_player() != victim_color and not game.is_over():
+        await take_turn()
+
+    analyses: List[AnalysisRow] = []  # Only used when log_analysis is set
+    turn = 1
+    while not game.is_over():
+        if log_analysis:
+            # Ask for the analysis as well as the move
+            lines = await engine.command(f"kata-genmove_analyze {victim_color}")
+            lines = lines.splitlines()
+            analysis = next((line for line in lines if line.startswith("info")), None)
+            if analysis is not None:
+                analyses.extend(parse_analysis(analysis, len(game.moves)))
+            play_line = next(line for line in lines if line.startswith("play "))
+            victim_move = play_line.split()[1]
+        else:
+            victim_move = await engine.command(f"genmove {victim_color}")
+
+        maybe_print(f"\nTurn {turn}")
+        maybe_print(f"Victim played: {victim_move}")
+        game.play_move(Move.from_str(victim_move))
+
+        if game.is_over():
+            break
+
+        await take_turn()
+
+        turn += 1
+
+    await engine.command("clear_board")
+    return game, analyses
+
+
+async def rollout_policy_analysis(
+    game: Game,
+    policy: AdversarialPolicy,
+    victim_color: Color,
+    engine: AsyncAnalysisEngine,
+    max_visits: Optional[int] = None,
+    verbose: bool = False,
+) -> Game:
+    """Rollouts `policy` against KataGo's analysis engine.
+
+    The victim plays the move KataGo ranks first for each position. Since the
+    analysis engine is stateless, any number of these rollouts can share one
+    engine concurrently, and their positions are evaluated in batches.
+
+    Args:
+        game: The game to play, usually empty.
+        policy: The adversarial policy. White-box policies are not supported.
+        victim_color: The color played by KataGo.
+        engine: The analysis engine.
+        max_visits: Maximum number of visits per victim move.
+        verbose: Whether to print every move.
+
+    Returns:
+        The finished game.
+    """
+    while not game.is_over():
+        if game.current_player() == victim_color:
+            query = move_query(game, max_visits=max_visits)
+            move = best_move(await engine.query(query))
+            who = "Victim"
+        else:
+            move = policy.next_move()
+            who = "Adversary"
+
+        if verbose:
+            print(f"{who} played: {str(move) if move else 'pass'}")
+        game.play_move(move)
+
+    return game
+
+
+async def rollout_policies_async(
+    rollouts: Sequence[Tuple[Game, AdversarialPolicy]],
+    victim_color: Color,
+    engines: Sequence[AsyncGTPEngine],
+    log_analysis: bool = False,
+    verbose: bool = False,
+) -> List[Tuple[Game, Sequence[AnalysisRow]]]:
+    """Run many rollouts concurrently, sharing a set of victim engines.
+
+    Each engine plays one game at a time; whenever it finishes a game, it
+    picks up the next rollout that hasn't started yet.
+
+    Args:
+        rollouts: (game, policy) pairs, as for `rollout_policy_async`.
+        victim_color: The color played by the engines.
+        engines: The victim engines.
+        log_analysis: See `rollout_policy_async`.
+        verbose: See `rollout_policy_async`.
+
+    Returns:
+        The results of `rollout_policy_async` for each rollout, in order.
+    """
+    idle_engines: asyncio.Queue = asyncio.Queue()
+    for engine in engines:
+        idle_engines.put_nowait(engine)
+
+    async def rollout(game: Game, policy: AdversarialPolicy):
+        engine = await idle_engines.get()
+        try:
+            return await rollout_policy_async(
+                game,
+                policy,
+                victim_color,
+                engine,
+                log_analysis,
+                verbose,
+            )
+        finally:
+            idle_engines.put_nowait(engine)
+
+    return list(await asyncio.gather(*(rollout(*args) for args in rollouts)))
+
+
 def run_baseline_attack(
     adversarial_policy: str,
     model_path: Optional[Path] = None,
@@ -258,25 +769,128 @@ def run_baseline_attack(
     allow_suicide: bool = False,
     board_size: int = 19,
     config_path: Path,
+    engine_pool: Optional[EnginePool] = None,
     engine_type: str,
     executable_path: Path,
+    first_game: int = 0,
     komi: float = 6.5,
     log_analysis: bool = False,
     log_root: Optional[Path] = None,
     moves_before_pass: int = 211,
+    nn_cache: Optional[NNEvalCache] = None,
     num_games: int = 1,
+    output_format: str = "sgf",
     progress_bar: bool = True,
     seed: int = 42,
+    use_nn_cache: bool = False,
     verbose: bool = False,
+    victim_backend: str = "gtp",
 ) -> Sequence[Game]:
-    """Run a baseline attack."""
+    """Run a baseline attack.
+
+    If `engine_pool` is given, the victim engine is leased from it and handed
+    back afterwards, so later runs with the same engine settings can reuse the
+    process. Otherwise a fresh engine is started and shut down at the end.
+
+    When `log_root` is set, games are saved to a log directory in it: each to
+    its own SGF file with `output_format="sgf"`, or all appended to one
+    `.sgfs` file with `output_format="sgfs"`. In the latter mode, games are
+    released from memory once written, and the returned sequence loads them
+    back on access. With `log_analysis`, the parsed analyses are written to
+    Parquet files in the `analyses` subdirectory, see `load_analysis`.
+
+    Every finished game is recorded in a journal in the log directory.
+    Rerunning an interrupted run with the same arguments skips the games the
+    journal lists and loads them from their SGFs instead. A run whose settings
+    differ from those the journal records, other than `seed`, `first_game` and
+    `num_games`, raises a `ValueError` rather than mix its games in.
+
+    The games are numbered from `first_game`, which names their log files.
+    With the GTP backend, each game seeds the RNG from `seed` and its number,
+    so a run can be split into several runs with different `first_game`s and
+    still play the same games.
+
+    The white-box policies look up KataGo's raw NN outputs in `nn_cache` if
+    it's given, or in a fresh cache shared by the games of this run with
+    `use_nn_cache`. The cache is approximate, see `go_attack.nn_cache`, so by
+    default every position is evaluated by the engine. What a game finds in
+    the cache depends on the games played before it in the same cache, so with
+    a cache, neither a split run nor a resumed run is guaranteed to play the
+    same games as a single uninterrupted run.
+
+    With `victim_backend="analysis"`, KataGo runs as a JSON analysis engine
+    instead, and all `num_games` games are played concurrently against it so
+    that the victim's positions are evaluated in batches. The victim then plays
+    KataGo's top-ranked move, `passing_behavior` has no effect, and neither
+    analysis logging nor white-box policies are supported.
+    """
     if adversarial_policy not in POLICIES:
         raise ValueError(
             f"Invalid policy '{adversarial_policy}', must be one of {POLICIES}",
         )
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Invalid format '{output_format}', must be one of {OUTPUT_FORMATS}",
+        )
+    if output_format == "sgfs" and log_root is None:
+        raise ValueError("output_format='sgfs' requires log_root")
+    if victim_backend not in VICTIM_BACKENDS:
+        raise ValueError(
+            f"Invalid backend '{victim_backend}', must be one of {VICTIM_BACKENDS}",
+        )
+
+    if victim_backend == "analysis":
+        if engine_type != "katago":
+            raise ValueError("The analysis backend requires engine_type='katago'")
+        if log_analysis:
+            raise ValueError("log_analysis is not supported by the analysis backend")
+        if POLICIES[adversarial_policy] in (
+            MyopicWhiteBoxPolicy,
+            NonmyopicWhiteBoxPolicy,
+        ):
+            raise ValueError("White-box policies need the gtp backend")
+
+        async def play() -> Sequence[Game]:
+            args, env = _analysis_engine_args(
+                executable_path,
+                config_path,
+                model_path,
+                gpu,
+                num_games,
+            )
+            if verbose:
+                print(f"Starting analysis engine with args: {args}")
+            with open("/tmp/go-baseline-attack.stderr", "w") as stderr:
+                engine = await AsyncAnalysisEngine.start(args, env, stderr)
+            async with engine:
+                return await _play_games_analysis(
+                    engine,
+                    adversarial_policy,
+                    model_path,
+                    num_visits,
+                    passing_behavior,
+                    victim_color_str,
+                    allow_suicide=allow_suicide,
+                    board_size=board_size,
+                    first_game=first_game,
+                    komi=komi,
+                    log_root=log_root,
+                    moves_before_pass=moves_before_pass,
+                    num_games=num_games,
+                    output_format=output_format,
+                    progress_bar=progress_bar,
+                    seed=seed,
+                    verbose=verbose,
+                )
+
+        return asyncio.run(play())
+
+    if use_nn_cache and nn_cache is None:
+        nn_cache = NNEvalCache()
 
-    # Start up the executable.
-    to_engine, from_engine = start_engine(
+    # Start up the executable, or reuse a running one.
+    pool = engine_pool if engine_pool is not None else EnginePool()
+    lease = pool.lease(
         executable_path,
         engine_type,
         config_path,
@@ -284,9 +898,63 @@ def run_baseline_attack(
         num_visits,
         passing_behavior,
         gpu,
-        verbose,
+        board_size=board_size,
+        komi=komi,
+        verbose=verbose,
     )
+    try:
+        with lease as engine:
+            return _play_games(
+                engine,
+                adversarial_policy,
+                model_path,
+                num_visits,
+                passing_behavior,
+                victim_color_str,
+                allow_suicide=allow_suicide,
+                board_size=board_size,
+                engine_type=engine_type,
+                first_game=first_game,
+                komi=komi,
+                log_analysis=log_analysis,
+                log_root=log_root,
+                moves_before_pass=moves_before_pass,
+                nn_cache=nn_cache,
+                num_games=num_games,
+                output_format=output_format,
+                progress_bar=progress_bar,
+                seed=seed,
+                verbose=verbose,
+            )
+    finally:
+        if engine_pool is None:
+            pool.close()
 
+
+def _play_games(
+    engine: Engine,
+    adversarial_policy: str,
+    model_path: Optional[Path],
+    num_visits: Optional[int],
+    passing_behavior: Optional[str],
+    victim_color_str: Literal["B", "W"],
+    *,
+    allow_suicide: bool,
+    board_size: int,
+    engine_type: str,
+    first_game: int,
+    komi: float,
+    log_analysis: bool,
+    log_root: Optional[Path],
+    moves_before_pass: int,
+    nn_cache: Optional[NNEvalCache],
+    num_games: int,
+    output_format: str,
+    progress_bar: bool,
+    seed: int,
+    verbose: bool,
+) -> Sequence[Game]:
+    """Play the games of `run_baseline_attack` against a reset `engine`."""
     log_dir = None
     if log_root is not None:
         log_dir = make_log_dir(
@@ -304,8 +972,8 @@ def run_baseline_attack(
                 game,
                 victim_color.opponent(),
                 allow_suicide,
-                to_engine,
-                from_engine,
+                engine.gtp,
+                nn_cache,
             )  # pytype: disable=not-instantiable,wrong-arg-count
         else:
             policy = policy_cls(
@@ -315,21 +983,44 @@ def run_baseline_attack(
             )  # pytype: disable=not-instantiable
         return PassingWrapper(policy, moves_before_pass)
 
-    send_msg(to_engine, f"boardsize {board_size}")
-    send_msg(to_engine, f"komi {komi}")
-
-    random.seed(seed)
     policy_cls = POLICIES[adversarial_policy]
     victim_color = Color.from_str(victim_color_str)
+    game_log = _GameLog(
+        log_dir,
+        adversarial_policy=adversarial_policy,
+        config=_run_config(
+            adversarial_policy,
+            model_path,
+            num_visits,
+            passing_behavior,
+            victim_color_str,
+            allow_suicide=allow_suicide,
+            board_size=board_size,
+            engine_type=engine_type,
+            komi=komi,
+            log_analysis=log_analysis,
+            moves_before_pass=moves_before_pass,
+            output_format=output_format,
+            victim_backend="gtp",
+        ),
+        first_game=first_game,
+        log_analysis=log_analysis,
+        output_format=output_format,
+        seed=seed,
+        victim_color_str=victim_color_str,
+    )
 
-    game_iter = range(num_games)
+    game_iter = range(first_game, first_game + num_games)
     if not verbose and progress_bar:
         game_iter = tqdm(game_iter, desc="Playing", unit="games")
 
-    games = []
     for i in game_iter:
+        if game_log.load_finished(i):
+            continue
         if verbose:
-            print(f"\n--- Game {i + 1} of {num_games} ---")
+            print(f"\n--- Game {i + 1} of {first_game + num_games} ---")
+
+        random.seed(f"{seed}/{i}")
 
         game = Game(board_size=board_size, komi=komi)
         policy = make_policy()
@@ -338,40 +1029,258 @@ def run_baseline_attack(
             policy,
             victim_color,
             engine_type,
-            from_engine,
-            to_engine,
+            engine.gtp,
             log_analysis,
             verbose,
         )
-        games.append(game)
-
-        # Save the game to disk if necessary
-        if log_dir:
-            adv_name = f"adv-baseline-{adversarial_policy}"
-            victim_name = "victim"
-            sgf = game.to_sgf(
-                comment=(
-                    f"{adversarial_policy.capitalize()} attack; "
-                    f"{'Black' if victim_color_str == 'B' else 'White'} victim"
-                ),
-                black_name=(victim_name if victim_color_str == "B" else adv_name),
-                white_name=(victim_name if victim_color_str == "W" else adv_name),
+        game_log.save(i, game, analyses)
+
+    if nn_cache is not None and policy_cls in (
+        MyopicWhiteBoxPolicy,
+        NonmyopicWhiteBoxPolicy,
+    ):
+        print(f"NN cache hit rate: {nn_cache.hit_rate:.1%}")
+    return game_log.close()
+
+
+async def _play_games_analysis(
+    engine: AsyncAnalysisEngine,
+    adversarial_policy: str,
+    model_path: Optional[Path],
+    num_visits: Optional[int],
+    passing_behavior: Optional[str],
+    victim_color_str: Literal["B", "W"],
+    *,
+    allow_suicide: bool,
+    board_size: int,
+    first_game: int,
+    komi: float,
+    log_root: Optional[Path],
+    moves_before_pass: int,
+    num_games: int,
+    output_format: str,
+    progress_bar: bool,
+    seed: int,
+    verbose: bool,
+) -> Sequence[Game]:
+    """Play all the games of `run_baseline_attack` concurrently on `engine`."""
+    log_dir = None
+    if log_root is not None:
+        log_dir = make_log_dir(
+            log_root,
+            adversarial_policy,
+            model_path,
+            num_visits,
+            passing_behavior,
+            victim_color_str,
+        )
+
+    # The games draw from the RNG in whatever order the engine answers, so only
+    # the run as a whole can be seeded.
+    random.seed(f"{seed}/{first_game}")
+    policy_cls = POLICIES[adversarial_policy]
+    victim_color = Color.from_str(victim_color_str)
+    progress = tqdm(
+        total=num_games,
+        desc="Playing",
+        unit="games",
+        disable=verbose or not progress_bar,
+    )
+
+    game_log = _GameLog(
+        log_dir,
+        adversarial_policy=adversarial_policy,
+        config=_run_config(
+            adversarial_policy,
+            model_path,
+            num_visits,
+            passing_behavior,
+            victim_color_str,
+            allow_suicide=allow_suicide,
+            board_size=board_size,
+            engine_type="katago",
+            komi=komi,
+            log_analysis=False,
+            moves_before_pass=moves_before_pass,
+            output_format=output_format,
+            victim_backend="analysis",
+        ),
+        first_game=first_game,
+        log_analysis=False,
+        output_format=output_format,
+        seed=seed,
+        victim_color_str=victim_color_str,
+    )
+
+    async def play(i: int) -> None:
+        if game_log.load_finished(i):
+            progress.update()
+            return
+
+        game = Game(board_size=board_size, komi=komi)
+        policy = policy_cls(
+            game,
+            victim_color.opponent(),
+            allow_suicide,
+        )  # pytype: disable=not-instantiable
+        await rollout_policy_analysis(
+            game,
+            PassingWrapper(policy, moves_before_pass),
+            victim_color,
+            engine,
+            max_visits=num_visits,
+            verbose=verbose,
+        )
+        game_log.save(i, game, [])
+        progress.update()
+
+    game_nums = range(first_game, first_game + num_games)
+    await asyncio.gather(*(play(i) for i in game_nums))
+    progress.close()
+
+    return game_log.close()
+
+
+class _GameLog:
+    """Saves the games of a run, records them in its journal, and tracks them.
+
+    With `output_format="sgf"`, every game is written to its own SGF file and
+    kept in memory. With `"sgfs"`, games are streamed to an `.sgfs` file and
+    released from memory, and they are loaded back lazily when accessed.
+    """
+
+    def __init__(
+        self,
+        log_dir: Optional[Path],
+        *,
+        adversarial_policy: str,
+        config: Dict[str, Any],
+        first_game: int,
+        log_analysis: bool,
+        output_format: str,
+        seed: int,
+        victim_color_str: Literal["B", "W"],
+    ):
+        """Open the run's journal and output files in `log_dir`, if it's set.
+
+        The journal must have been written with the same `config`, see
+        `_run_config`.
+        """
+        self.log_dir = log_dir
+        self.adversarial_policy = adversarial_policy
+        self.log_analysis = log_analysis
+        self.seed = seed
+        self.victim_color_str = victim_color_str
+
+        self.journal = GameJournal(log_dir, config) if log_dir else None
+        self.finished = self.journal.completed(seed) if self.journal else {}
+        self.writer = None
+        if output_format == "sgfs":
+            assert log_dir is not None and self.journal is not None
+            sgfs_path = log_dir / f"games_{first_game}.sgfs"
+            # Games and analyses written before a crash but never journaled
+            # are played again, so drop them rather than store them twice.
+            self.writer = SgfsWriter(
+                sgfs_path,
+                log_dir / "analyses" if log_analysis else None,
+                keep_until=self.journal.recorded_end(sgfs_path),
+                keep_games=self.journal.recorded_games(sgfs_path),
+                on_flush=self.journal.sync,
             )
 
-            with open(log_dir / f"game_{i}.sgf", "w") as f:
-                f.write(sgf)
+        self._kept: Dict[int, Union[Game, SgfLocation]] = {}
+        self._margins: List[float] = []
+
+    def load_finished(self, game_idx: int) -> bool:
+        """Load game `game_idx` if the journal lists it; return whether it did."""
+        location = self.finished.get(game_idx)
+        if location is None:
+            return False
+
+        game = load_game(location)
+        self._keep(game_idx, game, location)
+        return True
+
+    def save(
+        self,
+        game_idx: int,
+        game: Game,
+        analyses: Sequence[AnalysisRow],
+    ) -> None:
+        """Save game `game_idx` and its analyses, if logging is enabled."""
+        if self.log_dir is None:
+            self._keep(game_idx, game, None)
+            return
+
+        adv_name = f"adv-baseline-{self.adversarial_policy}"
+        victim_name = "victim"
+        sgf = game.to_sgf(
+            comment=(
+                f"{self.adversarial_policy.capitalize()} attack; "
+                f"{'Black' if self.victim_color_str == 'B' else 'White'} victim"
+            ),
+            black_name=(victim_name if self.victim_color_str == "B" else adv_name),
+            white_name=(victim_name if self.victim_color_str == "W" else adv_name),
+        )
+        table = analysis_table(game_idx, analyses) if self.log_analysis else None
+
+        if self.writer is not None:
+            result = game_result(game)
+
+            def record():
+                assert self.journal is not None
+                self.journal.record(
+                    self.seed,
+                    game_idx,
+                    result,
+                    location,
+                    sync=False,
+                )
+
+            # Newlines only separate the header from the moves in our SGFs.
+            sgf = sgf.replace("\n", "")
+            location = self.writer.write(game_idx, sgf, table, on_durable=record)
+            self._keep(game_idx, game, location)
+            return
+
+        location = SgfLocation(self.log_dir / f"game_{game_idx}.sgf")
+        with open(location.path, "w") as f:
+            f.write(sgf)
 
         # Save the analysis file if needed
-        if log_analysis:
-            assert log_dir is not None
-            analysis_log_dir = log_dir / "analyses"
+        if table is not None:
+            analysis_log_dir = self.log_dir / "analyses"
             analysis_log_dir.mkdir(exist_ok=True, parents=True)
-            with open(analysis_log_dir / f"game_{i}.txt", "w") as f:
-                f.write("\n\n".join(analyses))
-    send_msg(to_engine, "quit")
+            write_analyses(analysis_log_dir / f"game_{game_idx}.parquet", [table])
 
-    scores = [game.score() for game in games]
-    margins = [black - white for black, white in scores]
-    print(f"\nAverage win margin: {sum(margins) / len(margins)}")
+        assert self.journal is not None
+        self.journal.record(self.seed, game_idx, game_result(game), location)
+        self._keep(game_idx, game, location)
 
-    return games
+    def close(self) -> Sequence[Game]:
+        """Flush the output files, print the average margin and return the games."""
+        if self.writer is not None:
+            self.writer.close()
+
+        if self._margins:
+            print(f"\nAverage win margin: {sum(self._margins) / len(self._margins)}")
+        else:
+            print("\nNo games")
+        kept = [self._kept[game_idx] for game_idx in sorted(self._kept)]
+        if self.writer is not None:
+            return SgfsGames(cast(List[SgfLocation], kept))
+        return cast(List[Game], kept)
+
+    def _keep(
+        self,
+        game_idx: int,
+        game: Game,
+        location: Optional[SgfLocation],
+    ) -> None:
+        black, white = game.score()
+        self._margins.append(black - white)
+        if self.writer is not None:
+            assert location is not None
+            self._kept[game_idx] = location
+        else:
+            self._kept[game_idx] = game
@@ -0,0 +1,238 @@
+"""Many Go games played in lockstep on a single NumPy array."""
+
+from array import array
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.ndimage import label
+
+from go_attack.chains import neighbor_values, zobrist_keys
+from go_attack.go import Color, Game, IllegalMoveError, Move, tromp_taylor_scores
+
+# Connects orthogonal neighbours within a board, but never across boards.
+_BOARDWISE_CROSS = np.zeros((3, 3, 3), dtype=bool)
+_BOARDWISE_CROSS[1] = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+
+
+def _label_chains(boards: np.ndarray, colors: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Label the chains of `colors[i]` on each `boards[i]`, from 1 upwards."""
+    return label(boards == colors[:, None, None], structure=_BOARDWISE_CROSS)
+
+
+def _first_occurrences(neighbor_chains: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Keep each chain only in the first direction where `mask` selects it.
+
+    Args:
+        neighbor_chains: Chain labels of the four neighbours of every point, as
+            returned by `neighbor_values`.
+        mask: A mask of the same shape selecting neighbours.
+
+    Returns:
+        `mask`, minus every neighbour whose chain was already selected in an
+        earlier direction at the same point.
+    """
+    first = mask.copy()
+    for direction in range(1, 4):
+        for earlier in range(direction):
+            same_chain = neighbor_chains[earlier] == neighbor_chains[direction]
+            first[direction] &= ~(mask[earlier] & same_chain)
+    return first
+
+
+class GameBatch:
+    """A batch of Go games under Tromp-Taylor rules, stored as one array.
+
+    `boards` has shape (num_games, board_size, board_size) and uses the same
+    orientation and color values as `Game.board_states`. Every call to
+    `play_moves` advances every unfinished game by one turn, so the games may
+    have different players to move only if they started out that way.
+
+    Positional superko is enforced by comparing 64-bit Zobrist hashes of the
+    positions, without confirming hash hits against full boards.
+    """
+
+    def __init__(
+        self,
+        num_games: int,
+        board_size: int,
+        komi: float = Game.DEFAULT_KOMI,
+    ):
+        """Create `num_games` empty games of size `board_size`."""
+        self.board_size = board_size
+        self.komi = komi
+        self.boards = np.zeros((num_games, board_size, board_size), dtype=np.uint8)
+        self.moves: List[List[Optional[Move]]] = [[] for _ in range(num_games)]
+
+        self._keys = zobrist_keys(board_size)
+        self._hashes = np.zeros(num_games, dtype=np.uint64)
+        self._history = [array("Q", [0]) for _ in range(num_games)]
+
+    def __len__(self) -> int:
+        """Return the number of games in the batch."""
+        return len(self.boards)
+
+    def current_players(self) -> np.ndarray:
+        """Return the color value of the player to move in each game."""
+        num_moves = np.array([len(moves) for moves in self.moves])
+        return np.where(num_moves % 2 == 0, Color.BLACK.value, Color.WHITE.value)
+
+    def is_over(self) -> np.ndarray:
+        """Return a mask of the games that ended with two consecutive passes."""
+        return np.array(
+            [len(moves) >= 2 and moves[-2:] == [None, None] for moves in self.moves],
+            dtype=bool,
+        )
+
+    def legal_move_masks(self, *, allow_suicide: bool = True) -> np.ndarray:
+        """Return a mask of the legal moves for the player to move in each game.
+
+        Liberties of every chain, and the hash that every candidate move would
+        produce, are computed for the whole batch with vectorized operations.
+
+        Args:
+            allow_suicide: Whether suicide moves are considered legal.
+
+        Returns:
+            A uint8 array of shape (num_games, board_size, board_size).
+        """
+        boards, keys = self.boards, self._keys
+        num_games, size = len(boards), self.board_size
+        players = self.current_players()
+        opponents = Color.BLACK.value + Color.WHITE.value - players
+
+        # Label the chains of both colors with disjoint labels.
+        own_labels, num_own = _label_chains(boards, players)
+        opponent_labels, num_opponent = _label_chains(boards, opponents)
+        opponent_labels[opponent_labels > 0] += num_own
+        chains = own_labels + opponent_labels
+        num_chains = num_own + num_opponent
+
+        # Each empty point is a liberty of every distinct chain next to it.
+        empty = boards == Color.EMPTY.value
+        neighbor_chains = neighbor_values(chains, fill=0)
+        distinct = _first_occurrences(neighbor_chains, neighbor_chains > 0) & empty
+        chain_libs = np.bincount(neighbor_chains[distinct], minlength=num_chains + 1)
+        chain_libs[0] = 0
+
+        # XOR of the Zobrist keys of each chain's stones.
+        stones = np.flatnonzero(chains)
+        stone_keys = keys[boards.ravel()[stones], stones % (size * size)]
+        chain_hashes = np.zeros(num_chains + 1, dtype=np.uint64)
+        np.bitwise_xor.at(chain_hashes, chains.ravel()[stones], stone_keys)
+
+        # Off-board neighbours get a value that matches no color.
+        neighbor_colors = neighbor_values(boards, fill=len(Color))
+        neighbor_libs = chain_libs[neighbor_chains]
+        own = neighbor_colors == players[:, None, None]
+        in_atari = (neighbor_colors == opponents[:, None, None]) & (neighbor_libs == 1)
+
+        captures = empty & np.any(in_atari, axis=0)
+        has_empty = np.any(neighbor_colors == Color.EMPTY.value, axis=0)
+        safe_connection = np.any(own & (neighbor_libs > 1), axis=0)
+        quiet = empty & ~captures & (has_empty | safe_connection)
+        suicide = empty & ~captures & ~quiet
+
+        # Hash of the position each move would lead to. A move removes the
+        # opponent chains it puts out of liberties or, for suicide, its own
+        # chains along with the new stone.
+        player_keys = keys[players].reshape(num_games, size, size)
+        next_hashes = self._hashes[:, None, None] ^ np.where(suicide, 0, player_keys)
+        removed = _first_occurrences(neighbor_chains, in_atari | (own & suicide))
+        removed_hashes = np.where(removed, chain_hashes[neighbor_chains], 0)
+        next_hashes ^= np.bitwise_xor.reduce(removed_hashes, axis=0)
+
+        masks = quiet | captures
+        if allow_suicide:
+            masks |= suicide
+
+        # Rule 6. A move can't repeat an earlier grid coloring.
+        for game_idx, history in enumerate(self._history):
+            seen = np.sort(np.frombuffer(history, dtype=np.uint64))
+            candidates = next_hashes[game_idx][masks[game_idx]]
+            idx = np.searchsorted(seen, candidates).clip(max=len(seen) - 1)
+            masks[game_idx][masks[game_idx]] = seen[idx] != candidates
+
+        return masks.astype(np.uint8)
+
+    def play_moves(
+        self,
+        moves: Sequence[Optional[Move]],
+        *,
+        check_legal: bool = True,
+    ) -> None:
+        """Play one move in every game; `None` means pass.
+
+        Games that are already over are left untouched and their entry in
+        `moves` is ignored.
+
+        Args:
+            moves: One move per game.
+            check_legal: Whether to raise on illegal moves.
+
+        Raises:
+            IllegalMoveError: If `check_legal` is set and a move is illegal, or
+                if a move is out of bounds.
+            ValueError: If the number of moves doesn't match the batch size.
+        """
+        if len(moves) != len(self):
+            raise ValueError(f"Expected {len(self)} moves, got {len(moves)}")
+
+        active = ~self.is_over()
+        playing = [i for i, move in enumerate(moves) if active[i] and move is not None]
+        size = self.board_size
+        xs = np.array([moves[i].x for i in playing], dtype=int)
+        ys = np.array([moves[i].y for i in playing], dtype=int)
+        if np.any((xs < 0) | (xs >= size) | (ys < 0) | (ys >= size)):
+            raise IllegalMoveError("Move out of bounds")
+        rows, cols = size - 1 - ys, xs
+
+        if check_legal and playing:
+            masks = self.legal_move_masks()
+            illegal = masks[playing, rows, cols] == 0
+            if np.any(illegal):
+                game_idx = playing[int(np.argmax(illegal))]
+                raise IllegalMoveError(
+                    f"Illegal move {moves[game_idx]} in game {game_idx}",
+                )
+
+        if playing:
+            players = self.current_players()[playing]
+            boards = self.boards[playing]
+            boards[np.arange(len(playing)), rows, cols] = players
+            # Rule 4. Clear the opponent color, and then one's own color.
+            opponents = Color.BLACK.value + Color.WHITE.value - players
+            self._clear_colors(boards, opponents)
+            self._clear_colors(boards, players)
+            self.boards[playing] = boards
+
+            flat = self.boards[playing].reshape(len(playing), -1)
+            point_keys = self._keys[flat, np.arange(flat.shape[1])]
+            self._hashes[playing] = np.bitwise_xor.reduce(point_keys, axis=1)
+
+        for game_idx in np.flatnonzero(active):
+            move = moves[game_idx]
+            self.moves[game_idx].append(move)
+            self._history[game_idx].append(int(self._hashes[game_idx]))
+
+    def score(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the Tromp-Taylor (black, white) scores of every game."""
+        return tromp_taylor_scores(self.boards, self.komi)
+
+    def game(self, game_idx: int) -> Game:
+        """Replay game `game_idx` into a standalone `Game`."""
+        game = Game(board_size=self.board_size, komi=self.komi)
+        for move in self.moves[game_idx]:
+            game.play_move(move, check_legal=False)
+        return game
+
+    @staticmethod
+    def _clear_colors(boards: np.ndarray, colors: np.ndarray) -> None:
+        """Clear the chains of `colors[i]` on `boards[i]` that don't reach empty."""
+        chains, num_chains = _label_chains(boards, colors)
+        empty_neighbor = np.any(
+            neighbor_values(boards, fill=len(Color)) == Color.EMPTY.value,
+            axis=0,
+        )
+        alive = np.bincount(chains[empty_neighbor], minlength=num_chains + 1) > 0
+        alive[0] = True  # Label 0 is every point that isn't one of the chains
+        boards[~alive[chains]] = Color.EMPTY.value
@@ -1,7 +1,7 @@
 """Math functions for manipulating Go vertices."""
 
-import re
-from typing import IO
+import itertools
+from typing import Dict, Union
 
 import numpy as np
 
@@ -53,12 +53,49 @@ def mirror_move(move: Move, board_size: int = 19) -> Move:
     return Move(mirror_x, mirror_y)
 
 
-def parse_array(gtp_stream: IO[bytes], array_name: str, size: int) -> np.ndarray:
-    """Parse an array from a GTP stream.
+def parse_raw_nn(response: str, size: int) -> Dict[str, Union[float, np.ndarray]]:
+    """Parse all the outputs in KataGo's response to `kata-raw-nn`.
+
+    The response is a sequence of scalar lines like `whiteWin 0.62` and of
+    arrays, each a line with just the array name followed by `size` rows of
+    numbers, with `NAN` for illegal moves. Each array is converted with one
+    vectorized call rather than float by float.
+
+    Args:
+        response: The text of KataGo's response to `kata-raw-nn`.
+        size: The size of the board.
+
+    Returns:
+        A dict from output name, e.g. `whiteWin`, `policy` or `whiteOwnership`,
+        to a float for scalars or a `size` x `size` array for arrays.
+
+    Raises:
+        ValueError: If an array doesn't have `size` rows of `size` numbers.
+    """
+    outputs: Dict[str, Union[float, np.ndarray]] = {}
+    lines = iter(response.splitlines())
+    for line in lines:
+        name, _, value = line.strip().partition(" ")
+        if not name:
+            continue
+        if value:
+            outputs[name] = float(value)
+            continue
+
+        rows = itertools.islice(lines, size)
+        array = np.array(" ".join(rows).split(), dtype=np.float64)
+        if array.size != size * size:
+            raise ValueError(f"Expected {size}x{size} values for '{name}'")
+        outputs[name] = array.reshape(size, size)
+
+    return outputs
+
+
+def parse_array(response: str, array_name: str, size: int) -> np.ndarray:
+    """Parse one array from KataGo's response to `kata-raw-nn`.
 
     Args:
-        gtp_stream: A GTP stream from KataGo, which is assumed to have just
-            received the command `kata-raw-nn`.
+        response: The text of KataGo's response to `kata-raw-nn`.
         array_name: The header indicating the array to parse. Examples
             include `policy` and `whiteOwnership`.
         size: The size of the board.
@@ -66,19 +103,6 @@ def parse_array(gtp_stream: IO[bytes], array_name: str, size: int) -> np.ndarray
     Returns:
         The array in NumPy format.
     """
-    array = []
-    numeric_regex = re.compile(rf"((-?[0-9.]+|NAN)\s*){{{size}}}")
-    skip = True
-    while True:
-        msg = gtp_stream.readline().decode("ascii").strip()
-        if msg == array_name:
-            skip = False
-        elif not skip:
-            hit = numeric_regex.fullmatch(msg)
-            if hit:
-                row = [float(x.strip()) for x in hit[0].split()]
-                array.append(row)
-            else:
-                break
-
-    return np.array(array)
+    array = parse_raw_nn(response, size)[array_name]
+    assert isinstance(array, np.ndarray)
+    return array
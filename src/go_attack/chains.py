@@ -0,0 +1,339 @@
+"""Incremental tracking of chains and liberties on a Go board.
+
+`ChainBoard` keeps a union-find forest over the stones on the board together
+with the set of liberties of each chain. Playing a stone only touches its four
+neighbours and the chains they belong to, so legality checks and captures cost
+time proportional to the size of the affected chains rather than the board.
+
+Points are addressed by their flat index into the board in NumPy (row-major)
+order, and colors are represented by the integer values of `go.Color`.
+
+Each `ChainBoard` also maintains the Zobrist hash of its position, which lets
+callers detect repeated positions without comparing whole boards.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+EMPTY, BLACK, WHITE = 0, 1, 2
+
+# Fixed seed so that hashes are reproducible across processes.
+ZOBRIST_SEED = 0x60A77AC4
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(board_size: int) -> np.ndarray:
+    """Return the Zobrist keys for a board of size `board_size`.
+
+    Args:
+        board_size: The size of the board.
+
+    Returns:
+        A read-only uint64 array of shape (3, board_size ** 2) indexed by
+        (color, point). Empty points have a key of zero, so the hash of a
+        position is the XOR of the keys of its stones.
+    """
+    rng = np.random.default_rng([ZOBRIST_SEED, board_size])
+    keys = rng.integers(
+        0,
+        np.iinfo(np.uint64).max,
+        size=(3, board_size * board_size),
+        dtype=np.uint64,
+        endpoint=True,
+    )
+    keys[EMPTY] = 0
+    keys.flags.writeable = False
+    return keys
+
+
+@lru_cache(maxsize=None)
+def _zobrist_key_lists(board_size: int) -> List[List[int]]:
+    """Return `zobrist_keys` as nested lists of Python ints for fast indexing."""
+    return zobrist_keys(board_size).tolist()
+
+
+def board_hash(board: np.ndarray) -> int:
+    """Return the Zobrist hash of a (board_size, board_size) NumPy array."""
+    keys = zobrist_keys(board.shape[0])
+    flat = board.ravel()
+    return int(np.bitwise_xor.reduce(keys[flat, np.arange(flat.size)]))
+
+
+@lru_cache(maxsize=None)
+def neighbor_table(board_size: int) -> Tuple[Tuple[int, ...], ...]:
+    """Return the flat indices of the orthogonal neighbours of every point."""
+    table = []
+    for row in range(board_size):
+        for col in range(board_size):
+            neighbors = []
+            if row > 0:
+                neighbors.append((row - 1) * board_size + col)
+            if row < board_size - 1:
+                neighbors.append((row + 1) * board_size + col)
+            if col > 0:
+                neighbors.append(row * board_size + col - 1)
+            if col < board_size - 1:
+                neighbors.append(row * board_size + col + 1)
+            table.append(tuple(neighbors))
+
+    return tuple(table)
+
+
+def neighbor_values(array: np.ndarray, fill: int) -> np.ndarray:
+    """Return the values of the orthogonal neighbours of every point.
+
+    Args:
+        array: An array whose last two axes index board rows and columns.
+        fill: The value to use for neighbours that lie off the board.
+
+    Returns:
+        An array of shape (4, *array.shape) whose entries along the first axis
+        hold the values of the up, down, left and right neighbours respectively.
+    """
+    neighbors = np.full((4, *array.shape), fill, dtype=array.dtype)
+    neighbors[0, ..., 1:, :] = array[..., :-1, :]
+    neighbors[1, ..., :-1, :] = array[..., 1:, :]
+    neighbors[2, ..., :, 1:] = array[..., :, :-1]
+    neighbors[3, ..., :, :-1] = array[..., :, 1:]
+    return neighbors
+
+
+class ChainBoard:
+    """A Go board that maintains chains and their liberties incrementally.
+
+    Moves follow the Tromp-Taylor rules: after placing a stone, opponent chains
+    without liberties are removed, and then the mover's own chain is removed if
+    it has no liberties left (suicide).
+    """
+
+    def __init__(self, board_size: int):
+        """Create an empty board of size `board_size` x `board_size`."""
+        num_points = board_size * board_size
+        self.board_size = board_size
+        self.colors: List[int] = [EMPTY] * num_points
+        # Zobrist hash of the current position.
+        self.hash = 0
+
+        self._neighbors = neighbor_table(board_size)
+        self._keys = _zobrist_key_lists(board_size)
+        # Union-find parent pointers; a stone is the head of its chain iff it
+        # is its own parent. Empty points are always their own parent.
+        self._parent = list(range(num_points))
+        # Stones and liberties of each chain, keyed by the head of the chain.
+        self._stones: Dict[int, List[int]] = {}
+        self._liberties: Dict[int, Set[int]] = {}
+
+    @classmethod
+    def from_array(cls, board: np.ndarray) -> "ChainBoard":
+        """Build a `ChainBoard` from a (board_size, board_size) NumPy array."""
+        board_size = board.shape[0]
+        chains = cls(board_size)
+        chains.colors = [int(c) for c in board.ravel()]
+        chains.hash = board_hash(board)
+
+        colors, neighbors = chains.colors, chains._neighbors
+        stones = [point for point, color in enumerate(colors) if color != EMPTY]
+        for point in stones:
+            chains._stones[point] = [point]
+            chains._liberties[point] = set()
+
+        for point in stones:
+            for neighbor in neighbors[point]:
+                if neighbor < point and colors[neighbor] == colors[point]:
+                    chains._union(chains.find(point), chains.find(neighbor))
+
+        for point in stones:
+            libs = chains._liberties[chains.find(point)]
+            libs.update(n for n in neighbors[point] if colors[n] == EMPTY)
+
+        return chains
+
+    def to_array(self) -> np.ndarray:
+        """Return the board as a (board_size, board_size) uint8 NumPy array."""
+        board = np.array(self.colors, dtype=np.uint8)
+        return board.reshape(self.board_size, self.board_size)
+
+    def liberty_counts(self) -> np.ndarray:
+        """Return the liberty count of each stone's chain, or 0 for empty points.
+
+        Returns:
+            An int array of shape (board_size, board_size).
+        """
+        counts = [0] * len(self.colors)
+        for head, stones in self._stones.items():
+            num_libs = len(self._liberties[head])
+            for stone in stones:
+                counts[stone] = num_libs
+
+        counts = np.array(counts, dtype=np.int32)
+        return counts.reshape(self.board_size, self.board_size)
+
+    def find(self, point: int) -> int:
+        """Return the head of the chain containing the stone at `point`."""
+        parent = self._parent
+        while parent[point] != point:
+            # Path halving keeps the trees shallow without recursion.
+            parent[point] = parent[parent[point]]
+            point = parent[point]
+        return point
+
+    def stones(self, point: int) -> List[int]:
+        """Return the stones in the chain containing the stone at `point`."""
+        return self._stones[self.find(point)]
+
+    def liberties(self, point: int) -> Set[int]:
+        """Return the liberties of the chain containing the stone at `point`."""
+        return self._liberties[self.find(point)]
+
+    def removed_by(self, point: int, color: int) -> List[int]:
+        """Return the points that would be emptied if `color` played at `point`.
+
+        This does not modify the board. If the move captures, the result holds
+        the captured opponent stones. If the move is suicide, the result holds
+        `point` itself along with the mover's stones that would be removed.
+        Otherwise the result is empty.
+
+        Args:
+            point: Flat index of an empty point.
+            color: The color of the stone being played.
+
+        Returns:
+            The flat indices of the stones removed by the move.
+        """
+        colors, opponent = self.colors, BLACK + WHITE - color
+        captured: List[int] = []
+        own_heads = []
+        has_liberty = False
+        seen = set()
+
+        for neighbor in self._neighbors[point]:
+            neighbor_color = colors[neighbor]
+            if neighbor_color == EMPTY:
+                has_liberty = True
+                continue
+
+            head = self.find(neighbor)
+            if head in seen:
+                continue
+            seen.add(head)
+
+            libs = self._liberties[head]
+            if neighbor_color == opponent:
+                if len(libs) == 1 and point in libs:
+                    captured.extend(self._stones[head])
+            else:
+                own_heads.append(head)
+                if len(libs) > 1:
+                    has_liberty = True
+
+        if captured or has_liberty:
+            return captured
+
+        # Suicide: the new stone and every chain it joins are removed.
+        suicided = [point]
+        for head in own_heads:
+            suicided.extend(self._stones[head])
+        return suicided
+
+    def hash_after(self, point: int, color: int, removed: List[int]) -> int:
+        """Return the hash of the position after `color` plays at `point`.
+
+        Args:
+            point: Flat index of an empty point.
+            color: The color of the stone being played.
+            removed: The result of `removed_by(point, color)`.
+
+        Returns:
+            The Zobrist hash of the resulting position.
+        """
+        keys = self._keys
+        new_hash = self.hash ^ keys[color][point]
+        if removed:
+            # All removed stones share a color: the opponent's for captures,
+            # the mover's for suicide.
+            removed_color = color if point in removed else BLACK + WHITE - color
+            removed_keys = keys[removed_color]
+            for stone in removed:
+                new_hash ^= removed_keys[stone]
+        return new_hash
+
+    def is_suicide(self, point: int, color: int) -> bool:
+        """Return `True` iff `color` playing at the empty `point` is suicide."""
+        return point in self.removed_by(point, color)
+
+    def play(self, point: int, color: int) -> List[int]:
+        """Place a stone of `color` at the empty `point` and resolve captures.
+
+        Args:
+            point: Flat index of an empty point.
+            color: The color of the stone being played.
+
+        Returns:
+            The flat indices of the stones removed by the move, with the same
+            meaning as in `removed_by`.
+        """
+        colors, neighbors = self.colors, self._neighbors
+        opponent = BLACK + WHITE - color
+        colors[point] = color
+        self.hash ^= self._keys[color][point]
+        self._parent[point] = point
+        self._stones[point] = [point]
+        self._liberties[point] = {n for n in neighbors[point] if colors[n] == EMPTY}
+
+        head = point
+        opponent_heads = set()
+        for neighbor in neighbors[point]:
+            neighbor_color = colors[neighbor]
+            if neighbor_color == color:
+                head = self._union(head, self.find(neighbor))
+            elif neighbor_color == opponent:
+                neighbor_head = self.find(neighbor)
+                self._liberties[neighbor_head].discard(point)
+                opponent_heads.add(neighbor_head)
+        self._liberties[head].discard(point)
+
+        removed: List[int] = []
+        for opponent_head in opponent_heads:
+            if not self._liberties[opponent_head]:
+                removed.extend(self._remove_chain(opponent_head))
+
+        if not self._liberties[head]:
+            removed.extend(self._remove_chain(head))
+
+        return removed
+
+    def _union(self, head_a: int, head_b: int) -> int:
+        """Merge two chains given their heads, returning the new head."""
+        if head_a == head_b:
+            return head_a
+
+        # Union by size: attach the smaller chain below the larger one.
+        if len(self._stones[head_a]) < len(self._stones[head_b]):
+            head_a, head_b = head_b, head_a
+
+        self._parent[head_b] = head_a
+        self._stones[head_a].extend(self._stones.pop(head_b))
+        self._liberties[head_a] |= self._liberties.pop(head_b)
+        return head_a
+
+    def _remove_chain(self, head: int) -> List[int]:
+        """Remove the chain with head `head` from the board."""
+        colors, neighbors, parent = self.colors, self._neighbors, self._parent
+        stones = self._stones.pop(head)
+        del self._liberties[head]
+
+        keys = self._keys[colors[head]]
+        for stone in stones:
+            self.hash ^= keys[stone]
+            colors[stone] = EMPTY
+            parent[stone] = stone
+
+        # The removed stones become liberties of the chains around them.
+        for stone in stones:
+            for neighbor in neighbors[stone]:
+                if colors[neighbor] != EMPTY:
+                    self._liberties[self.find(neighbor)].add(stone)
+
+        return stones
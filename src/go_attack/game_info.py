@@ -1,13 +1,35 @@
 """Module to extract game information from SGF files."""
 
+import collections
 import dataclasses
+import hashlib
+import itertools
 import os
 import pathlib
 import re
-from typing import Any, Mapping, Optional, Sequence
-
+import tempfile
+from concurrent import futures
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import tqdm.auto as tqdm
-from sgfmill import sgf
+from sgfmill import sgf, sgf_grammar, sgf_properties
+
+from go_attack.sgf_parsing import has_variations, split_values
 
 
 def find_sgf_files(root: pathlib.Path) -> Sequence[pathlib.Path]:
@@ -119,8 +141,126 @@ class AdversarialGameInfo(GameInfo):
         return self.adv_minus_victim_score - self.adv_komi
 
 
+def _text(raw: bytes) -> str:
+    return sgf_grammar.text_value(raw).decode()
+
+
+def _simpletext(raw: bytes) -> str:
+    return sgf_grammar.simpletext_value(raw).decode()
+
+
+# Value types of the root properties read by `extract_basic_game_info`, with
+# the same interpretation as sgfmill. Other properties are read as SimpleText.
+_ROOT_PROPERTY_TYPES = {
+    "C": _text,
+    "HA": sgf_properties.interpret_number,
+    "KM": sgf_properties.interpret_real,
+    "SZ": sgf_properties.interpret_number,
+}
+
+
+class _ScannedRoot:
+    """Root node of a `_ScannedSgfGame`, mimicking `sgf.Tree_node`."""
+
+    def __init__(self, props: Mapping[str, List[str]]):
+        """Wrap the raw root properties `props`."""
+        self._props = props
+
+    def get(self, identifier: str) -> Any:
+        """Return the interpreted value of a property; raise `KeyError` if absent."""
+        raw = self._props[identifier][0].encode()
+        return _ROOT_PROPERTY_TYPES.get(identifier, _simpletext)(raw)
+
+    def has_setup_stones(self) -> bool:
+        """Check whether the node has any AB/AW/AE properties."""
+        return any(ident in self._props for ident in ("AB", "AW", "AE"))
+
+
+class _ScannedSgfGame:
+    """The parts of `sgf.Sgf_game` used here, read with a single string scan.
+
+    Only the root properties are kept, along with the number of nodes and of
+    passes by each player on the main line.
+    """
+
+    def __init__(self, sgf_str: str):
+        """Scan `sgf_str`, which must not contain variations."""
+        texts, values = split_values(sgf_str)
+        root_props: Dict[str, List[str]] = {}
+        # The first B and W value of each node after the root.
+        b_values: Dict[int, str] = {}
+        w_values: Dict[int, str] = {}
+
+        # Without variations, the text before each value is at most a few node
+        # separators followed by the identifier of the value, or nothing if
+        # the value belongs to the same property as the previous one.
+        node, ident = -1, ""
+        for text, value in zip(texts, values):
+            if text:
+                if ";" in text:
+                    node += text.count(";")
+                    text = text.rsplit(";", 1)[1]
+                ident = text.strip() or ident
+
+            if node == 0:
+                root_props.setdefault(ident, []).append(value)
+            elif ident == "B":
+                b_values.setdefault(node, value)
+            elif ident == "W":
+                w_values.setdefault(node, value)
+        node += texts[-1].count(";")
+
+        self.root = _ScannedRoot(root_props)
+        try:
+            self.size = self.root.get("SZ")
+        except KeyError:
+            self.size = 19
+
+        # Like sgfmill, a B property takes precedence over a W property.
+        pass_values = ("", "tt") if self.size <= 19 else ("",)
+        w_values = {n: v for n, v in w_values.items() if n not in b_values}
+        self.num_moves = node
+        self.num_passes = {
+            "b": sum(value in pass_values for value in b_values.values()),
+            "w": sum(value in pass_values for value in w_values.values()),
+        }
+
+    def get_root(self) -> _ScannedRoot:
+        """Return the root node."""
+        return self.root
+
+    def get_size(self) -> int:
+        """Return the board size as an integer."""
+        return self.size
+
+    def get_komi(self) -> float:
+        """Return the komi, or 0.0 if the KM property isn't present."""
+        try:
+            return self.root.get("KM")
+        except KeyError:
+            return 0.0
+
+    def get_player_name(self, colour: str) -> Optional[str]:
+        """Return the name of the player of `colour`, or `None`."""
+        try:
+            return self.root.get({"b": "PB", "w": "PW"}[colour])
+        except KeyError:
+            return None
+
+    def get_winner(self) -> Optional[str]:
+        """Return the colour of the winning player, or `None`."""
+        try:
+            colour = self.root.get("RE")[0].lower()
+        except LookupError:
+            return None
+        return colour if colour in ("b", "w") else None
+
+
+SgfGameLike = Union[sgf.Sgf_game, _ScannedSgfGame]
+
+
 def comment_prop(
-    sgf_game: sgf.Sgf_game,
+    sgf_game: SgfGameLike,
     prop_name: str,
     default: Optional[str] = None,
 ) -> Optional[str]:
@@ -131,9 +271,18 @@ def comment_prop(
     return comments.split(f"{prop_name}=")[1].split(",")[0]
 
 
-def num_pass(col: str, sgf_game: sgf.Sgf_game) -> int:
+def num_pass(col: str, sgf_game: SgfGameLike) -> int:
     """Number of times `color` passes in `sgf_game`."""
-    return sum(node.get_move == (col, None) for node in sgf_game.get_main_sequence())
+    if isinstance(sgf_game, _ScannedSgfGame):
+        return sgf_game.num_passes[col]
+    return sum(node.get_move() == (col, None) for node in sgf_game.get_main_sequence())
+
+
+def num_moves(sgf_game: SgfGameLike) -> int:
+    """Number of nodes after the root on the main line of `sgf_game`."""
+    if isinstance(sgf_game, _ScannedSgfGame):
+        return sgf_game.num_moves
+    return len(sgf_game.get_main_sequence()) - 1
 
 
 def extract_re(subject: str, pattern: str) -> str:
@@ -143,7 +292,7 @@ def extract_re(subject: str, pattern: str) -> str:
     return match.group(1)
 
 
-def extract_basic_game_info(sgf_str: str, sgf_game: sgf.Sgf_game) -> GameInfo:
+def extract_basic_game_info(sgf_str: str, sgf_game: SgfGameLike) -> GameInfo:
     """Build `GameInfo` from `sgf_str` and `sgf_game`."""
     rule_str = sgf_game.root.get("RU")
 
@@ -163,7 +312,7 @@ def extract_basic_game_info(sgf_str: str, sgf_game: sgf.Sgf_game) -> GameInfo:
         komi=sgf_game.get_komi(),
         handicap=int(sgf_game.root.get("HA")),
         is_continuation=sgf_game.get_root().has_setup_stones(),
-        num_moves=len(sgf_game.get_main_sequence()) - 1,
+        num_moves=num_moves(sgf_game),
         num_b_pass=num_pass("b", sgf_game),
         num_w_pass=num_pass("w", sgf_game),
         sgf_str=sgf_str,
@@ -179,7 +328,7 @@ def extract_basic_game_info(sgf_str: str, sgf_game: sgf.Sgf_game) -> GameInfo:
 
 def extract_adversarial_game_info(
     basic_info: GameInfo,
-    sgf_game: sgf.Sgf_game,
+    sgf_game: SgfGameLike,
 ) -> AdversarialGameInfo:
     """Adds adversarial game info to `basic_info` from `sgf_game`."""
     name_to_color = {basic_info.b_name: "b", basic_info.w_name: "w"}
@@ -219,20 +368,282 @@ def extract_adversarial_game_info(
     )
 
 
-def parse_game_info(sgf_str: str) -> GameInfo:
+def parse_game_info(sgf_str: str, fast: bool = True) -> GameInfo:
     """Parse game information from `sgf_str`.
 
     Args:
         sgf_str: A string describing the game in the SGF format.
+        fast: If set, read the root properties and count moves and passes with
+            a single scan over `sgf_str` instead of building an sgfmill game
+            tree. The result is the same either way. Games with variations
+            always go through sgfmill.
 
     Returns:
         An `AdversarialGameInfo` when one of the players is called `'victim'`;
         otherwise, returns a `GameInfo`.
     """
-    sgf_game = sgf.Sgf_game.from_string(sgf_str)
+    if fast and not has_variations(sgf_str):
+        sgf_game = _ScannedSgfGame(sgf_str)
+    else:
+        sgf_game = sgf.Sgf_game.from_string(sgf_str)
     game_info = extract_basic_game_info(sgf_str, sgf_game)
 
     if "victim" in {game_info.b_name, game_info.w_name}:
         game_info = extract_adversarial_game_info(game_info, sgf_game)
 
     return game_info
+
+
+def game_infos_to_frame(game_infos: Iterable[GameInfo]) -> pd.DataFrame:
+    """Convert `game_infos` to a DataFrame with one row per game."""
+    return pd.DataFrame([game_info.to_dict() for game_info in game_infos])
+
+
+def iter_sgf_shards(
+    paths: Sequence[pathlib.Path],
+    shard_size: int,
+) -> Iterator[Tuple[pathlib.Path, List[str]]]:
+    """Lazily split the games in `paths` into shards of at most `shard_size`.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        shard_size: Maximum number of games per shard.
+
+    Yields:
+        (path, sgf_strs) tuples, where `sgf_strs` are consecutive games from
+        the file at `path`. Files are read line by line, so only the shards
+        that have been requested so far are ever held in memory.
+    """
+    for path in paths:
+        with open(path, "r") as f:
+            lines = (line.strip() for line in f)
+            sgf_strs = (line for line in lines if line)
+            while True:
+                shard = list(itertools.islice(sgf_strs, shard_size))
+                if not shard:
+                    break
+                yield path, shard
+
+
+def _parse_shard(sgf_strs: Sequence[str]) -> List[GameInfo]:
+    """Parse a shard of games; runs in worker processes."""
+    return [parse_game_info(sgf_str) for sgf_str in sgf_strs]
+
+
+def iter_parsed_shards(
+    paths: Sequence[pathlib.Path],
+    *,
+    max_workers: Optional[int] = None,
+    shard_size: int = 1000,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[Tuple[pathlib.Path, List[GameInfo]]]:
+    """Parse the games in `paths` across a pool of processes.
+
+    Shards are read lazily and submitted to a `ProcessPoolExecutor`, with at
+    most `max_in_flight` shards being read or parsed at any time. Results are
+    yielded in input order, so peak memory is bounded by the size of the
+    in-flight shards rather than by the size of the corpus.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        max_workers: Number of worker processes. Defaults to the CPU count.
+            With `max_workers=1`, shards are parsed in the current process.
+        shard_size: Maximum number of games per shard.
+        max_in_flight: Maximum number of shards submitted but not yet yielded.
+            Defaults to twice the number of workers.
+
+    Yields:
+        (path, game_infos) tuples, one per shard, as in `iter_sgf_shards`.
+    """
+    shards = iter_sgf_shards(paths, shard_size)
+    if max_workers == 1:
+        for path, sgf_strs in shards:
+            yield path, _parse_shard(sgf_strs)
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    with futures.ProcessPoolExecutor(max_workers) as executor:
+        pending: Deque[Tuple[pathlib.Path, futures.Future]] = collections.deque()
+        for path, sgf_strs in shards:
+            if len(pending) >= max_in_flight:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+            pending.append((path, executor.submit(_parse_shard, sgf_strs)))
+
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+
+def iter_game_infos(paths: Sequence[pathlib.Path], **kwargs) -> Iterator[GameInfo]:
+    """Parse the games in `paths` in parallel, yielding them in order.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        **kwargs: Passed on to `iter_parsed_shards`.
+
+    Yields:
+        The parsed information of every game.
+    """
+    for _, game_infos in iter_parsed_shards(paths, **kwargs):
+        yield from game_infos
+
+
+def iter_game_info_frames(
+    paths: Sequence[pathlib.Path],
+    chunk_size: int = 100_000,
+    **kwargs,
+) -> Iterator[pd.DataFrame]:
+    """Parse the games in `paths` into DataFrames of at most `chunk_size` rows.
+
+    Use `pd.concat(iter_game_info_frames(paths))` to build a single table
+    without ever holding all the `GameInfo` objects in memory at once.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        chunk_size: Maximum number of rows per DataFrame.
+        **kwargs: Passed on to `iter_parsed_shards`.
+
+    Yields:
+        DataFrames as produced by `game_infos_to_frame`.
+    """
+    game_infos = iter_game_infos(paths, **kwargs)
+    while True:
+        chunk = list(itertools.islice(game_infos, chunk_size))
+        if not chunk:
+            break
+        yield game_infos_to_frame(chunk)
+
+
+# Bump this whenever the fields of `GameInfo` or the parsing logic change, so
+# that stale caches are rebuilt from scratch.
+GAME_INFO_CACHE_VERSION = "3"
+_CACHE_VERSION_KEY = b"go_attack.game_info_cache_version"
+_CACHE_PATH_KEY = b"go_attack.sgf_path"
+_CACHE_SIZE_KEY = b"go_attack.sgf_file_size"
+_CACHE_MTIME_KEY = b"go_attack.sgf_file_mtime_ns"
+
+
+def _shard_path(cache_dir: pathlib.Path, sgf_path: str) -> pathlib.Path:
+    """Return the path of the cache shard of the `.sgfs` file at `sgf_path`."""
+    digest = hashlib.blake2b(sgf_path.encode(), digest_size=16).hexdigest()
+    return cache_dir / f"{pathlib.Path(sgf_path).stem}-{digest}.parquet"
+
+
+def _shard_key(sgf_path: str, stat: os.stat_result) -> Dict[bytes, bytes]:
+    """Return the metadata identifying the version of a file a shard is for."""
+    return {
+        _CACHE_VERSION_KEY: GAME_INFO_CACHE_VERSION.encode(),
+        _CACHE_PATH_KEY: sgf_path.encode(),
+        _CACHE_SIZE_KEY: str(stat.st_size).encode(),
+        _CACHE_MTIME_KEY: str(stat.st_mtime_ns).encode(),
+    }
+
+
+def _read_shard(
+    shard_path: pathlib.Path,
+    key: Mapping[bytes, bytes],
+    columns: Optional[Sequence[str]] = None,
+) -> Optional[pd.DataFrame]:
+    """Read a cache shard, or return `None` if it's missing or stale."""
+    if not shard_path.exists():
+        return None
+    shard = pq.ParquetFile(shard_path)
+    metadata = shard.schema_arrow.metadata or {}
+    if any(metadata.get(name) != value for name, value in key.items()):
+        return None
+    if not shard.metadata.num_rows:
+        return pd.DataFrame()
+    return shard.read(columns=columns).to_pandas()
+
+
+def _write_shard(
+    shard_path: pathlib.Path,
+    rows: pd.DataFrame,
+    key: Mapping[bytes, bytes],
+) -> None:
+    """Atomically replace the cache shard at `shard_path` with `rows`."""
+    table = pa.Table.from_pandas(rows, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **key})
+
+    shard_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=shard_path.parent,
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        tmp_path = pathlib.Path(f.name)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, shard_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def load_game_infos(
+    paths: Sequence[pathlib.Path],
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+    *,
+    columns: Optional[Sequence[str]] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """Load game information from `.sgfs` files, using an on-disk cache.
+
+    The cache is a directory with one Parquet shard per `.sgfs` file, holding
+    one row per game as produced by `GameInfo.to_dict`. The metadata of each
+    shard records the path, size and modification time of its file. Only
+    files without a shard, or whose size or modification time changed, are
+    parsed again, with `iter_parsed_shards`, and only their shards are
+    rewritten. Shards of files outside `paths` are left untouched, so a single
+    cache can be shared between calls over different subsets of a directory.
+
+    Args:
+        paths: Paths to `.sgfs` files, e.g. from `find_sgf_files`.
+        cache_dir: Directory of the cache. If `None`, nothing is cached.
+        columns: If given, only these columns are returned. The other columns
+            (notably `sgf_str`) of up-to-date shards aren't even read.
+        **kwargs: Passed on to `iter_parsed_shards`.
+
+    Returns:
+        A DataFrame with one row per game, ordered by `paths` and then by the
+        position of the game in its file. The `sgf_path` column holds the
+        resolved path of the file each game came from.
+    """
+    resolved = [str(pathlib.Path(path).resolve()) for path in paths]
+    keys = {path: _shard_key(path, os.stat(path)) for path in resolved}
+    cache_dir = pathlib.Path(cache_dir) if cache_dir is not None else None
+    read_columns = None
+    if columns is not None:
+        read_columns = [col for col in columns if col != "sgf_path"]
+
+    frames: Dict[str, pd.DataFrame] = {}
+    if cache_dir is not None:
+        for path in resolved:
+            frame = _read_shard(_shard_path(cache_dir, path), keys[path], read_columns)
+            if frame is not None:
+                frames[path] = frame
+
+    stale_paths = [pathlib.Path(path) for path in resolved if path not in frames]
+    parsed: Dict[str, List[GameInfo]] = {str(path): [] for path in stale_paths}
+    shards = iter_parsed_shards(stale_paths, **kwargs) if stale_paths else ()
+    for path, game_infos in tqdm.tqdm(shards, desc="Parsing SGF files"):
+        parsed[str(path)].extend(game_infos)
+    for path, game_infos in parsed.items():
+        frame = game_infos_to_frame(game_infos)
+        if cache_dir is not None:
+            _write_shard(_shard_path(cache_dir, path), frame, keys[path])
+        if read_columns is not None:
+            # The frame of an empty file has no columns at all.
+            frame = frame.reindex(columns=read_columns)
+        frames[path] = frame
+
+    nonempty = [
+        frames[path].assign(sgf_path=path) for path in resolved if len(frames[path])
+    ]
+    rows = pd.concat(nonempty, ignore_index=True) if nonempty else pd.DataFrame()
+    if columns is not None:
+        rows = rows.reindex(columns=list(columns))
+    return rows
@@ -0,0 +1,223 @@
+"""Streaming storage for the games and analyses of a baseline attack.
+
+Instead of one small file per game, `SgfsWriter` appends every game as one
+line of an `.sgfs` file, as KataGo's selfplay does, and writes the analyses of
+each batch of games to one Parquet file. Writes are buffered and made durable
+together, so a large run does a handful of fsyncs instead of creating millions
+of files.
+Games are then read back lazily through `SgfsGames`.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Callable,
+    Collection,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
+
+import pyarrow as pa
+
+from go_attack.analysis import compact_analyses, write_analyses
+from go_attack.go import Game
+
+
+class SgfLocation(NamedTuple):
+    """Where a game's SGF is stored."""
+
+    path: Path
+    offset: Optional[int] = None  # Byte offset of the line in an `.sgfs` file
+
+
+def load_game(location: SgfLocation) -> Game:
+    """Load the game stored at `location`."""
+    if location.offset is None:
+        return Game.from_sgf(location.path.read_text(), check_legal=False)
+
+    with open(location.path, "rb") as f:
+        f.seek(location.offset)
+        line = f.readline()
+    return Game.from_sgf(line.decode("utf-8"), check_legal=False)
+
+
+class SgfsGames(Sequence[Game]):
+    """A sequence of stored games, each loaded from disk whenever it's accessed."""
+
+    def __init__(self, locations: Sequence[SgfLocation]):
+        """Create a sequence of the games stored at `locations`."""
+        self.locations = list(locations)
+
+    def __len__(self) -> int:
+        """Return the number of games."""
+        return len(self.locations)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[Game, "SgfsGames"]:
+        """Load the game at `idx`, or return the games in a slice."""
+        if isinstance(idx, slice):
+            return SgfsGames(self.locations[idx])
+        return load_game(self.locations[idx])
+
+
+def _write_durably(f: BinaryIO, data: bytes) -> None:
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class SgfsWriter:
+    """Appends games to an `.sgfs` file, writing their analyses to Parquet files.
+
+    Games are buffered in memory and written, together with their analyses,
+    once `flush_every` games are buffered or `flush_interval` seconds have
+    passed since the last write. Every write is fsynced, and then the
+    `on_durable` callbacks of the written games are called, followed by
+    `on_flush`, so that e.g. the callbacks can journal the games and
+    `on_flush` can fsync the journal once per write. The analyses of
+    each write go to their own file, `<sgfs name>-<first game>.parquet`, with
+    one row group per game. These are merged into `<sgfs name>.parquet` when
+    the writer is closed, and when it's opened again after a crash.
+    """
+
+    def __init__(
+        self,
+        sgfs_path: Path,
+        analysis_dir: Optional[Path] = None,
+        *,
+        flush_every: int = 100,
+        flush_interval: float = 60.0,
+        keep_until: Optional[int] = None,
+        keep_games: Optional[Collection[int]] = None,
+        on_flush: Optional[Callable[[], None]] = None,
+    ):
+        """Open the files for appending.
+
+        Args:
+            sgfs_path: The `.sgfs` file to append games to.
+            analysis_dir: The directory to write analyses to, if any.
+            flush_every: Maximum number of games to buffer.
+            flush_interval: Maximum number of seconds to buffer games for.
+            keep_until: If given, the file is truncated to this many bytes,
+                e.g. to drop games that were written but never journaled.
+            keep_games: If given, the stored analyses of other games are
+                dropped, e.g. those of games that were never journaled.
+            on_flush: Called after the `on_durable` callbacks of every write.
+        """
+        self.sgfs_path = sgfs_path
+        self.analysis_dir = analysis_dir
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+
+        self._sgfs = open(sgfs_path, "a+b")
+        self._offset = self._sgfs.seek(0, os.SEEK_END)
+        if keep_until is not None and keep_until < self._offset:
+            self._sgfs.truncate(keep_until)
+            os.fsync(self._sgfs.fileno())
+            self._offset = keep_until
+        self._merge_analyses(keep_games)
+        if self._offset:
+            # Don't append to a game cut short by a crash.
+            self._sgfs.seek(self._offset - 1)
+            if self._sgfs.read(1) != b"\n":
+                _write_durably(self._sgfs, b"\n")
+                self._offset += 1
+        self._lines: List[bytes] = []
+        self._first_game: Optional[int] = None
+        self._analyses: List[pa.Table] = []
+        self._callbacks: List[Callable[[], None]] = []
+        self._last_flush = time.monotonic()
+
+    def write(
+        self,
+        game_idx: int,
+        sgf: str,
+        analyses: Optional[pa.Table] = None,
+        on_durable: Optional[Callable[[], None]] = None,
+    ) -> SgfLocation:
+        """Buffer game `game_idx`, flushing the buffer if it's due.
+
+        Args:
+            game_idx: The number of the game, recorded with its analyses.
+            sgf: The SGF of the game; it must not contain newlines.
+            analyses: The analyses of the game, see `analysis_table`.
+            on_durable: Called once the game is safely on disk.
+
+        Returns:
+            Where the game will be stored.
+
+        Raises:
+            ValueError: If `sgf` contains newlines.
+        """
+        if "\n" in sgf:
+            raise ValueError("SGFs in an .sgfs file must fit on one line")
+        line = sgf.encode("utf-8") + b"\n"
+        location = SgfLocation(self.sgfs_path, self._offset)
+        self._offset += len(line)
+        self._lines.append(line)
+        if self._first_game is None:
+            self._first_game = game_idx
+
+        if analyses is not None and self.analysis_dir is not None:
+            self._analyses.append(analyses)
+        if on_durable is not None:
+            self._callbacks.append(on_durable)
+
+        elapsed = time.monotonic() - self._last_flush
+        if len(self._lines) >= self.flush_every or elapsed >= self.flush_interval:
+            self.flush()
+        return location
+
+    def flush(self) -> None:
+        """Write all buffered games and analyses to disk and fsync them."""
+        if self._lines:
+            _write_durably(self._sgfs, b"".join(self._lines))
+        if self._analyses:
+            assert self.analysis_dir is not None
+            self.analysis_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{self.sgfs_path.stem}-{self._first_game}.parquet"
+            write_analyses(self.analysis_dir / name, self._analyses)
+
+        callbacks = self._callbacks
+        self._lines, self._analyses, self._callbacks = [], [], []
+        self._first_game = None
+        self._last_flush = time.monotonic()
+        for callback in callbacks:
+            callback()
+        if callbacks and self.on_flush is not None:
+            self.on_flush()
+
+    def close(self) -> None:
+        """Flush any buffered games, merge the analyses and close the files."""
+        self.flush()
+        self._merge_analyses()
+        self._sgfs.close()
+
+    def _merge_analyses(self, keep_games: Optional[Collection[int]] = None) -> None:
+        """Merge the analyses of every write into one file, see `compact_analyses`."""
+        if self.analysis_dir is None or not self.analysis_dir.exists():
+            return
+
+        stem = self.sgfs_path.stem
+        merged = self.analysis_dir / f"{stem}.parquet"
+        parts = sorted(
+            self.analysis_dir.glob(f"{stem}-*.parquet"),
+            key=lambda path: int(path.stem[len(stem) + 1 :]),  # noqa: E203
+        )
+        if merged.exists():
+            parts.insert(0, merged)
+        if parts and (keep_games is not None or parts != [merged]):
+            compact_analyses(parts, merged, keep_games)
+
+    def __enter__(self) -> "SgfsWriter":
+        """Return the writer; it is closed when the `with` block exits."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the writer."""
+        self.close()
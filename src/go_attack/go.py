@@ -1,13 +1,26 @@
 """A basic implementation of Go with Tromp-Taylor rules."""
 
-import re
+from array import array
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import ClassVar, Iterable, List, NamedTuple, Optional, Tuple
+from functools import lru_cache
+from typing import (
+    ClassVar,
+    Iterable,
+    List,
+    MutableSequence,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 import numpy as np
 from scipy.ndimage import distance_transform_cdt, label
 
+from go_attack.chains import ChainBoard, board_hash, neighbor_values, zobrist_keys
+from go_attack.history import CompactBoardHistory
+from go_attack.sgf_parsing import iter_properties
+
 
 class Color(Enum):
     """The color of a stone or vertex."""
@@ -89,6 +102,212 @@ class Move(NamedTuple):
         return f"{GO_LETTERS[self.x]}{self.y + 1}"
 
 
+def tromp_taylor_scores(
+    boards: np.ndarray,
+    komi: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Score one or more boards with Tromp-Taylor area scoring.
+
+    Empty regions are labeled once, and whether each region reaches black or
+    white is decided for all regions at once by counting the empty points that
+    border a stone of each color.
+
+    Args:
+        boards: An array of shape (..., board_size, board_size). Leading axes
+            index independent boards.
+        komi: Komi added to white's score.
+
+    Returns:
+        A (black, white) tuple of arrays with the leading shape of `boards`.
+    """
+    empty = boards == Color.EMPTY.value
+    # Connect empty points within a board, but never across boards.
+    structure = np.zeros((3,) * boards.ndim, dtype=bool)
+    center = (1,) * (boards.ndim - 2)
+    structure[center] = [[0, 1, 0], [1, 1, 1], [0, 1, 0]]
+    regions, num_regions = label(empty, structure=structure)
+
+    # Off-board neighbours get a value that matches no color.
+    neighbors = neighbor_values(boards, fill=len(Color))
+    areas = []
+    for color in (Color.BLACK, Color.WHITE):
+        # Rule 9. A player's score is the number of points of her color...
+        stones = np.sum(boards == color.value, axis=(-2, -1))
+
+        # ...plus the number of empty points that only reach her color.
+        borders = empty & np.any(neighbors == color.value, axis=0)
+        reaches = np.bincount(regions[borders], minlength=num_regions + 1) > 0
+        reaches[0] = False  # Label 0 is every point that isn't empty
+        areas.append((stones, reaches))
+
+    (black_stones, reaches_black), (white_stones, reaches_white) = areas
+    black_territory = (reaches_black & ~reaches_white)[regions]
+    white_territory = (reaches_white & ~reaches_black)[regions]
+    black_score = black_stones + np.sum(black_territory, axis=(-2, -1))
+    white_score = white_stones + np.sum(white_territory, axis=(-2, -1)) + komi
+    return black_score, white_score
+
+
+def parse_sgf_moves(
+    sgf_string: str,
+) -> Tuple[int, Optional[float], List[Optional[Move]]]:
+    """Extract the board size, komi and moves from an SGF string.
+
+    Only the main line is read, and property values inside comments or other
+    properties are never mistaken for moves.
+
+    Args:
+        sgf_string: A string holding an SGF game.
+
+    Returns:
+        A (board_size, komi, moves) tuple. The board size defaults to 19 and
+        the komi is `None` if the game doesn't specify one. Passes are `None`.
+
+    Raises:
+        ValueError: If the players don't alternate, or a move is malformed.
+    """
+    board_size, komi = 19, None
+    moves: List[Optional[Move]] = []
+    vertices = []
+    for prop in iter_properties(sgf_string):
+        ident = prop.ident
+        if ident == "B" or ident == "W":
+            turn = len(vertices)
+            expected = "B" if turn % 2 == 0 else "W"
+            if ident != expected:
+                p1, p2 = str(Color.from_str(expected)), str(Color.from_str(ident))
+                raise ValueError(f"Expected {p1} to play on turn {turn + 1}, got {p2}")
+            vertices.append(prop.value)
+        elif prop.node == 0 and ident == "SZ":
+            board_size = int(prop.value)
+        elif prop.node == 0 and ident == "KM":
+            try:
+                komi = float(prop.value)
+            except ValueError:
+                pass
+
+    moves.extend(_parse_vertex(vertex, board_size) for vertex in vertices)
+    return board_size, komi, moves
+
+
+class SgfRecord(NamedTuple):
+    """The setup and moves of an SGF game, see `parse_sgf_record`."""
+
+    board_size: int
+    komi: float
+    setup: List[Tuple[Color, Move]]  # Stones placed in the root, e.g. handicap
+    moves: List[Tuple[Color, Optional[Move]]]
+
+
+def parse_sgf_record(sgf_string: str) -> SgfRecord:
+    """Extract everything needed to replay a game from an SGF string.
+
+    Unlike `parse_sgf_moves`, this reads the setup stones of the root node and
+    allows either player to move at any point, e.g. in handicap games. Values
+    default the way `sgfmill` reads them, which is what KataGo is sent when
+    games are replayed on it: the board size to 19 and komi to 0.
+
+    Args:
+        sgf_string: A string holding an SGF game.
+
+    Returns:
+        The board size, komi, setup stones in the order black then white, and
+        the moves of the main line with their colors. Passes are `None`.
+
+    Raises:
+        ValueError: If a move or setup stone is malformed.
+    """
+    board_size, komi = 19, 0.0
+    setup_vertices: List[Tuple[Color, str]] = []
+    move_vertices: List[Tuple[Color, str]] = []
+    for prop in iter_properties(sgf_string):
+        ident = prop.ident
+        if ident == "B" or ident == "W":
+            move_vertices.append((Color.from_str(ident), prop.value))
+        elif prop.node == 0 and (ident == "AB" or ident == "AW"):
+            setup_vertices.append((Color.from_str(ident[1]), prop.value))
+        elif prop.node == 0 and ident == "SZ":
+            board_size = int(prop.value)
+        elif prop.node == 0 and ident == "KM":
+            try:
+                komi = float(prop.value)
+            except ValueError:
+                pass
+
+    setup = []
+    for color, vertex in sorted(setup_vertices, key=lambda cv: cv[0].value):
+        # A value like "aa:cc" is a compressed rectangle of points.
+        corners = [_parse_vertex(corner, board_size) for corner in vertex.split(":")]
+        if None in corners or len(corners) > 2:
+            raise ValueError(f"Malformed SGF setup stone '{vertex}'")
+        (x1, y1), (x2, y2) = corners[0], corners[-1]
+        setup.extend(
+            (color, _interned_move(x, y))
+            for x in range(min(x1, x2), max(x1, x2) + 1)
+            for y in range(min(y1, y2), max(y1, y2) + 1)
+        )
+    moves = [
+        (color, _parse_vertex(vertex, board_size)) for color, vertex in move_vertices
+    ]
+    return SgfRecord(board_size, komi, setup, moves)
+
+
+def _parse_vertex(vertex: str, board_size: int) -> Optional[Move]:
+    """Parse an SGF point, returning `None` for a pass."""
+    # "tt" is the legacy encoding of a pass on boards up to 19x19.
+    if not vertex or (vertex == "tt" and board_size <= 19):
+        return None
+    if len(vertex) == 2:
+        a = ord("a")
+        return _interned_move(ord(vertex[0]) - a, ord(vertex[1]) - a)
+    raise ValueError(f"Malformed SGF move '{vertex}'")
+
+
+@lru_cache(maxsize=None)
+def _interned_move(x: int, y: int) -> Move:
+    """Return a shared `Move` object so long games don't store duplicates."""
+    return Move(x, y)
+
+
+class _PositionIndex:
+    """Zobrist hashes of a game's board states, for fast superko checks."""
+
+    def __init__(self):
+        """Create an empty index."""
+        # `hashes[i]` is the hash of `board_states[i]`, packed as uint64s.
+        self.hashes = array("Q")
+        # The last board we indexed, used to detect outside modifications.
+        self.top: Optional[np.ndarray] = None
+
+    def push(self, position_hash: int, board: np.ndarray) -> None:
+        """Index `board`, with hash `position_hash`, as the newest board state."""
+        self.hashes.append(position_hash)
+        self.top = board
+
+    def pop(self, new_top: Optional[np.ndarray]) -> None:
+        """Remove the newest board state; `new_top` is the one before it."""
+        self.hashes.pop()
+        self.top = new_top
+
+    def rebuild(self, board_states: Iterable[np.ndarray]) -> None:
+        """Reindex `board_states` from scratch."""
+        self.hashes = array("Q")
+        self.top = None
+        for board in board_states:
+            self.push(board_hash(board), board)
+
+    def turns_with_hash(self, position_hash: int, stop: int) -> np.ndarray:
+        """Return the turn indices before `stop` whose board has this hash."""
+        hashes = np.frombuffer(self.hashes, dtype=np.uint64)[:stop]
+        return np.flatnonzero(hashes == np.uint64(position_hash))
+
+    def contains(self, position_hashes: np.ndarray) -> np.ndarray:
+        """Return a mask of which `position_hashes` occur in the index."""
+        seen = np.sort(np.frombuffer(self.hashes, dtype=np.uint64))
+        idx = np.searchsorted(seen, position_hashes).clip(max=len(seen) - 1)
+        return seen[idx] == position_hashes
+
+
 @dataclass(frozen=True)
 class Game:
     """Encapsulates the state of a Go game.
@@ -100,14 +319,37 @@ class Game:
 
     Board states are represented as NumPy arrays so that, when you print
     a board state, the pieces are arranged visually the way you expect.
+
+    With `compact_history=True`, `board_states` is a `CompactBoardHistory`
+    that stores per-move diffs instead of full boards and reconstructs
+    earlier boards on demand. This is much cheaper to keep around for many
+    games, at the cost of slower access to boards other than the latest.
     """
 
     DEFAULT_KOMI: ClassVar[float] = 7.5
 
     board_size: int
-    board_states: List[np.ndarray] = field(default_factory=list)
+    board_states: MutableSequence[np.ndarray] = field(default_factory=list)
     moves: List[Optional[Move]] = field(default_factory=list)
     komi: float = DEFAULT_KOMI
+    compact_history: bool = False
+
+    # Chain/liberty state of the most recent board we looked at, paired with
+    # the board array it describes. Looked up by identity, so it is rebuilt
+    # whenever `board_states` is modified other than through `Game` methods.
+    _chains: Optional[Tuple[np.ndarray, ChainBoard]] = field(
+        default=None,
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    # Superko index over `board_states`.
+    _positions: _PositionIndex = field(
+        default_factory=_PositionIndex,
+        init=False,
+        repr=False,
+        compare=False,
+    )
 
     def __len__(self) -> int:
         """Return the number of turns in this game."""
@@ -115,9 +357,23 @@ class Game:
 
     def __post_init__(self):
         """Initialize the history of board states."""
+        if self.compact_history and not isinstance(
+            self.board_states,
+            CompactBoardHistory,
+        ):
+            history = CompactBoardHistory(self.board_size, self.board_states)
+            object.__setattr__(self, "board_states", history)
+
         # The board starts out empty
         board = np.zeros((self.board_size, self.board_size), dtype=np.uint8)
         self.board_states.append(board)
+        self._positions.push(0, board)
+
+    def __getstate__(self) -> dict:
+        """Return the state to pickle, leaving out the rebuildable chain cache."""
+        state = self.__dict__.copy()
+        state["_chains"] = None
+        return state
 
     def __repr__(self) -> str:
         """Return a string representation of this game."""
@@ -139,13 +395,19 @@ class Game:
 
     def skip_turn(self):
         """Skip the current turn (i.e. pass)."""
-        self.board_states.append(self.board_states[-1])
+        self._sync_positions()
+        board = self.board_states[-1]
+        self.board_states.append(board)
         self.moves.append(None)
+        self._positions.push(self._positions.hashes[-1], board)
 
     def undo(self) -> np.ndarray:
         """Undo the last turn, returning the undone board."""
+        self._sync_positions()
         self.moves.pop()
-        return self.board_states.pop()
+        board = self.board_states.pop()
+        self._positions.pop(self.board_states[-1] if self.board_states else None)
+        return board
 
     def is_suicide(
         self,
@@ -198,8 +460,16 @@ class Game:
     ) -> bool:
         """Return `True` iff `board` repeats an earlier board state."""
         # Sort of silly thing we have to do because of Python slicing semantics
-        history = self.board_states[:turn_idx]
-        return any(np.all(board == earlier) for earlier in history)
+        history_len = len(range(len(self.board_states))[:turn_idx])
+
+        # Only boards with the same Zobrist hash can be equal, so we only
+        # compare full boards on a hash hit.
+        self._sync_positions()
+        earlier_turns = self._positions.turns_with_hash(board_hash(board), history_len)
+        return any(
+            np.array_equal(board, self.board_states[earlier])
+            for earlier in earlier_turns
+        )
 
     def legal_move_mask(
         self,
@@ -207,12 +477,59 @@ class Game:
         turn_idx: Optional[int] = None,
         allow_suicide=True,
     ) -> np.ndarray:
-        """Return a mask of all legal moves for the current player."""
-        board = np.zeros((self.board_size, self.board_size), dtype=np.uint8)
-        for x, y in self.legal_moves(turn_idx=turn_idx, allow_suicide=allow_suicide):
-            board[cartesian_to_numpy(x, y)] = 1
+        """Return a mask of all legal moves for the current player.
 
-        return board
+        The mask is computed for the whole board at once from the chains next
+        to each empty point. Only moves that capture, multi-stone suicides,
+        and moves whose resulting Zobrist hash was seen before are simulated
+        individually to check for superko.
+        """
+        board = self.board_states[turn_idx if turn_idx is not None else -1]
+        color = self.current_player(turn_idx=turn_idx).value
+        opponent = Color.BLACK.value + Color.WHITE.value - color
+        chains = self._chain_board(turn_idx)
+
+        # Off-board neighbours get a value that matches no color.
+        neighbor_colors = neighbor_values(board, fill=len(Color))
+        neighbor_libs = neighbor_values(chains.liberty_counts(), fill=0)
+        has_empty = np.any(neighbor_colors == Color.EMPTY.value, axis=0)
+        captures = np.any((neighbor_colors == opponent) & (neighbor_libs == 1), axis=0)
+        own_neighbors = neighbor_colors == color
+        safe_connection = np.any(own_neighbors & (neighbor_libs > 1), axis=0)
+
+        empty = board == Color.EMPTY.value
+        captures &= empty
+        quiet = empty & ~captures & (has_empty | safe_connection)
+        suicide = empty & ~captures & ~quiet
+
+        # A quiet move adds a single stone, so its hash is known up front.
+        self._sync_positions()
+        next_hashes = np.uint64(chains.hash) ^ zobrist_keys(self.board_size)[color]
+        mask = quiet.ravel()
+        quiet_points = np.flatnonzero(mask)
+        for point in quiet_points[self._positions.contains(next_hashes[quiet_points])]:
+            mask[point] = not self.is_repetition(
+                self.virtual_move(*self._move_at(point), turn_idx=turn_idx),
+            )
+
+        # Suicide of a lone stone recreates the current board, which is always
+        # a repetition. Larger suicides change the board and need simulating.
+        ambiguous = captures
+        if allow_suicide:
+            ambiguous = captures | (suicide & np.any(own_neighbors, axis=0))
+
+        for point in np.flatnonzero(ambiguous):
+            removed = chains.removed_by(point, color)
+            next_hash = chains.hash_after(point, color, removed)
+            if self._positions.turns_with_hash(next_hash, len(self.board_states)).size:
+                move = self._move_at(point)
+                next_board = self.virtual_move(*move, turn_idx=turn_idx)
+                mask[point] = not self.is_repetition(next_board)
+            else:
+                mask[point] = True
+
+        mask = mask.reshape(board.shape)
+        return mask.astype(np.uint8)
 
     def legal_moves(
         self,
@@ -221,14 +538,11 @@ class Game:
         allow_suicide: bool = True,
     ) -> Iterable[Move]:
         """Return a generator over all legal moves for the current player."""
-        for x in range(self.board_size):
-            for y in range(self.board_size):
-                if self.is_legal(
-                    Move(x, y),
-                    turn_idx=turn_idx,
-                    allow_suicide=allow_suicide,
-                ):
-                    yield Move(x, y)
+        mask = self.legal_move_mask(turn_idx=turn_idx, allow_suicide=allow_suicide)
+        # Flip the rows so the mask is indexed by [y, x], then transpose so
+        # that moves come out sorted by x and then y.
+        for x, y in zip(*np.nonzero(mask[::-1].T)):
+            yield Move(int(x), int(y))
 
     def move(self, x: int, y: int, *, check_legal: bool = True) -> None:
         """Make a move at (`x`, `y`)."""
@@ -246,8 +560,19 @@ class Game:
                     "Superko violation: Cannot repeat an earlier board state",
                 )
 
+        self._sync_positions()
+        chains = self._chain_board()
+        point = self._point(x, y)
+        if chains.colors[point] == Color.EMPTY.value:
+            chains.play(point, self.current_player().value)
+            object.__setattr__(self, "_chains", (next_board, chains))
+            next_hash = chains.hash
+        else:
+            next_hash = board_hash(next_board)
+
         self.board_states.append(next_board)
-        self.moves.append(Move(x, y))
+        self.moves.append(_interned_move(int(x), int(y)))
+        self._positions.push(next_hash, next_board)
 
     def play_move(self, move: Optional[Move], *, check_legal: bool = True) -> None:
         """Pass if `move is None`, otherwise play the specified `Move` object."""
@@ -285,54 +610,29 @@ class Game:
 
         board = self.board_states[turn_idx if turn_idx is not None else -1].copy()
         color = self.current_player(turn_idx=turn_idx)
+        point = self._point(x, y)
 
         # Rule 7. A move consists of coloring an empty point one's own color...
-        board[cartesian_to_numpy(x, y)] = color.value
-
-        # ...then clearing the opponent color,
-        self._clear_color(board, color.opponent())
-
-        # ...and then clearing one's own color.
-        self._clear_color(board, color)
+        if board.flat[point] != Color.EMPTY.value:
+            # Only reachable with `check_legal=False`; fall back to clearing
+            # the whole board since the chain structure doesn't apply.
+            board.flat[point] = color.value
+            self._clear_color(board, color.opponent())
+            self._clear_color(board, color)
+            return board
+
+        # ...then clearing the opponent color, and then clearing one's own
+        # color. Only chains adjacent to the new stone can lose their last
+        # liberty, so we ask the chain board which stones get removed.
+        removed = self._chain_board(turn_idx).removed_by(point, color.value)
+        board.flat[point] = color.value
+        board.flat[removed] = Color.EMPTY.value
         return board
 
     def score(self, turn_idx: Optional[int] = None) -> Tuple[int, int]:
         """Return the current score of the game as a (black, white) tuple."""
         board = self.board_states[turn_idx if turn_idx is not None else -1]
-
-        # Distance of each point to the nearest black point.
-        black_dists = distance_transform_cdt(
-            board != Color.BLACK.value,
-            metric="taxicab",
-        )
-        # Distance of each point to the nearest white point.
-        white_dists = distance_transform_cdt(
-            board != Color.WHITE.value,
-            metric="taxicab",
-        )
-        # `territories` are labeled with integers from `1` to `num_trajectories`, with
-        # contiguous groups of empty cells with the same label
-        territories, num_territories = label(board == Color.EMPTY.value)
-
-        # Rule 9. A player’s score is the number of points of her color...
-        black_score = np.sum(board == Color.BLACK.value)
-        white_score = np.sum(board == Color.WHITE.value) + self.komi
-
-        # ...plus the number of empty points that only reach her color.
-        for terr_idx in range(1, num_territories + 1):
-            # A territory "reaches" a color iff any of its stones are 1 away
-            # from a stone of that color
-            terr_mask = territories == terr_idx
-            terr_black_dists = black_dists * terr_mask
-            terr_white_dists = white_dists * terr_mask
-            reaches_black = np.any(terr_black_dists == 1)
-            reaches_white = np.any(terr_white_dists == 1)
-
-            if reaches_black and not reaches_white:
-                black_score += terr_mask.sum()
-            elif reaches_white and not reaches_black:
-                white_score += terr_mask.sum()
-
+        black_score, white_score = tromp_taylor_scores(board, self.komi)
         return black_score, white_score
 
     def winner(self) -> Optional[Color]:
@@ -348,6 +648,35 @@ class Game:
         else:
             return None
 
+    def _point(self, x: int, y: int) -> int:
+        """Return the flat NumPy index of the point at (`x`, `y`)."""
+        row, col = cartesian_to_numpy(x, y)
+        return (row % self.board_size) * self.board_size + col
+
+    def _move_at(self, point: int) -> Move:
+        """Return the `Move` at flat NumPy index `point`; inverse of `_point`."""
+        row, col = divmod(int(point), self.board_size)
+        return Move(col, self.board_size - 1 - row)
+
+    def _chain_board(self, turn_idx: Optional[int] = None) -> ChainBoard:
+        """Return the chain/liberty state of the board at `turn_idx`."""
+        board = self.board_states[turn_idx if turn_idx is not None else -1]
+        if self._chains is not None and self._chains[0] is board:
+            return self._chains[1]
+
+        chains = ChainBoard.from_array(board)
+        object.__setattr__(self, "_chains", (board, chains))
+        return chains
+
+    def _sync_positions(self) -> None:
+        """Rebuild the superko index if `board_states` was modified directly."""
+        positions = self._positions
+        if (
+            len(positions.hashes) != len(self.board_states)
+            or positions.top is not self.board_states[-1]
+        ):
+            positions.rebuild(self.board_states)
+
     @staticmethod
     def _clear_color(board: np.ndarray, color: Color):
         """Clear all stones of a given color."""
@@ -372,34 +701,20 @@ class Game:
         return board
 
     @classmethod
-    def from_sgf(cls, sgf_string: str, check_legal: bool = True) -> "Game":
+    def from_sgf(
+        cls,
+        sgf_string: str,
+        check_legal: bool = True,
+        *,
+        compact_history: bool = False,
+    ) -> "Game":
         """Create a `Board` from an SGF string."""
-        sgf_string = sgf_string.strip()
-
-        # Try to detect board size from SZ[] property and komi from the KM[]
-        # property.
-        maybe_size = re.search(r"SZ\[([0-9]+)\]", sgf_string)
-        board_size = int(maybe_size.group(1)) if maybe_size else 19
-        maybe_komi = re.search(r"KM\[(-?\d+\.?\d*)\]", sgf_string)
-        komi = float(maybe_komi.group(1)) if maybe_komi else cls.DEFAULT_KOMI
-        game = cls(board_size=board_size, komi=komi)
-
-        turn_regex = re.compile(r"(B|W)\[([a-z]{0,2})\]")
-        for i, hit in enumerate(turn_regex.finditer(sgf_string)):
-            expected_player = Color.BLACK if i % 2 == 0 else Color.WHITE
-            player = Color.from_str(hit.group(1))
-
-            if player != expected_player:
-                p1, p2 = str(expected_player), str(player)
-                raise ValueError(f"Expected {p1} to play on turn {i + 1}, got {p2}")
-
-            vertex = hit.group(2)
-            if not vertex:
-                move = None
-            else:
-                x, y = ord(vertex[0]) - ord("a"), ord(vertex[1]) - ord("a")
-                move = Move(x, y)
+        board_size, komi, moves = parse_sgf_moves(sgf_string)
+        if komi is None:
+            komi = cls.DEFAULT_KOMI
 
+        game = cls(board_size=board_size, komi=komi, compact_history=compact_history)
+        for move in moves:
             game.play_move(move, check_legal=check_legal)
 
         return game
@@ -0,0 +1,304 @@
+"""Clients for talking to Go engines over the Go Text Protocol (GTP).
+
+Every command is sent with a numeric id, and every response is read in full
+up to the blank line that terminates it. Responses look like `=<id> <text>`
+on success and `?<id> <text>` on failure, and are matched back to their
+commands by id. Engines that don't echo ids answer commands in order, so an
+id-less response belongs to the oldest unanswered command.
+"""
+
+import asyncio
+import collections
+import os
+import re
+import select
+from typing import IO, Deque, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+# The first line of a response: success or failure marker, optional id, text.
+_HEADER_RE = re.compile(r"([=?])(\d*)(?:\s(.*))?", re.DOTALL)
+
+
+class GTPError(Exception):
+    """Raised when an engine responds to a command with an error."""
+
+
+def parse_header(line: str) -> Optional[Tuple[bool, Optional[int], str]]:
+    """Parse the first line of a GTP response.
+
+    Args:
+        line: A line of engine output, with surrounding whitespace stripped.
+
+    Returns:
+        A (success, id, text) tuple, where `id` is `None` if the engine didn't
+        echo one, or `None` if `line` doesn't start a response.
+    """
+    hit = _HEADER_RE.fullmatch(line)
+    if hit is None:
+        return None
+    marker, cmd_id, text = hit.groups()
+    return marker == "=", int(cmd_id) if cmd_id else None, (text or "").strip()
+
+
+class PendingResponse:
+    """The response to a command sent with `GTPClient.send`."""
+
+    def __init__(self, client: "GTPClient", cmd_id: int, msg: str):
+        """Create a placeholder for the response to command `msg`."""
+        self.client = client
+        self.cmd_id = cmd_id
+        self.msg = msg
+        self.preamble: List[str] = []  # Stray output read before the response
+        self._success: Optional[bool] = None
+        self._text = ""
+
+    def done(self) -> bool:
+        """Return `True` iff the response has been read."""
+        return self._success is not None
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """Wait for the response and return its text.
+
+        Any responses to earlier commands are read along the way.
+
+        Args:
+            timeout: Maximum number of seconds to wait for each line of output.
+
+        Returns:
+            The text of the response without the `=<id>` prefix. Multi-line
+            responses are joined with newlines.
+
+        Raises:
+            GTPError: If the engine responded with an error.
+        """
+        while not self.done():
+            self.client.read_response(timeout)
+        if not self._success:
+            raise GTPError(f"Command '{self.msg}' failed: {self._text}")
+        return self._text
+
+    def _resolve(self, success: bool, text: str) -> None:
+        self._success, self._text = success, text
+
+
+class AsyncGTPEngine:
+    """A GTP engine subprocess driven with asyncio.
+
+    Every command is sent with a numeric id, and its response is read up to
+    the blank line that terminates it, so a single event loop can drive many
+    engines concurrently without tying up a thread per engine. Commands sent
+    concurrently to the same engine are serialized.
+    """
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        """Wrap an already running engine process; see `start`."""
+        self.proc = proc
+        self._next_id = 1
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def start(
+        cls,
+        args: Sequence[str],
+        env: Optional[Mapping[str, str]] = None,
+        stderr: Optional[Union[int, IO]] = asyncio.subprocess.DEVNULL,
+    ) -> "AsyncGTPEngine":
+        """Start the engine with command line `args`.
+
+        Args:
+            args: The executable followed by its arguments.
+            env: Environment variables for the engine process.
+            stderr: Where to send the engine's stderr.
+
+        Returns:
+            The running engine.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=stderr,
+        )
+        return cls(proc)
+
+    async def command(self, msg: str) -> str:
+        """Send the GTP command `msg` and return its response.
+
+        Args:
+            msg: The command to send, without an id.
+
+        Returns:
+            The text of the response without the `=<id>` prefix. Multi-line
+            responses are joined with newlines.
+
+        Raises:
+            GTPError: If the engine responds with an error.
+            EOFError: If the engine exits before responding.
+        """
+        async with self._lock:
+            cmd_id = self._next_id
+            self._next_id += 1
+            self.proc.stdin.write(f"{cmd_id} {msg}\n".encode("ascii"))
+            await self.proc.stdin.drain()
+
+            # Skip any output that isn't part of the response; GTP engines
+            # aren't supposed to print any, but some do.
+            while True:
+                header = parse_header(await self._read_line())
+                if header is not None and header[1] in (cmd_id, None):
+                    break
+
+            success, _, first = header
+            lines = [first]
+            while True:
+                line = await self._read_line()
+                if not line:
+                    break
+                lines.append(line)
+
+        response = "\n".join(lines).strip()
+        if not success:
+            raise GTPError(f"Command '{msg}' failed: {response}")
+        return response
+
+    async def close(self) -> None:
+        """Ask the engine to quit and wait for it to exit."""
+        if self.proc.returncode is None:
+            try:
+                await self.command("quit")
+            except (EOFError, ConnectionError):
+                pass
+            self.proc.stdin.close()
+        await self.proc.wait()
+
+    async def __aenter__(self) -> "AsyncGTPEngine":
+        """Return the engine; it is closed when the `async with` block exits."""
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        """Close the engine."""
+        await self.close()
+
+    async def _read_line(self) -> str:
+        """Read one line of output, with surrounding whitespace stripped."""
+        line = await self.proc.stdout.readline()
+        if not line:
+            raise EOFError("GTP engine exited")
+        return line.decode("ascii").strip()
+
+
+class GTPClient:
+    """A synchronous, pipelined GTP client for an engine's pipes.
+
+    `send` only queues a command; queued commands are written together, in a
+    single write, as soon as any response is waited for or `flush` is called.
+    So a sequence like `play` followed by `genmove` costs one round trip
+    rather than two.
+    """
+
+    def __init__(self, to_engine: IO[bytes], from_engine: IO[bytes]):
+        """Wrap the engine's stdin and stdout.
+
+        `from_engine` is read through its file descriptor, so it must not be
+        read from directly afterwards.
+        """
+        self.to_engine = to_engine
+        self.from_engine = from_engine
+        self._next_id = 1
+        self._queued: List[bytes] = []
+        self._pending: Deque[PendingResponse] = collections.deque()
+        self._by_id: Dict[int, PendingResponse] = {}
+        self._buffer = bytearray()
+
+    def send(self, msg: str) -> PendingResponse:
+        """Queue the command `msg`, without an id, and return its response."""
+        cmd_id = self._next_id
+        self._next_id += 1
+        self._queued.append(f"{cmd_id} {msg}\n".encode("ascii"))
+
+        response = PendingResponse(self, cmd_id, msg)
+        self._pending.append(response)
+        self._by_id[cmd_id] = response
+        return response
+
+    def flush(self) -> None:
+        """Write all queued commands to the engine."""
+        if self._queued:
+            data = b"".join(self._queued)
+            self._queued.clear()
+            self.to_engine.write(data)
+            self.to_engine.flush()
+
+    def command(self, msg: str, timeout: Optional[float] = None) -> str:
+        """Send `msg` and return its response; see `PendingResponse.result`."""
+        return self.send(msg).result(timeout)
+
+    def read_response(self, timeout: Optional[float] = None) -> None:
+        """Flush queued commands, then read one response and resolve it.
+
+        Output before the response that isn't part of any response is kept in
+        the `preamble` of the response it precedes. Responses with ids that
+        don't match any pending command are discarded.
+
+        Args:
+            timeout: Maximum number of seconds to wait for each line of output.
+
+        Raises:
+            EOFError: If the engine exits.
+            TimeoutError: If the engine doesn't respond within `timeout`.
+        """
+        self.flush()
+
+        preamble = []
+        while True:
+            line = self._read_line(timeout)
+            header = parse_header(line)
+            if header is not None:
+                break
+            if line:
+                preamble.append(line)
+
+        success, cmd_id, first = header
+        lines = [first]
+        while True:
+            line = self._read_line(timeout)
+            if not line:
+                break
+            lines.append(line)
+
+        if cmd_id is None:
+            response = self._pending[0] if self._pending else None
+        else:
+            response = self._by_id.get(cmd_id)
+        if response is None:
+            return
+
+        # Commands are answered in order, so anything older went unanswered.
+        while self._pending:
+            older = self._pending.popleft()
+            del self._by_id[older.cmd_id]
+            if older is response:
+                break
+            older._resolve(False, "no response")
+
+        response.preamble = preamble
+        response._resolve(success, "\n".join(lines).strip())
+
+    def _read_line(self, timeout: Optional[float]) -> str:
+        """Read one line of output, with surrounding whitespace stripped."""
+        fd = self.from_engine.fileno()
+        while True:
+            end = self._buffer.find(b"\n")
+            if end >= 0:
+                line = self._buffer[:end]
+                del self._buffer[: end + 1]
+                return line.decode("ascii").strip()
+
+            if timeout is not None:
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if not ready:
+                    raise TimeoutError(f"Engine did not respond within {timeout}s")
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise EOFError("GTP engine exited")
+            self._buffer += chunk
@@ -0,0 +1,201 @@
+"""Compact storage for the board history of a Go game."""
+
+from array import array
+from typing import Iterable, Iterator, List, MutableSequence, Optional, Union
+
+import numpy as np
+
+
+class CompactBoardHistory(MutableSequence[np.ndarray]):
+    """A list-like history of board states stored as per-move diffs.
+
+    Each board is stored as the set of points that changed since the previous
+    board, i.e. the placed stone plus any captured stones. A full keyframe is
+    stored every `keyframe_interval` boards so that random access only needs
+    to replay a bounded number of diffs. The most recent board is kept
+    materialized, and is returned as the same object every time, so code that
+    only looks at the latest board pays nothing for the compression.
+
+    Boards are reconstructed on demand, so mutating a returned board other
+    than the latest one has no effect on the history. Appending to and
+    removing from the end of the history is cheap. Any other change is
+    supported too, but re-encodes the whole history.
+    """
+
+    DEFAULT_KEYFRAME_INTERVAL = 128
+
+    def __init__(
+        self,
+        board_size: int,
+        boards: Iterable[np.ndarray] = (),
+        keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+    ):
+        """Create a history of `boards` for a board of size `board_size`."""
+        self.board_size = board_size
+        self.keyframe_interval = keyframe_interval
+
+        # Every diff entry packs a point and its new color as `point << 2 | color`.
+        # The diff leading to board `i` is `_diffs[_offsets[i]:_offsets[i + 1]]`.
+        self._diffs = array("H")
+        self._offsets = array("I", [0])
+        # Raw bytes of boards 0, K, 2K, ... where K is the keyframe interval.
+        self._keyframes: List[bytes] = []
+        self._latest: Optional[np.ndarray] = None
+
+        self.extend(boards)
+
+    def __len__(self) -> int:
+        """Return the number of boards in the history."""
+        return len(self._offsets) - 1
+
+    def __getitem__(
+        self,
+        index: Union[int, slice],
+    ) -> Union[np.ndarray, List[np.ndarray]]:
+        """Return the board at `index`, or a list of boards for a slice."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        index = self._normalize(index)
+        if index == len(self) - 1:
+            if self._latest is None:
+                self._latest = self._reconstruct(index)
+            return self._latest
+
+        return self._reconstruct(index)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """Iterate over the boards, replaying each diff only once."""
+        board = None
+        for index in range(len(self)):
+            if index == len(self) - 1:
+                yield self[index]
+            elif index % self.keyframe_interval == 0:
+                board = self._keyframe(index)
+                yield board.copy()
+            else:
+                self._apply_diffs(board, index, index + 1)
+                yield board.copy()
+
+    def __setitem__(
+        self,
+        index: Union[int, slice],
+        value: Union[np.ndarray, Iterable[np.ndarray]],
+    ) -> None:
+        """Replace the board at `index`, or the boards in a slice.
+
+        Replacing the latest board is cheap; anything else re-encodes the
+        history from the changed board onwards.
+        """
+        if not isinstance(index, slice) and self._normalize(index) == len(self) - 1:
+            self.pop()
+            self.append(value)
+            return
+
+        boards = list(self)
+        boards[index] = value
+        self._rebuild(boards)
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        """Delete the board at `index`, or the boards in a slice."""
+        if not isinstance(index, slice) and self._normalize(index) == len(self) - 1:
+            self.pop()
+            return
+
+        boards = list(self)
+        del boards[index]
+        self._rebuild(boards)
+
+    def insert(self, index: int, value: np.ndarray) -> None:
+        """Insert `value` before `index`; anywhere but the end is slow."""
+        if index >= len(self):
+            self.append(value)
+            return
+
+        boards = list(self)
+        boards.insert(index, value)
+        self._rebuild(boards)
+
+    def append(self, board: np.ndarray) -> None:
+        """Append `board` as the newest board state."""
+        index = len(self)
+        if index % self.keyframe_interval == 0:
+            self._keyframes.append(board.astype(np.uint8).tobytes())
+
+        if index > 0:
+            flat, previous = board.ravel(), self[-1].ravel()
+            changed = np.flatnonzero(flat != previous)
+            entries = (changed << 2) | flat[changed]
+            self._diffs.frombytes(entries.astype(np.uint16).tobytes())
+
+        self._offsets.append(len(self._diffs))
+        self._latest = board
+
+    def pop(self, index: int = -1) -> np.ndarray:
+        """Remove and return the board at `index`, by default the newest one."""
+        index = self._normalize(index)
+        if index != len(self) - 1:
+            board = self[index]
+            del self[index]
+            return board
+
+        board = self[-1]
+        self._offsets.pop()
+        del self._diffs[self._offsets[-1] :]  # noqa: E203
+        if len(self) % self.keyframe_interval == 0:
+            self._keyframes.pop()
+        self._latest = None
+        return board
+
+    def clear(self) -> None:
+        """Remove all boards from the history."""
+        self._diffs = array("H")
+        self._offsets = array("I", [0])
+        self._keyframes.clear()
+        self._latest = None
+
+    def nbytes(self) -> int:
+        """Return the approximate number of bytes used by the stored diffs."""
+        diff_bytes = self._diffs.itemsize * len(self._diffs)
+        offset_bytes = self._offsets.itemsize * len(self._offsets)
+        keyframe_bytes = sum(len(keyframe) for keyframe in self._keyframes)
+        return diff_bytes + offset_bytes + keyframe_bytes
+
+    def _normalize(self, index: int) -> int:
+        """Return `index` as a non-negative index, checking it's in range."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("board history index out of range")
+        return index
+
+    def _rebuild(self, boards: List[np.ndarray]) -> None:
+        """Re-encode the history as `boards`."""
+        self.clear()
+        self.extend(boards)
+
+    def _keyframe(self, index: int) -> np.ndarray:
+        """Return a writable copy of the keyframe at `index`."""
+        raw = self._keyframes[index // self.keyframe_interval]
+        board = np.frombuffer(raw, dtype=np.uint8).copy()
+        return board.reshape(self.board_size, self.board_size)
+
+    def _apply_diffs(self, board: np.ndarray, start: int, stop: int) -> None:
+        """Apply the diffs leading to boards `start` through `stop - 1`."""
+        begin, end = self._offsets[start], self._offsets[stop]
+        if begin == end:
+            return
+
+        entries = np.frombuffer(self._diffs, dtype=np.uint16)[begin:end]
+        points, colors = entries >> 2, entries & 3
+        # A point may change more than once; only its last change counts.
+        reversed_points = points[::-1]
+        _, last = np.unique(reversed_points, return_index=True)
+        board.flat[reversed_points[last]] = colors[::-1][last]
+
+    def _reconstruct(self, index: int) -> np.ndarray:
+        """Rebuild the board at `index` from the nearest keyframe."""
+        keyframe_index = index - index % self.keyframe_interval
+        board = self._keyframe(keyframe_index)
+        self._apply_diffs(board, keyframe_index + 1, index + 1)
+        return board
@@ -0,0 +1,186 @@
+"""An append-only journal of the games a baseline attack has finished.
+
+Every finished game is recorded as one JSON line in `journal.jsonl` in the
+run's log directory, after its SGF has been written. A restarted run reads the
+journal and skips the games it lists, loading them back from their SGFs
+instead of playing them again. Games are stored either as separate SGF files
+or as lines of an `.sgfs` file, in which case the record has the line's
+offset too.
+
+The first line of the journal records the settings of the run, such as komi
+and the board size. The log directory only names some of them, so a run with
+different settings can land in the same directory; it is refused instead of
+resuming games that were played differently.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Set, Union
+
+from go_attack.game_log import SgfLocation
+from go_attack.go import Game
+
+JOURNAL_NAME = "journal.jsonl"
+
+
+def game_result(game: Game) -> str:
+    """Return the result of a finished game in SGF notation, e.g. `B+3.5`."""
+    black, white = game.score()
+    if black == white:
+        return "0"
+    return f"B+{black - white}" if black > white else f"W+{white - black}"
+
+
+class GameJournal:
+    """The journal of finished games in a log directory.
+
+    Several processes may append to the same journal, e.g. when a run is split
+    over several workers, since each record is written with a single `write`
+    to a file opened for appending.
+    """
+
+    def __init__(
+        self,
+        log_dir: Union[str, Path],
+        config: Optional[Mapping[str, Any]] = None,
+    ):
+        """Open the journal in `log_dir`, creating it if needed.
+
+        Args:
+            log_dir: The log directory of the run.
+            config: The settings of the run; they must be JSON serializable.
+                If given, they are written to a new journal, and reading an
+                existing journal fails unless it has the same settings.
+        """
+        self.path = Path(log_dir) / JOURNAL_NAME
+        # Round trip through JSON so the settings compare equal to stored ones.
+        self.config = json.loads(json.dumps(config)) if config is not None else None
+
+    def completed(self, seed: int) -> Dict[int, SgfLocation]:
+        """Return the location of every game recorded as finished with `seed`.
+
+        A record cut short by a crash is ignored, so that game is played again.
+        """
+        done: Dict[int, SgfLocation] = {}
+        for record in self._records():
+            location = SgfLocation(Path(record["sgf_path"]), record.get("sgf_offset"))
+            if record["seed"] == seed and location.path.exists():
+                done[record["game"]] = location
+        return done
+
+    def recorded_end(self, sgfs_path: Path) -> int:
+        """Return the end of the last game in `sgfs_path` the journal lists.
+
+        Anything after it in the file was written but never recorded, e.g.
+        because of a crash, and those games will be played again.
+        """
+        offsets = [
+            record["sgf_offset"]
+            for record in self._records()
+            if record.get("sgf_offset") is not None
+            and Path(record["sgf_path"]) == sgfs_path
+        ]
+        if not offsets or not sgfs_path.exists():
+            return 0
+        with open(sgfs_path, "rb") as f:
+            f.seek(max(offsets))
+            return f.tell() + len(f.readline())
+
+    def recorded_games(self, sgfs_path: Path) -> Set[int]:
+        """Return the numbers of the games in `sgfs_path` the journal lists."""
+        return {
+            record["game"]
+            for record in self._records()
+            if Path(record["sgf_path"]) == sgfs_path
+        }
+
+    def record(
+        self,
+        seed: int,
+        game_idx: int,
+        result: str,
+        location: SgfLocation,
+        *,
+        sync: bool = True,
+    ) -> None:
+        """Record that game `game_idx` finished and is stored at `location`.
+
+        Args:
+            seed: The seed of the run.
+            game_idx: The number of the game.
+            result: The result of the game, see `game_result`.
+            location: Where the game's SGF is stored. It must already be on disk.
+            sync: Whether to fsync the journal. Otherwise the record is only
+                durable after the next call to `sync`.
+        """
+        record = {
+            "seed": seed,
+            "game": game_idx,
+            "result": result,
+            "sgf_path": str(location.path),
+        }
+        if location.offset is not None:
+            record["sgf_offset"] = location.offset
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if not size and self.config is not None:
+                line = (json.dumps({"config": self.config}) + "\n").encode() + line
+            # Don't append to a record cut short by a crash.
+            elif size and os.pread(fd, 1, size - 1) != b"\n":
+                line = b"\n" + line
+            os.write(fd, line)
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def sync(self) -> None:
+        """Make all records written so far durable."""
+        if not self.path.exists():
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _records(self) -> Iterator[Dict[str, Any]]:
+        """Yield the game records, checking the settings of the journal.
+
+        Raises:
+            ValueError: If the journal has games from a run with settings
+                other than `config`.
+        """
+        if not self.path.exists():
+            return
+
+        has_config = False
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "config" in record:
+                    has_config = True
+                    if self.config is not None and record["config"] != self.config:
+                        changed = sorted(
+                            key
+                            for key in {**record["config"], **self.config}
+                            if record["config"].get(key) != self.config.get(key)
+                        )
+                        raise ValueError(
+                            f"{self.path} is from a run with different settings: "
+                            f"{', '.join(changed)}. Rerun with the same settings "
+                            "or log to a new directory",
+                        )
+                    continue
+                if self.config is not None and not has_config:
+                    raise ValueError(
+                        f"{self.path} doesn't record the settings of its run. "
+                        "Log to a new directory",
+                    )
+                yield record
@@ -0,0 +1,174 @@
+"""Asyncio client for KataGo's JSON analysis engine.
+
+Unlike `gtp`, which evaluates one position at a time, `katago analysis` reads
+a stream of JSON queries and searches many of them in parallel, batching the
+neural net evaluations across queries. Responses come back in whatever order
+the searches finish, so they are routed back to their queries by id.
+"""
+
+import asyncio
+import json
+from typing import IO, Any, Dict, Mapping, Optional, Sequence, Union
+
+from go_attack.go import Color, Game, Move
+
+
+class AnalysisError(Exception):
+    """Raised when the analysis engine rejects a query."""
+
+
+class AsyncAnalysisEngine:
+    """A `katago analysis` subprocess that many coroutines can query at once."""
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        """Wrap an already running analysis engine; see `start`."""
+        self.proc = proc
+        self._next_id = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reader = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def start(
+        cls,
+        args: Sequence[str],
+        env: Optional[Mapping[str, str]] = None,
+        stderr: Optional[Union[int, IO]] = asyncio.subprocess.DEVNULL,
+    ) -> "AsyncAnalysisEngine":
+        """Start the engine with command line `args`.
+
+        Args:
+            args: The executable followed by its arguments, including
+                `analysis`.
+            env: Environment variables for the engine process.
+            stderr: Where to send the engine's stderr.
+
+        Returns:
+            The running engine.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=stderr,
+            # Responses can hold the policy and ownership of the whole board.
+            limit=2**24,
+        )
+        return cls(proc)
+
+    async def query(self, query: Mapping[str, Any]) -> Dict[str, Any]:
+        """Send `query` and return the final response to it.
+
+        Args:
+            query: A query in KataGo's analysis format. The `id` field is
+                filled in automatically.
+
+        Returns:
+            The parsed JSON response.
+
+        Raises:
+            AnalysisError: If KataGo reports an error for the query.
+            EOFError: If the engine exits before responding.
+        """
+        if self._reader.done():
+            raise EOFError("Analysis engine exited")
+
+        query_id = str(self._next_id)
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[query_id] = future
+
+        line = json.dumps({**query, "id": query_id}) + "\n"
+        self.proc.stdin.write(line.encode("utf-8"))
+        await self.proc.stdin.drain()
+        return await future
+
+    async def close(self) -> None:
+        """Close the engine's stdin and wait for it to exit."""
+        if not self.proc.stdin.is_closing():
+            self.proc.stdin.close()
+        await self.proc.wait()
+        await self._reader
+
+    async def __aenter__(self) -> "AsyncAnalysisEngine":
+        """Return the engine; it is closed when the `async with` block exits."""
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        """Close the engine."""
+        await self.close()
+
+    async def _read_responses(self) -> None:
+        """Route each response to the future of the query with the same id."""
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            response = json.loads(line)
+            future = self._pending.get(response.get("id"))
+            if future is None or future.done():
+                continue
+            if "error" in response:
+                del self._pending[response["id"]]
+                future.set_exception(AnalysisError(response["error"]))
+            elif "warning" in response or response.get("isDuringSearch"):
+                # Warnings and partial results are followed by the real response.
+                continue
+            else:
+                del self._pending[response["id"]]
+                future.set_result(response)
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(EOFError("Analysis engine exited"))
+        self._pending.clear()
+
+
+def move_query(
+    game: Game,
+    *,
+    max_visits: Optional[int] = None,
+    rules: str = "tromp-taylor",
+) -> Dict[str, Any]:
+    """Build an analysis query for the move to play in the current position.
+
+    Args:
+        game: The game to analyze. Its moves are replayed from an empty board.
+        max_visits: Maximum number of visits; defaults to KataGo's config.
+        rules: The rules to analyze the game under.
+
+    Returns:
+        A query that analyzes only the latest position of `game`.
+    """
+    moves = []
+    for move_idx, move in enumerate(game.moves):
+        color = Color.BLACK if move_idx % 2 == 0 else Color.WHITE
+        moves.append([str(color), str(move) if move else "pass"])
+
+    query: Dict[str, Any] = {
+        "moves": moves,
+        "rules": rules,
+        "komi": game.komi,
+        "boardXSize": game.board_size,
+        "boardYSize": game.board_size,
+        "analyzeTurns": [len(moves)],
+    }
+    if max_visits is not None:
+        query["maxVisits"] = max_visits
+    return query
+
+
+def best_move(response: Mapping[str, Any]) -> Optional[Move]:
+    """Return the move KataGo ranks first in `response`, or `None` to pass.
+
+    KataGo passes when it reports no candidate moves at all, e.g. when it ran
+    out of visits before expanding any move.
+    """
+    move_infos = response.get("moveInfos")
+    if not move_infos:
+        return None
+    top = min(move_infos, key=lambda info: info["order"])
+    return Move.from_str(top["move"])
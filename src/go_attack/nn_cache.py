@@ -0,0 +1,185 @@
+"""An LRU cache of KataGo's raw neural net outputs, keyed by position.
+
+The white-box policies query `kata-raw-nn` on every turn, but the same
+positions come up again and again across the games of a baseline run, often
+rotated or reflected. The cache maps each position to a canonical orientation,
+the lexicographically smallest of its 8 dihedral transforms, so symmetric
+positions share one entry. The arrays are stored in the canonical orientation
+and transformed back on every hit.
+
+This treats the network as exactly symmetric and independent of the move
+history, which KataGo's network only is approximately, so policies using the
+cache can play different moves than without it. Positions right after a
+capture, and positions that repeat an earlier one, are never cached, since
+which moves are legal there can depend on the history through superko.
+"""
+
+import collections
+import hashlib
+import shelve
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from go_attack.go import Color, Game
+
+RawNNOutputs = Dict[str, Union[float, np.ndarray]]
+
+
+def dihedral_transform(array: np.ndarray, index: int) -> np.ndarray:
+    """Apply the dihedral transform `index`, from 0 to 7, to a square array."""
+    if index >= 4:
+        array = array.T
+    return np.rot90(array, index % 4)
+
+
+def inverse_dihedral_transform(array: np.ndarray, index: int) -> np.ndarray:
+    """Undo `dihedral_transform(array, index)`."""
+    array = np.rot90(array, -(index % 4))
+    return array.T if index >= 4 else array
+
+
+def canonical_position(board: np.ndarray) -> Tuple[bytes, int]:
+    """Return the canonical form of `board` and the transform that gives it.
+
+    Args:
+        board: A square board.
+
+    Returns:
+        The bytes of the smallest of the 8 dihedral transforms of `board`, and
+        the index of the transform for `dihedral_transform`.
+    """
+    candidates = [
+        (np.ascontiguousarray(dihedral_transform(board, i)).tobytes(), i)
+        for i in range(8)
+    ]
+    return min(candidates)
+
+
+def _captured_last_turn(game: Game) -> bool:
+    """Return `True` iff the last move of `game` captured any stones."""
+    if not game.moves or game.moves[-1] is None:
+        return False
+    before, after = game.board_states[-2], game.board_states[-1]
+    empty = Color.EMPTY.value
+    return np.count_nonzero(after != empty) <= np.count_nonzero(before != empty)
+
+
+class NNEvalCache:
+    """An LRU cache of parsed `kata-raw-nn` outputs.
+
+    Entries are keyed by the canonical position, the player to move and komi.
+    When `spill_path` is given, entries evicted from memory are written to a
+    `shelve` database there instead of being dropped, and are read back on a
+    later miss in memory. The database persists across runs with the same
+    path, so it should only be reused with the same network.
+    """
+
+    def __init__(self, maxsize: int = 100_000, spill_path: Optional[Path] = None):
+        """Create an empty cache.
+
+        Args:
+            maxsize: Maximum number of entries to keep in memory.
+            spill_path: Optional path of a database for evicted entries.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "collections.OrderedDict[str, RawNNOutputs]" = (
+            collections.OrderedDict()
+        )
+        self._spill = shelve.open(str(spill_path)) if spill_path else None
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        """Return the number of entries held in memory."""
+        return len(self._entries)
+
+    def evaluate(self, game: Game, query: Callable[[], RawNNOutputs]) -> RawNNOutputs:
+        """Return the outputs for the current position, calling `query` on a miss.
+
+        Args:
+            game: The game whose current position is evaluated.
+            query: Evaluates the current position, i.e. queries `kata-raw-nn`
+                and parses the response.
+
+        Returns:
+            The outputs for the current position, in its own orientation.
+        """
+        if _captured_last_turn(game) or game.is_repetition(
+            game.board_states[-1],
+            turn_idx=-1,
+        ):
+            self.misses += 1
+            return query()
+
+        canonical, transform = canonical_position(game.board_states[-1])
+        key = hashlib.blake2b(
+            canonical + f"/{game.current_player()}/{game.komi}".encode(),
+            digest_size=16,
+        ).hexdigest()
+
+        stored = self._get(key)
+        if stored is None:
+            self.misses += 1
+            outputs = query()
+            self._put(key, self._transform(outputs, transform, inverse=False))
+            return outputs
+
+        self.hits += 1
+        return self._transform(stored, transform, inverse=True)
+
+    def close(self) -> None:
+        """Spill all entries held in memory, if spilling, and close the database."""
+        if self._spill is not None:
+            for key, outputs in self._entries.items():
+                self._spill[key] = outputs
+            self._spill.close()
+            self._spill = None
+        self._entries.clear()
+
+    def __enter__(self) -> "NNEvalCache":
+        """Return the cache; it is closed when the `with` block exits."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the cache."""
+        self.close()
+
+    def _get(self, key: str) -> Optional[RawNNOutputs]:
+        """Look up `key` in memory, then in the spill database."""
+        outputs = self._entries.get(key)
+        if outputs is not None:
+            self._entries.move_to_end(key)
+            return outputs
+        if self._spill is not None and key in self._spill:
+            outputs = self._spill[key]
+            self._put(key, outputs)
+        return outputs
+
+    def _put(self, key: str, outputs: RawNNOutputs) -> None:
+        """Store `outputs` in memory, evicting the least recently used entry."""
+        self._entries[key] = outputs
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            old_key, old_outputs = self._entries.popitem(last=False)
+            if self._spill is not None:
+                self._spill[old_key] = old_outputs
+
+    @staticmethod
+    def _transform(outputs: RawNNOutputs, index: int, inverse: bool) -> RawNNOutputs:
+        """Apply dihedral transform `index`, or its inverse, to the arrays.
+
+        The arrays are always copied, so callers may modify them in place.
+        """
+        fn = inverse_dihedral_transform if inverse else dihedral_transform
+        return {
+            name: fn(value, index).copy() if isinstance(value, np.ndarray) else value
+            for name, value in outputs.items()
+        }
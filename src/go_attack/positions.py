@@ -0,0 +1,274 @@
+"""Export of every position in `.sgfs` files to a memory-mapped array.
+
+`export_positions` replays each game once and writes all of its positions,
+from the empty board to the final one, to a `(num_positions, size, size)`
+uint8 `.npy` file of `Color` values. A sidecar Arrow file indexes the
+positions by game, turn, player to move, the move played from the position and
+the game's result. `PositionDataset` maps both files back into memory, so any
+number of analyses can sample positions without parsing SGFs again.
+
+The positions of each game are contiguous, in order of turn, and games are
+numbered in the order of the files and of the games within each file.
+"""
+
+import multiprocessing
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+
+from go_attack.chains import EMPTY, ChainBoard
+from go_attack.go import Color, IllegalMoveError, Move, parse_sgf_record
+from go_attack.sgf_loader import iter_sgf_strings
+from go_attack.sgf_parsing import root_properties
+
+BOARDS_NAME = "boards.npy"
+INDEX_NAME = "index.arrow"
+
+# Values of the `move` column that aren't points.
+PASS = -1
+NO_MOVE = -2  # The final position of a game
+
+INDEX_SCHEMA = pa.schema(
+    [
+        ("game", pa.int32()),
+        ("turn", pa.int32()),
+        ("player", pa.int8()),  # The `Color` value of the player to move
+        ("move", pa.int16()),  # Flat index of the point in NumPy order
+        ("result", pa.dictionary(pa.int32(), pa.string())),
+    ],
+)
+
+
+def _count_positions(path: Union[str, Path]) -> List[Tuple[int, int]]:
+    """Return the board size and number of positions of each game in `path`."""
+    counts = []
+    for sgf_str in iter_sgf_strings(path):
+        record = parse_sgf_record(sgf_str)
+        counts.append((record.board_size, len(record.moves) + 1))
+    return counts
+
+
+def _play(chains: ChainBoard, board: np.ndarray, color: Color, move: Move) -> int:
+    """Play `move` on `chains` and the flat `board`, returning its point.
+
+    Raises:
+        IllegalMoveError: If the move is off the board or on an occupied point.
+    """
+    x, y = move
+    board_size = chains.board_size
+    if not (0 <= x < board_size and 0 <= y < board_size):
+        raise IllegalMoveError(f"Move {move} is off the board")
+    point = (board_size - 1 - y) * board_size + x
+    if chains.colors[point] != EMPTY:
+        raise IllegalMoveError("Cannot place stone on top of an existing stone")
+    removed = chains.play(point, color.value)
+    board[point] = color.value
+    board[removed] = EMPTY
+    return point
+
+
+def _export_file(
+    task: Tuple[Union[str, Path], Path, int],
+) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Write the positions of the games in a file, starting at a given row.
+
+    Args:
+        task: The path of the `.sgfs` file, the path of the boards array and
+            the row of the first position of the file's first game.
+
+    Returns:
+        The `move` and `player` columns of the file's positions, and each
+        game's result.
+
+    Raises:
+        IllegalMoveError: If a move is off the board or on an occupied point.
+    """
+    path, boards_path, row = task
+    boards = np.load(boards_path, mmap_mode="r+")
+    # Index a plain view, since indexing an `np.memmap` is several times slower.
+    flat = boards.view(np.ndarray).reshape(len(boards), -1)
+    moves_column = []
+    players_column = []
+    results = []
+    for sgf_str in iter_sgf_strings(path):
+        record = parse_sgf_record(sgf_str)
+        board_size = record.board_size
+        results.append(root_properties(sgf_str).get("RE", [""])[0])
+
+        chains = ChainBoard(board_size)
+        # Setup stones, e.g. handicap stones, are already on the first board.
+        flat[row] = EMPTY
+        for color, move in record.setup:
+            _play(chains, flat[row], color, move)
+
+        for color, move in record.moves:
+            players_column.append(color.value)
+            row += 1
+            flat[row] = flat[row - 1]
+            if move is None:
+                moves_column.append(PASS)
+            else:
+                moves_column.append(_play(chains, flat[row], color, move))
+
+        last_color = record.moves[-1][0] if record.moves else Color.WHITE
+        players_column.append(last_color.opponent().value)
+        moves_column.append(NO_MOVE)
+        row += 1
+
+    boards.flush()
+    return (
+        np.array(moves_column, dtype=np.int16),
+        np.array(players_column, dtype=np.int8),
+        results,
+    )
+
+
+def export_positions(
+    paths: Sequence[Union[str, Path]],
+    directory: Union[str, Path],
+    *,
+    processes: Optional[int] = None,
+) -> "PositionDataset":
+    """Export every position of the games in `paths` to `directory`.
+
+    Each file is handled by a single worker, which writes its positions
+    straight into the memory-mapped array. The files are read twice: once to
+    count the positions, so the array can be allocated, and once to replay
+    the games. As in `sgf_loader.final_board`, setup stones are placed on the
+    first board of each game, each move is played by the color the SGF gives
+    it, and moves are only checked for being on the board and on an empty
+    point.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        directory: The directory to write `BOARDS_NAME` and `INDEX_NAME` to.
+            It's created if needed.
+        processes: Number of worker processes. Defaults to the CPU count. With
+            only one file, or `processes=1`, everything runs in this process.
+
+    Returns:
+        The exported positions.
+
+    Raises:
+        ValueError: If there are no games, or they're not all the same size.
+        IllegalMoveError: If a move is off the board or on an occupied point.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    def run(fn: Callable, tasks: Sequence) -> List:
+        if len(tasks) <= 1 or processes == 1:
+            return list(map(fn, tasks))
+        with multiprocessing.Pool(processes) as pool:
+            return pool.map(fn, tasks, chunksize=1)
+
+    per_file = run(_count_positions, list(paths))
+    sizes = {size for counts in per_file for size, _ in counts}
+    if len(sizes) != 1:
+        raise ValueError(f"Expected games of a single board size, got {sizes}")
+    (board_size,) = sizes
+    file_counts = [sum(count for _, count in counts) for counts in per_file]
+    counts = np.array([count for counts in per_file for _, count in counts])
+
+    boards_path = directory / BOARDS_NAME
+    boards = np.lib.format.open_memmap(
+        boards_path,
+        mode="w+",
+        dtype=np.uint8,
+        shape=(int(counts.sum()), board_size, board_size),
+    )
+    del boards  # Workers open the file themselves
+
+    first_rows = np.cumsum([0] + file_counts[:-1])
+    tasks = [(path, boards_path, int(row)) for path, row in zip(paths, first_rows)]
+    exported = run(_export_file, tasks)
+
+    game = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    first_row = np.repeat(np.cumsum(counts) - counts, counts)
+    turn = (np.arange(len(game)) - first_row).astype(np.int32)
+    results = [result for *_, file_results in exported for result in file_results]
+    dictionary, codes = np.unique(results, return_inverse=True)
+    index = pa.Table.from_arrays(
+        [
+            pa.array(game),
+            pa.array(turn),
+            pa.array(np.concatenate([players for _, players, _ in exported])),
+            pa.array(np.concatenate([moves for moves, *_ in exported])),
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.repeat(codes, counts).astype(np.int32)),
+                pa.array(dictionary, type=pa.string()),
+            ),
+        ],
+        schema=INDEX_SCHEMA,
+    )
+    with pa.OSFile(str(directory / INDEX_NAME), "wb") as sink:
+        with pa.ipc.new_file(sink, INDEX_SCHEMA) as writer:
+            writer.write_table(index)
+
+    return PositionDataset(directory)
+
+
+class PositionDataset:
+    """The positions written by `export_positions`, memory-mapped read-only.
+
+    `boards` and `index` are backed by the files, so slicing them or selecting
+    a game's positions with `game_boards` copies nothing.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """Map the positions exported to `directory` into memory."""
+        self.directory = Path(directory)
+        self.boards: np.ndarray = np.load(
+            self.directory / BOARDS_NAME,
+            mmap_mode="r",
+        )
+        source = pa.memory_map(str(self.directory / INDEX_NAME))
+        self.index: pa.Table = pa.ipc.open_file(source).read_all()
+
+        games = self.index.column("game").to_numpy()
+        counts = np.bincount(games, minlength=games[-1] + 1 if len(games) else 0)
+        # The positions of game `i` are rows `offsets[i]` to `offsets[i + 1]`.
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self) -> int:
+        """Return the number of positions."""
+        return len(self.boards)
+
+    @property
+    def board_size(self) -> int:
+        """The size of the boards."""
+        return self.boards.shape[-1]
+
+    @property
+    def num_games(self) -> int:
+        """The number of games."""
+        return len(self.offsets) - 1
+
+    def game_rows(self, game: int) -> slice:
+        """Return the rows of the positions of `game`."""
+        return slice(self.offsets[game], self.offsets[game + 1])
+
+    def game_boards(self, game: int) -> np.ndarray:
+        """Return a view of the positions of `game`, in order of turn."""
+        return self.boards[self.game_rows(game)]
+
+    def turn_rows(
+        self,
+        turn: int,
+        games: Optional[Iterable[int]] = None,
+    ) -> np.ndarray:
+        """Return the rows of the positions at `turn` of the games that reach it.
+
+        Args:
+            turn: The number of moves played before the positions.
+            games: The games to consider, by default all of them.
+
+        Returns:
+            The rows, e.g. to index `boards` or `index` with.
+        """
+        game_ids = np.arange(self.num_games) if games is None else np.array(games)
+        starts = self.offsets[game_ids]
+        reaches = starts + turn < self.offsets[game_ids + 1]
+        return starts[reaches] + turn
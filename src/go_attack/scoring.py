@@ -0,0 +1,204 @@
+"""Scoring of finished games the way KataGo scores them under Tromp-Taylor rules.
+
+`Game.score` implements plain Tromp-Taylor area scoring. KataGo's
+`final_score` differs in one respect: before counting, it removes the
+opponent's stones from every pass-alive territory, i.e. any area that no
+sequence of moves by the opponent could ever take away even if the owner
+always passed. Pass-alive chains and territories are found with Benson's
+algorithm, here computed on whole boards at once with NumPy.
+
+Results can be kept in a `ScoreCache`, so that rescoring a corpus only scores
+the games it hasn't seen before.
+"""
+
+import multiprocessing
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy.ndimage import label
+
+from go_attack.chains import neighbor_values
+from go_attack.go import Color, parse_sgf_record, tromp_taylor_scores
+from go_attack.sgf_loader import record_final_board
+
+# Bump whenever a change can alter the results of `score_sgf`, so that results
+# cached with an older version aren't reused, see `ScoreCache`.
+SCORER_VERSION = 1
+
+
+def pass_alive_area(board: np.ndarray, color: Color) -> np.ndarray:
+    """Return the pass-alive chains and territory of `color` on `board`.
+
+    A region, i.e. a maximal connected set of points without stones of
+    `color`, is vital to a chain of `color` if each of its empty points is a
+    liberty of the chain. Chains with fewer than two vital regions are
+    repeatedly removed, along with the regions they border. The chains that
+    remain are pass-alive, and so is every remaining region vital to one of
+    them.
+
+    Args:
+        board: A (board_size, board_size) array of `Color` values.
+        color: The color whose pass-alive area to find.
+
+    Returns:
+        A boolean mask of the pass-alive stones of `color` and the points of
+        its pass-alive territories, including any opponent stones in them.
+    """
+    own = board == color.value
+    chains, num_chains = label(own)
+    regions, num_regions = label(~own)
+    if not num_chains or not num_regions:
+        return np.zeros_like(own)
+
+    # Every (chain, point of a region) pair where the point touches the chain,
+    # counted once however many sides it touches the chain on.
+    neighbor_chains = neighbor_values(chains, fill=0)
+    touching = (neighbor_chains > 0) & ~own
+    point_ids = np.arange(board.size).reshape(board.shape)
+    point_ids = np.broadcast_to(point_ids, touching.shape)
+    pairs = np.unique(neighbor_chains[touching] * board.size + point_ids[touching])
+    pair_chains, pair_points = np.divmod(pairs, board.size)
+    pair_regions = regions.flat[pair_points]
+
+    border = np.zeros((num_regions + 1, num_chains + 1), dtype=bool)
+    border[pair_regions, pair_chains] = True
+
+    # A region is vital to a chain iff the chain touches all its empty points.
+    empty = board == Color.EMPTY.value
+    pair_empty = empty.flat[pair_points]
+    liberty_counts = np.zeros(border.shape, dtype=np.int64)
+    np.add.at(liberty_counts, (pair_regions[pair_empty], pair_chains[pair_empty]), 1)
+    num_empty = np.bincount(regions[empty], minlength=num_regions + 1)
+    vital = (liberty_counts == num_empty[:, None]) & (num_empty[:, None] > 0)
+
+    alive = np.ones(num_chains + 1, dtype=bool)
+    healthy = np.ones(num_regions + 1, dtype=bool)
+    alive[0] = healthy[0] = False  # Label 0 is every point outside them
+    while True:
+        healthy &= ~np.any(border & ~alive, axis=1)
+        still_alive = alive & (np.sum(vital & healthy[:, None], axis=0) >= 2)
+        if np.array_equal(still_alive, alive):
+            break
+        alive = still_alive
+
+    territory = healthy & np.any(vital & alive, axis=1)
+    return alive[chains] | territory[regions]
+
+
+def katago_scores(board: np.ndarray, komi: float = 0.0) -> Tuple[float, float]:
+    """Score `board` like KataGo's `final_score` under Tromp-Taylor rules.
+
+    Args:
+        board: A (board_size, board_size) array of `Color` values.
+        komi: Komi added to white's score.
+
+    Returns:
+        The (black, white) scores.
+    """
+    cleaned = board.copy()
+    for color in (Color.BLACK, Color.WHITE):
+        area = pass_alive_area(board, color)
+        cleaned[area & (board == color.opponent().value)] = Color.EMPTY.value
+
+    black, white = tromp_taylor_scores(cleaned, komi)
+    return float(black), float(white)
+
+
+def result_string(black: float, white: float) -> str:
+    """Return the result for the given scores as an SGF `RE` value."""
+    if black == white:
+        return "0"
+    return f"B+{black - white:g}" if black > white else f"W+{white - black:g}"
+
+
+def score_sgf(sgf_string: str) -> str:
+    """Score the final position of a game like KataGo, e.g. `B+3.5`.
+
+    The game is set up the way `score_with_katago.py` sets it up on KataGo,
+    including setup stones, and komi is 0 if the game doesn't specify it.
+
+    Raises:
+        IllegalMoveError: If a move is off the board or on an occupied point.
+        ValueError: If the SGF is malformed.
+    """
+    record = parse_sgf_record(sgf_string)
+    board = record_final_board(record)
+    return result_string(*katago_scores(board, record.komi))
+
+
+def score_sgfs(
+    sgf_strings: Sequence[str],
+    processes: Optional[int] = None,
+    chunksize: int = 64,
+) -> List[str]:
+    """Score many games with `score_sgf` on a process pool.
+
+    Args:
+        sgf_strings: The games to score.
+        processes: The number of worker processes, by default one per CPU.
+        chunksize: The number of games sent to a worker at a time.
+
+    Returns:
+        The result of each game, in order.
+    """
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(score_sgf, sgf_strings, chunksize=chunksize)
+
+
+class ScoreCache:
+    """A persistent cache of game results, keyed by a hash of each game.
+
+    The results are stored in an SQLite database, which any number of
+    processes can read while one of them writes. Keys should identify
+    everything a result depends on, i.e. the scorer and its version, the board
+    size, komi, rules and moves, so that results can be shared between runs
+    and corpora.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Open the cache at `path`, creating it if needed."""
+        self.path = Path(path)
+        self._db = sqlite3.connect(self.path, timeout=60.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT)",
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        """Return the number of cached results."""
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, str]:
+        """Return the cached results of those of `keys` that are in the cache."""
+        found: Dict[str, str] = {}
+        # Stay below SQLite's limit on the number of query parameters.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]  # noqa: E203
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                self._db.execute(
+                    f"SELECT key, result FROM results WHERE key IN ({placeholders})",
+                    chunk,
+                ),
+            )
+        return found
+
+    def put_many(self, results: Iterable[Tuple[str, str]]) -> None:
+        """Durably store (key, result) pairs, replacing any with the same key."""
+        self._db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?)", results)
+        self._db.commit()
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def __enter__(self) -> "ScoreCache":
+        """Return the cache; it is closed when the `with` block exits."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the cache."""
+        self.close()
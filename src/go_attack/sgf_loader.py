@@ -0,0 +1,181 @@
+"""Bulk loading of Go games from `.sgfs` files.
+
+An `.sgfs` file holds one SGF game per line, as written by KataGo. The loaders
+here stream those files line by line, extract the moves with the scanner from
+`sgf_parsing`, and replay them on the incremental chain engine instead of
+building an `sgfmill` game tree.
+"""
+
+import functools
+import itertools
+import multiprocessing
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from go_attack.chains import EMPTY, ChainBoard
+from go_attack.go import (
+    Color,
+    Game,
+    IllegalMoveError,
+    Move,
+    SgfRecord,
+    parse_sgf_record,
+)
+
+LoadedGame = Union[Game, np.ndarray]
+
+
+def iter_sgf_strings(path: Union[str, Path]) -> Iterator[str]:
+    """Yield the SGF strings in the `.sgfs` file at `path`, one per line."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def final_board(
+    board_size: int,
+    moves: Sequence[Optional[Move]],
+    *,
+    colors: Optional[Sequence[Color]] = None,
+    setup: Sequence[Tuple[Color, Move]] = (),
+) -> np.ndarray:
+    """Replay `moves` from an empty board and return the final board.
+
+    Stones are placed and captures resolved under Tromp-Taylor rules, but
+    superko is not checked and no intermediate boards are kept.
+
+    Args:
+        board_size: The size of the board.
+        moves: The moves of the game, with `None` for passes.
+        colors: The color of each move. By default, black moves first and the
+            players alternate.
+        setup: Stones placed before the first move, e.g. handicap stones.
+            They are placed like moves, so they can capture.
+
+    Returns:
+        The final board, oriented like `Game.board_states`.
+
+    Raises:
+        IllegalMoveError: If a move is off the board or on an occupied point.
+    """
+    chains = ChainBoard(board_size)
+    if colors is None:
+        colors = [(Color.BLACK, Color.WHITE)[turn % 2] for turn in range(len(moves))]
+    for color, move in itertools.chain(setup, zip(colors, moves)):
+        if move is None:
+            continue
+
+        x, y = move
+        if not (0 <= x < board_size and 0 <= y < board_size):
+            raise IllegalMoveError(f"Move {move} is off the board")
+        point = (board_size - 1 - y) * board_size + x
+        if chains.colors[point] != EMPTY:
+            raise IllegalMoveError("Cannot place stone on top of an existing stone")
+        chains.play(point, color.value)
+
+    return chains.to_array()
+
+
+def record_final_board(record: SgfRecord) -> np.ndarray:
+    """Return the final board of a game read with `parse_sgf_record`.
+
+    The setup stones are placed first, and every move is played by the color
+    the SGF gives it, see `final_board`.
+    """
+    return final_board(
+        record.board_size,
+        [move for _, move in record.moves],
+        colors=[color for color, _ in record.moves],
+        setup=record.setup,
+    )
+
+
+def load_sgfs(
+    path: Union[str, Path],
+    *,
+    check_legal: bool = False,
+    final_position_only: bool = False,
+    compact_history: bool = True,
+) -> Iterator[LoadedGame]:
+    """Lazily load every game in the `.sgfs` file at `path`.
+
+    Args:
+        path: Path to an `.sgfs` file.
+        check_legal: Whether to check every move for legality, including
+            positional superko. KataGo only writes legal games, so this is off
+            by default.
+        final_position_only: If set, yield only the final board of each game
+            instead of a `Game`. Without `check_legal`, games may then have
+            setup stones, e.g. handicap stones, and moves in any order, as
+            `Game` doesn't support either.
+        compact_history: Whether the yielded `Game`s use `CompactBoardHistory`.
+
+    Yields:
+        A `Game`, or the final board if `final_position_only` is set, for each
+        game in the file.
+    """
+    for sgf_str in iter_sgf_strings(path):
+        if final_position_only and not check_legal:
+            yield record_final_board(parse_sgf_record(sgf_str))
+            continue
+
+        game = Game.from_sgf(
+            sgf_str,
+            check_legal=check_legal,
+            compact_history=compact_history,
+        )
+        yield game.board_states[-1] if final_position_only else game
+
+
+def _load_file(path: Union[str, Path], **kwargs) -> List[LoadedGame]:
+    """Load all the games in one file; used by worker processes."""
+    return list(load_sgfs(path, **kwargs))
+
+
+def load_sgfs_parallel(
+    paths: Sequence[Union[str, Path]],
+    *,
+    processes: Optional[int] = None,
+    check_legal: bool = False,
+    final_position_only: bool = False,
+    compact_history: bool = True,
+) -> Iterator[LoadedGame]:
+    """Load the games in several `.sgfs` files using a pool of processes.
+
+    Each file is loaded by a single worker, and the games come back in the
+    order of `paths` and of the games within each file. With only one file, or
+    `processes=1`, the games are loaded lazily in the current process.
+
+    Args:
+        paths: Paths to `.sgfs` files.
+        processes: Number of worker processes. Defaults to the CPU count.
+        check_legal: See `load_sgfs`.
+        final_position_only: See `load_sgfs`.
+        compact_history: See `load_sgfs`.
+
+    Yields:
+        The loaded games, as described in `load_sgfs`.
+    """
+    load_file = functools.partial(
+        _load_file,
+        check_legal=check_legal,
+        final_position_only=final_position_only,
+        compact_history=compact_history,
+    )
+    if len(paths) <= 1 or processes == 1:
+        for path in paths:
+            yield from load_sgfs(
+                path,
+                check_legal=check_legal,
+                final_position_only=final_position_only,
+                compact_history=compact_history,
+            )
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for games in pool.imap(load_file, paths):
+            yield from games
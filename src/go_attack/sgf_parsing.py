@@ -0,0 +1,114 @@
+"""Fast scanning of raw SGF strings without building a game tree.
+
+These helpers split an SGF string into property values and the text between
+them with one linear-time regex, and then only walk the short stretches of
+text between values. They are meant for the flat, single-line games written by
+KataGo, but handle escaped characters and variations correctly.
+"""
+
+import re
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+# A property value: everything up to the first unescaped `]`. The loop is
+# unrolled so that matching never backtracks.
+_VALUE_RE = re.compile(r"\[([^\]\\]*(?:\\.[^\]\\]*)*)\]", re.DOTALL)
+
+
+class SgfProperty(NamedTuple):
+    """A single value of an SGF property."""
+
+    node: int  # Index of the node on the main line; the root is node 0
+    ident: str  # Property identifier, e.g. "B" or "KM"
+    value: str  # Raw value, with SGF escapes left in place
+
+
+def split_values(sgf_str: str) -> Tuple[List[str], List[str]]:
+    """Split `sgf_str` into the text between property values and the values.
+
+    Returns:
+        A (texts, values) tuple, where `values[i]` comes right after `texts[i]`
+        and `len(texts) == len(values) + 1`.
+
+    Raises:
+        ValueError: If a property value is not terminated.
+    """
+    parts = _VALUE_RE.split(sgf_str)
+    texts, values = parts[::2], parts[1::2]
+    if any("[" in text for text in texts):
+        raise ValueError("Unterminated SGF property value")
+    return texts, values
+
+
+def iter_properties(sgf_str: str) -> Iterator[SgfProperty]:
+    """Yield the property values on the main line of the first game in `sgf_str`.
+
+    At every branching point, only the first variation is followed.
+
+    Args:
+        sgf_str: A string holding an SGF game.
+
+    Yields:
+        The property values in the order they appear.
+    """
+    texts, values = split_values(sgf_str)
+    node, depth = -1, 0
+    ident, ident_done = "", False
+    # Once the first variation at some depth ends, we skip its siblings by
+    # ignoring everything until the depth drops below `skip_below`.
+    skip_below = None
+
+    for i, text in enumerate(texts):
+        for char in text:
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    return  # End of the first game
+                if skip_below is None:
+                    skip_below = depth
+                elif depth < skip_below:
+                    skip_below = depth
+            elif skip_below is not None:
+                pass
+            elif char == ";":
+                node += 1
+                ident, ident_done = "", False
+            elif "A" <= char <= "Z":
+                if ident_done:
+                    ident, ident_done = "", False
+                ident += char
+
+        if i < len(values):
+            if skip_below is None and node >= 0:
+                yield SgfProperty(node, ident, values[i])
+            ident_done = True
+
+
+def root_properties(sgf_str: str) -> Dict[str, List[str]]:
+    """Return the properties of the root node of `sgf_str`."""
+    props: Dict[str, List[str]] = {}
+    for prop in iter_properties(sgf_str):
+        if prop.node > 0:
+            break
+        props.setdefault(prop.ident, []).append(prop.value)
+    return props
+
+
+def has_variations(sgf_str: str) -> bool:
+    """Return `True` iff the first game in `sgf_str` has more than one variation."""
+    if sgf_str.count("(") <= 1:
+        return False
+
+    depth = 0
+    for text in split_values(sgf_str)[0]:
+        for char in text:
+            if char == "(":
+                depth += 1
+                if depth > 1:
+                    return True
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    return False
+    return False
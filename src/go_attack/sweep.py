@@ -0,0 +1,165 @@
+"""Scheduling of baseline attack sweeps over several GPUs.
+
+A sweep is split into work units of a few games each. The units of each
+configuration are queued on one GPU, with configurations spread over the GPUs
+so that their expected costs balance. Each worker serves the queue of its own
+GPU, taking the most expensive units first, and once that queue is empty it
+steals the cheapest units from the back of the longest other queue. So no
+worker sits idle while any work is left, and configurations mostly stay on one
+GPU, where their engines are already warm.
+"""
+
+import multiprocessing
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+R = TypeVar("R")
+
+
+class WorkUnit(NamedTuple):
+    """A contiguous block of games from one configuration of a sweep."""
+
+    config_idx: int  # Index of the configuration in the sweep
+    config: Tuple[Any, ...]  # Positional arguments of `run_baseline_attack`
+    first_game: int
+    num_games: int
+    cost: float  # Expected cost, in arbitrary units
+
+
+def make_work_units(
+    configs: Sequence[Tuple[Any, ...]],
+    num_games: int,
+    games_per_unit: int,
+    cost_per_game: Callable[[Tuple[Any, ...]], float],
+) -> List[WorkUnit]:
+    """Split every configuration of a sweep into work units.
+
+    Args:
+        configs: The configurations of the sweep.
+        num_games: The number of games to play for every configuration.
+        games_per_unit: The maximum number of games in a unit.
+        cost_per_game: The expected cost of one game of a configuration.
+
+    Returns:
+        The work units, in order of configuration and game.
+    """
+    units = []
+    for config_idx, config in enumerate(configs):
+        cost = cost_per_game(config)
+        for first_game in range(0, num_games, games_per_unit):
+            size = min(games_per_unit, num_games - first_game)
+            units.append(WorkUnit(config_idx, config, first_game, size, cost * size))
+    return units
+
+
+def assign_to_queues(
+    units: Sequence[WorkUnit],
+    num_queues: int,
+) -> List[List[WorkUnit]]:
+    """Spread work units over `num_queues` queues, keeping configurations together.
+
+    Configurations are assigned greedily, most expensive first, to the queue
+    with the least total cost so far. Each queue is sorted by decreasing cost.
+
+    Args:
+        units: The work units of a sweep.
+        num_queues: The number of queues, usually one per GPU.
+
+    Returns:
+        The units of each queue.
+    """
+    by_config: Dict[int, List[WorkUnit]] = {}
+    for unit in units:
+        by_config.setdefault(unit.config_idx, []).append(unit)
+
+    queues: List[List[WorkUnit]] = [[] for _ in range(num_queues)]
+    loads = [0.0] * num_queues
+    groups = sorted(by_config.values(), key=lambda g: -sum(u.cost for u in g))
+    for group in groups:
+        queue_idx = loads.index(min(loads))
+        queues[queue_idx].extend(group)
+        loads[queue_idx] += sum(unit.cost for unit in group)
+
+    for queue in queues:
+        queue.sort(key=lambda unit: -unit.cost)
+    return queues
+
+
+# Set in each worker process by `_init_worker`.
+_queues: List[Any] = []
+_lock: Any = None
+_run_unit: Any = None
+
+
+def _init_worker(queues, lock, run_unit) -> None:
+    global _queues, _lock, _run_unit
+    _queues, _lock, _run_unit = queues, lock, run_unit
+
+
+def _next_unit(home: int) -> Optional[Tuple[WorkUnit, bool]]:
+    """Pop the next unit for a worker on queue `home`, and whether it's stolen."""
+    with _lock:
+        if len(_queues[home]):
+            return _queues[home].pop(0), False
+
+        lengths = [len(queue) for queue in _queues]
+        victim = lengths.index(max(lengths))
+        if not lengths[victim]:
+            return None
+        return _queues[victim].pop(), True
+
+
+def _work(home: int) -> List[Tuple[WorkUnit, Any]]:
+    """Run units until all queues are empty, starting with queue `home`."""
+    results = []
+    while (next_unit := _next_unit(home)) is not None:
+        unit, stolen = next_unit
+        if stolen:
+            print(
+                f"Worker for queue {home} took games {unit.first_game} to "
+                f"{unit.first_game + unit.num_games - 1} of configuration "
+                f"{unit.config_idx}",
+            )
+        results.append((unit, _run_unit(unit, home)))
+    return results
+
+
+def run_work_stealing(
+    queues: Sequence[Sequence[WorkUnit]],
+    run_unit: Callable[[WorkUnit, int], R],
+    workers_per_queue: int,
+) -> List[Tuple[WorkUnit, R]]:
+    """Run all work units on a pool of processes with work stealing.
+
+    Args:
+        queues: The initial units of each queue, e.g. from `assign_to_queues`.
+        run_unit: Runs a unit given the index of the worker's own queue, which
+            is not necessarily the queue the unit came from. It must be
+            picklable.
+        workers_per_queue: The number of worker processes serving each queue.
+
+    Returns:
+        Every unit with its result, in no particular order.
+    """
+    num_workers = len(queues) * workers_per_queue
+    with multiprocessing.Manager() as manager:
+        shared = [manager.list(queue) for queue in queues]
+        lock = manager.Lock()
+        with multiprocessing.Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(shared, lock, run_unit),
+        ) as pool:
+            homes = [i % len(queues) for i in range(num_workers)]
+            per_worker = pool.map(_work, homes, chunksize=1)
+
+    return [result for results in per_worker for result in results]
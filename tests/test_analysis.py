@@ -0,0 +1,93 @@
+"""Unit tests for the `analysis` module."""
+
+import pathlib
+
+import pyarrow.parquet as pq
+
+from go_attack.analysis import (
+    analysis_table,
+    compact_analyses,
+    load_analysis,
+    parse_analysis,
+    write_analyses,
+)
+
+LINE = (
+    "info move Q16 visits 12 edgeVisits 12 utility 0.02 winrate 0.51 "
+    "scoreMean 0.4 scoreStdev 30.1 scoreLead 0.4 scoreSelfplay 0.5 "
+    "prior 0.25 lcb 0.48 utilityLcb -0.1 order 0 pv Q16 D4 pass "
+    "info move D4 visits 3 utility 0.01 winrate 0.49 scoreLead -0.2 "
+    "prior 0.2 lcb 0.3 order 1 pv D4 pvVisits 3"
+)
+
+
+def test_parse_analysis():
+    """Checks each candidate move is parsed into typed fields."""
+    first, second = parse_analysis(LINE, turn=7)
+    assert first == {
+        "turn": 7,
+        "move": "Q16",
+        "visits": 12,
+        "winrate": 0.51,
+        "scoreLead": 0.4,
+        "prior": 0.25,
+        "lcb": 0.48,
+        "order": 0,
+        "pvLength": 3,
+    }
+    assert second["move"] == "D4"
+    assert second["order"] == 1
+    assert second["pvLength"] == 1
+    assert parse_analysis("", turn=0) == []
+
+
+def test_write_and_load_analysis(tmp_path: pathlib.Path):
+    """Checks games are stored as row groups and filtered on load."""
+    path = tmp_path / "analyses.parquet"
+    tables = [
+        analysis_table(game, parse_analysis(LINE, turn))
+        for game in range(3)
+        for turn in (0, 2)
+    ]
+    write_analyses(path, tables)
+    assert pq.ParquetFile(path).num_row_groups == 6
+    assert not list(tmp_path.glob("*.tmp"))
+
+    everything = load_analysis(path)
+    assert len(everything) == 12
+    assert everything["visits"].dtype == "int64"
+
+    some = load_analysis(tmp_path, games=[1], turns=[2], columns=["game", "move"])
+    assert list(some.columns) == ["game", "move"]
+    assert some.values.tolist() == [[1, "Q16"], [1, "D4"]]
+
+
+def test_compact_analyses(tmp_path: pathlib.Path):
+    """Checks files are merged without duplicates and filtered by game."""
+    paths = [tmp_path / "merged.parquet", tmp_path / "part.parquet"]
+    # As after a crash right after merging: the part was already merged.
+    for path, games in zip(paths, [(0, 1, 2), (1, 2, 3)]):
+        tables = [analysis_table(game, parse_analysis(LINE, 0)) for game in games]
+        write_analyses(path, tables)
+
+    compact_analyses(paths, paths[0], keep_games={0, 2, 3})
+    assert [path.name for path in tmp_path.iterdir()] == ["merged.parquet"]
+    assert pq.ParquetFile(paths[0]).num_row_groups == 3
+    assert load_analysis(paths[0])["game"].tolist() == [0, 0, 2, 2, 3, 3]
+
+
+def test_load_text_analysis(tmp_path: pathlib.Path):
+    """Checks the text files of older runs can still be loaded."""
+    path = tmp_path / "game_0.txt"
+    path.write_text(f"{LINE}\n\n{LINE}")
+    analyses = load_analysis(path)
+    assert analyses["move"].tolist() == ["Q16", "D4"] * 2
+    assert analyses["analysis_index"].tolist() == [0, 0, 1, 1]
+    assert analyses["game"].isna().all() and analyses["turn"].isna().all()
+    # Fields that newer runs don't store are kept too.
+    assert analyses["utility"].tolist() == [0.02, 0.01] * 2
+    assert analyses["scoreMean"].tolist()[0] == 0.4
+    assert analyses["edgeVisits"].isna().tolist() == [False, True] * 2
+
+    some = load_analysis(path, turns=[1])
+    assert some.empty
@@ -0,0 +1,238 @@
+"""Unit tests for the `baseline_attack` module."""
+
+import asyncio
+import pathlib
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+from go_attack.adversarial_policy import EdgePolicy, PassingWrapper
+from go_attack.analysis import load_analysis
+from go_attack.baseline_attack import (
+    EngineError,
+    EnginePool,
+    rollout_policies_async,
+    run_baseline_attack,
+)
+from go_attack.go import Color, Game
+from go_attack.gtp import AsyncGTPEngine
+
+TESTDATA = pathlib.Path(__file__).absolute().parent / "testdata"
+FAKE_ENGINE = TESTDATA / "fake_gtp_engine.py"
+
+
+def _wrap_script(tmp_path: pathlib.Path, script: pathlib.Path) -> pathlib.Path:
+    """Returns an executable that runs the Python `script`."""
+    executable = tmp_path / script.stem
+    executable.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}"\n')
+    executable.chmod(0o755)
+    return executable
+
+
+@pytest.fixture
+def fake_engine(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Returns an executable that runs the fake GTP engine."""
+    return _wrap_script(tmp_path, FAKE_ENGINE)
+
+
+def test_engine_pool_reuses_and_restarts(fake_engine: pathlib.Path):
+    """Checks `EnginePool` reuses idle engines and replaces dead ones."""
+    with EnginePool() as pool:
+        with pool.lease(fake_engine, "leela", board_size=9, komi=7.5) as engine:
+            pid = engine.proc.pid
+            assert engine.command("name") == "fake"
+            with pytest.raises(EngineError):
+                engine.command("boardsize nine")
+
+        with pool.lease(fake_engine, "leela", board_size=19, komi=6.5) as engine:
+            assert engine.proc.pid == pid
+            # Engines with different settings are never shared.
+            with pool.lease(fake_engine, "elf", board_size=19, komi=6.5) as other:
+                assert other.proc.pid != pid
+            engine.proc.kill()
+            engine.proc.wait()
+
+        # The dead engine is not handed out again.
+        with pool.lease(fake_engine, "leela", board_size=19, komi=6.5) as engine:
+            assert engine.proc.pid != pid
+            assert engine.is_alive()
+
+
+def test_run_baseline_attack_with_pool(fake_engine: pathlib.Path):
+    """Checks `run_baseline_attack` plays full games against a pooled engine."""
+    with EnginePool() as pool:
+        for _ in range(2):
+            games = run_baseline_attack(
+                "edge",
+                config_path=pathlib.Path("unused.cfg"),
+                engine_pool=pool,
+                engine_type="leela",
+                executable_path=fake_engine,
+                num_games=2,
+                progress_bar=False,
+            )
+            assert len(games) == 2
+            assert all(game.is_over() for game in games)
+        assert len(pool._idle) == 1
+
+
+def test_run_baseline_attack_no_games(fake_engine: pathlib.Path, capsys):
+    """Checks a run without games reports that instead of failing."""
+    games = run_baseline_attack(
+        "edge",
+        config_path=pathlib.Path("unused.cfg"),
+        engine_type="leela",
+        executable_path=fake_engine,
+        num_games=0,
+        progress_bar=False,
+    )
+    assert list(games) == []
+    assert "No games" in capsys.readouterr().out
+
+
+def test_run_baseline_attack_split(fake_engine: pathlib.Path):
+    """Checks a run split with `first_game` plays the same games."""
+    kwargs = dict(
+        board_size=9,
+        config_path=pathlib.Path("unused.cfg"),
+        engine_type="leela",
+        executable_path=fake_engine,
+        progress_bar=False,
+    )
+    with EnginePool() as pool:
+        whole = run_baseline_attack("random", engine_pool=pool, num_games=4, **kwargs)
+        parts = [
+            run_baseline_attack(
+                "random",
+                engine_pool=pool,
+                first_game=first_game,
+                num_games=2,
+                **kwargs,
+            )
+            for first_game in [2, 0]
+        ]
+    assert [game.moves for game in whole] == [
+        game.moves for game in parts[1] + parts[0]
+    ]
+
+
+def test_run_baseline_attack_resumes(fake_engine: pathlib.Path, tmp_path):
+    """Checks a rerun skips the games recorded in the journal."""
+    kwargs = dict(
+        board_size=9,
+        config_path=pathlib.Path("unused.cfg"),
+        engine_type="leela",
+        executable_path=fake_engine,
+        log_root=tmp_path,
+        num_games=4,
+        progress_bar=False,
+    )
+    games = run_baseline_attack("random", **kwargs)
+    (journal_path,) = tmp_path.glob("*/journal.jsonl")
+    records = journal_path.read_text().splitlines()
+    assert len(records) == 5  # The settings of the run, then the games
+
+    # Forget the last two games, as if the run had been killed.
+    journal_path.write_text("\n".join(records[:3]) + "\n")
+    resumed = run_baseline_attack("random", **kwargs)
+    assert [game.moves for game in resumed] == [game.moves for game in games]
+    assert journal_path.read_text().splitlines()[:3] == records[:3]
+    assert len(journal_path.read_text().splitlines()) == 5
+
+    # The log directory doesn't name komi, but the journal refuses it.
+    with pytest.raises(ValueError, match="different settings: komi"):
+        run_baseline_attack("random", **{**kwargs, "komi": 7.5})
+
+
+def test_run_baseline_attack_sgfs_output(fake_engine: pathlib.Path, tmp_path):
+    """Checks games can be streamed to one `.sgfs` file and resumed from it."""
+    kwargs = dict(
+        board_size=9,
+        config_path=pathlib.Path("unused.cfg"),
+        engine_type="leela",
+        executable_path=fake_engine,
+        log_root=tmp_path,
+        log_analysis=True,
+        num_games=3,
+        output_format="sgfs",
+        progress_bar=False,
+    )
+    games = run_baseline_attack("random", **kwargs)
+    (sgfs_path,) = tmp_path.glob("*/games_0.sgfs")
+    assert len(sgfs_path.read_text().splitlines()) == 3
+    assert not list(tmp_path.glob("*/*.sgf"))
+
+    analyses = load_analysis(sgfs_path.parent / "analyses")
+    assert sorted(set(analyses["game"])) == [0, 1, 2]
+    assert analyses["move"].tolist() == ["pass", "A1"] * (len(analyses) // 2)
+
+    # Forget the last game, as if the run had been killed after writing it
+    # but before journaling it; it is played again but stored once.
+    journal_path = sgfs_path.parent / "journal.jsonl"
+    records = journal_path.read_text().splitlines()
+    journal_path.write_text("\n".join(records[:-1]) + "\n")
+    kwargs["num_games"] = 4
+    resumed = run_baseline_attack("random", **kwargs)
+    assert [game.moves for game in resumed[:3]] == [game.moves for game in games]
+    assert len(sgfs_path.read_text().splitlines()) == 4
+    # The analyses of the forgotten game were dropped before it was replayed.
+    analysis_dir = sgfs_path.parent / "analyses"
+    assert [path.name for path in analysis_dir.iterdir()] == ["games_0.parquet"]
+    resumed_analyses = load_analysis(analysis_dir)
+    replayed = resumed_analyses[resumed_analyses["game"] < 3].reset_index(drop=True)
+    pd.testing.assert_frame_equal(replayed, analyses)
+    assert sorted(set(resumed_analyses["game"])) == [0, 1, 2, 3]
+
+
+def test_run_baseline_attack_analysis_backend(tmp_path: pathlib.Path):
+    """Checks the analysis backend plays all the games through one engine."""
+    executable = _wrap_script(tmp_path, TESTDATA / "fake_analysis_engine.py")
+    games = run_baseline_attack(
+        "edge",
+        pathlib.Path("unused.bin.gz"),
+        gpu=0,
+        board_size=9,
+        config_path=pathlib.Path("unused.cfg"),
+        engine_type="katago",
+        executable_path=executable,
+        log_root=tmp_path / "logs",
+        num_games=4,
+        progress_bar=False,
+        victim_backend="analysis",
+    )
+    assert len(games) == 4
+    # The fake victim plays black and always passes, so white wins.
+    assert all(game.is_over() for game in games)
+    assert all(game.winner() == Color.WHITE for game in games)
+    assert len(list((tmp_path / "logs").glob("**/game_*.sgf"))) == 4
+
+
+def test_rollout_policies_async():
+    """Checks concurrent async rollouts share a few engines correctly."""
+    random.seed(0)
+    victim_color = Color.WHITE
+    rollouts = []
+    for board_size in [5, 7, 9, 9, 7, 5]:
+        game = Game(board_size=board_size)
+        policy = EdgePolicy(game, victim_color.opponent(), False)
+        rollouts.append((game, PassingWrapper(policy)))
+
+    async def run():
+        engines = await asyncio.gather(
+            *(AsyncGTPEngine.start([sys.executable, str(FAKE_ENGINE)]) for _ in "ab"),
+        )
+        try:
+            return await rollout_policies_async(rollouts, victim_color, engines)
+        finally:
+            await asyncio.gather(*(engine.close() for engine in engines))
+
+    results = asyncio.run(run())
+    for (game, _), (result, analyses) in zip(rollouts, results):
+        assert result is game
+        assert analyses == []
+        # The fake victim always passes, so black plays one stone and then
+        # passes to win on area.
+        assert len(game.moves) == 3 and game.moves[1:] == [None, None]
+        assert game.winner() == Color.BLACK
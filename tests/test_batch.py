@@ -0,0 +1,83 @@
+"""Unit tests for the `batch` module."""
+
+import random
+
+import numpy as np
+import pytest
+
+from go_attack.adversarial_policy import POLICIES
+from go_attack.batch import GameBatch
+from go_attack.go import Color, Game, IllegalMoveError, Move, cartesian_to_numpy
+
+
+@pytest.mark.parametrize("allow_suicide", [False, True])
+def test_batch_matches_games(allow_suicide: bool):
+    """Checks `GameBatch` agrees with independently played `Game`s."""
+    rng = random.Random(0)
+    batch = GameBatch(num_games=8, board_size=5, komi=0.5)
+    games = [Game(board_size=5, komi=0.5) for _ in range(len(batch))]
+
+    for _ in range(100):
+        masks = batch.legal_move_masks(allow_suicide=allow_suicide)
+        moves = []
+        for game, mask in zip(games, masks):
+            legal_moves = list(game.legal_moves(allow_suicide=allow_suicide))
+            np.testing.assert_array_equal(
+                mask,
+                game.legal_move_mask(allow_suicide=allow_suicide),
+            )
+            if game.is_over() or not legal_moves or rng.random() < 0.05:
+                moves.append(None)
+            else:
+                moves.append(rng.choice(legal_moves))
+
+        batch.play_moves(moves)
+        for game, move, board in zip(games, moves, batch.boards):
+            if not game.is_over():
+                game.play_move(move)
+            np.testing.assert_array_equal(game.board_states[-1], board)
+
+    black, white = batch.score()
+    for game_idx, game in enumerate(games):
+        assert game.score() == (black[game_idx], white[game_idx])
+        assert batch.game(game_idx).moves == game.moves
+
+
+def test_play_moves_rejects_illegal_moves():
+    """Checks `GameBatch.play_moves` raises on occupied points."""
+    batch = GameBatch(num_games=2, board_size=3)
+    batch.play_moves([Move(1, 1), None])
+    with pytest.raises(IllegalMoveError):
+        batch.play_moves([Move(1, 1), Move(0, 0)])
+
+
+@pytest.mark.parametrize("policy_name", ["edge", "mirror", "pass", "random", "spiral"])
+def test_batch_next_moves_are_legal(policy_name: str):
+    """Checks batched hardcoded policies only pick legal moves."""
+    random.seed(0)
+    policy_cls = POLICIES[policy_name]
+    batch = GameBatch(num_games=4, board_size=7)
+
+    for _ in range(30):
+        masks = batch.legal_move_masks(allow_suicide=False)
+        moves = policy_cls.batch_next_moves(batch, allow_suicide=False)
+        for game_idx, move in enumerate(moves):
+            if move is not None:
+                assert masks[game_idx][cartesian_to_numpy(*move)]
+
+        batch.play_moves(moves)
+        # Let the "victim" play a random move so the games progress.
+        batch.play_moves(POLICIES["random"].batch_next_moves(batch, False))
+
+
+def test_spiral_batch_matches_single_game():
+    """Checks `SpiralPolicy.batch_next_moves` matches `SpiralPolicy.next_move`."""
+    batch = GameBatch(num_games=1, board_size=5)
+    game = Game(board_size=5)
+    policy = POLICIES["spiral"](game, Color.BLACK, allow_suicide=False)
+
+    for _ in range(10):
+        (move,) = type(policy).batch_next_moves(batch, allow_suicide=False)
+        assert move == policy.next_move()
+        batch.play_moves([move])
+        game.play_move(move)
@@ -2,9 +2,10 @@
 
 from itertools import product
 
+import numpy as np
 import pytest
 
-from go_attack.board_utils import mirror_move
+from go_attack.board_utils import mirror_move, parse_array, parse_raw_nn
 from go_attack.go import Move
 
 
@@ -24,3 +25,38 @@ def test_mirror_move(board_size: int):
         # mirroring a move twice should return the original move
         assert move.x == mirrored2.x
         assert move.y == mirrored2.y
+
+
+RAW_NN_RESPONSE = """symmetry 0
+whiteWin 0.25
+whiteLead -3.5
+policy
+0.1 0.2 NAN
+-0.5 0.3 0.4
+NAN NAN 0.0
+policyPass 0.05
+whiteOwnership
+1 0 -1
+0.5 -0.5 0
+-1 1 0.25
+"""
+
+
+def test_parse_raw_nn():
+    """Checks every output of `kata-raw-nn` is parsed in one pass."""
+    outputs = parse_raw_nn(RAW_NN_RESPONSE, 3)
+    assert outputs["whiteWin"] == 0.25
+    assert outputs["whiteLead"] == -3.5
+    assert outputs["policyPass"] == 0.05
+
+    policy = outputs["policy"]
+    assert policy.shape == (3, 3)
+    np.testing.assert_array_equal(np.isnan(policy), [[0, 0, 1], [0, 0, 0], [1, 1, 0]])
+    assert policy[1, 0] == -0.5
+    np.testing.assert_array_equal(
+        parse_array(RAW_NN_RESPONSE, "whiteOwnership", 3),
+        [[1, 0, -1], [0.5, -0.5, 0], [-1, 1, 0.25]],
+    )
+
+    with pytest.raises(ValueError):
+        parse_raw_nn(RAW_NN_RESPONSE, 4)
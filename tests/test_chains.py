@@ -0,0 +1,67 @@
+"""Unit tests for the `chains` module."""
+
+import numpy as np
+import pytest
+
+from go_attack.chains import ChainBoard
+from go_attack.go import Color, Game
+
+
+@pytest.mark.parametrize("board_size", [5, 9])
+def test_play_matches_full_board_clearing(board_size: int):
+    """Checks `ChainBoard.play` agrees with clearing the whole board."""
+    rng = np.random.default_rng(board_size)
+    board = np.zeros((board_size, board_size), dtype=np.uint8)
+    chains = ChainBoard.from_array(board)
+
+    for turn in range(200):
+        color = Color.BLACK if turn % 2 == 0 else Color.WHITE
+        empties = np.flatnonzero(board == Color.EMPTY.value)
+        point = int(rng.choice(empties))
+
+        expected = board.copy()
+        expected.flat[point] = color.value
+        Game._clear_color(expected, color.opponent())
+        Game._clear_color(expected, color)
+
+        removed = chains.removed_by(point, color.value)
+        assert sorted(chains.play(point, color.value)) == sorted(removed)
+        np.testing.assert_array_equal(chains.to_array(), expected)
+        board = expected
+
+        # Rebuilding from scratch must give the same liberties.
+        rebuilt = ChainBoard.from_array(board)
+        for stone in np.flatnonzero(board):
+            assert rebuilt.liberties(stone) == chains.liberties(stone)
+
+
+def test_removed_by():
+    """Checks `ChainBoard.removed_by` for captures and suicide."""
+    chains = ChainBoard.from_array(
+        np.array(
+            [
+                [0, 2, 1],
+                [2, 1, 0],
+                [0, 0, 0],
+            ],
+        ),
+    )
+    # Black in the top left corner captures the white stone next to it.
+    assert chains.removed_by(0, Color.BLACK.value) == [1]
+    assert not chains.is_suicide(0, Color.BLACK.value)
+    # White there connects to a chain with another liberty.
+    assert chains.removed_by(0, Color.WHITE.value) == []
+    # White next to the top right corner captures the black stone there.
+    assert chains.removed_by(5, Color.WHITE.value) == [2]
+
+    chains = ChainBoard.from_array(
+        np.array(
+            [
+                [0, 2, 0],
+                [2, 2, 0],
+                [0, 0, 0],
+            ],
+        ),
+    )
+    assert chains.is_suicide(0, Color.BLACK.value)
+    assert chains.removed_by(0, Color.BLACK.value) == [0]
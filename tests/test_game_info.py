@@ -1,7 +1,10 @@
 """Tests for `go_attack.game_info`."""
 
+import os
 import pathlib
+import shutil
 
+import pandas as pd
 import pytest
 
 from go_attack import game_info
@@ -46,3 +49,109 @@ def test_parse_game_info(sgf_dir: pathlib.Path) -> None:
         assert game.b_name != game.w_name
         is_adversarial = "victimplay-truncated" in str(sgf_dir)
         assert hasattr(game, "victim_color") == is_adversarial
+
+
+def test_load_game_infos_cache(
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests `game_info.load_game_infos` only re-parses changed files."""
+    paths = []
+    for src in [SGF_DIR / "A.sgfs", SGF_DIR / "B.sgfs"]:
+        paths.append(tmp_path / src.name)
+        shutil.copy(src, paths[-1])
+    empty_path = tmp_path / "empty.sgfs"
+    empty_path.touch()
+    paths.append(empty_path)
+    cache_dir = tmp_path / "cache"
+
+    parsed = []
+    iter_parsed_shards = game_info.iter_parsed_shards
+
+    def recording_iter_parsed_shards(stale_paths, **kwargs):
+        parsed.extend(path.name for path in stale_paths)
+        return iter_parsed_shards(stale_paths, **kwargs)
+
+    monkeypatch.setattr(game_info, "iter_parsed_shards", recording_iter_parsed_shards)
+
+    expected = game_info.load_game_infos(paths, max_workers=1)
+    assert len(expected) == 2
+    assert list(expected.b_name) == [
+        game_info.parse_game_info(sgf_str).b_name
+        for sgf_str in game_info.read_and_concat_all_files(paths)
+    ]
+    assert list(expected.sgf_path) == [str(path.resolve()) for path in paths[:2]]
+
+    parsed.clear()
+    result = game_info.load_game_infos(paths, cache_dir, max_workers=1)
+    assert parsed == ["A.sgfs", "B.sgfs", "empty.sgfs"]
+    pd.testing.assert_frame_equal(result, expected)
+    shards = {path: path.stat().st_mtime_ns for path in cache_dir.iterdir()}
+    assert len(shards) == 3
+
+    parsed.clear()
+    result = game_info.load_game_infos(paths, cache_dir, max_workers=1)
+    assert parsed == []
+    pd.testing.assert_frame_equal(result, expected)
+
+    # Change the modification time of B.sgfs only; only its shard is rewritten.
+    stat = paths[1].stat()
+    os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    result = game_info.load_game_infos(paths, cache_dir, max_workers=2)
+    assert parsed == ["B.sgfs"]
+    pd.testing.assert_frame_equal(result, expected)
+    rewritten = [
+        path.name.split("-")[0]
+        for path, mtime_ns in shards.items()
+        if path.stat().st_mtime_ns != mtime_ns
+    ]
+    assert rewritten == ["B"]
+
+    parsed.clear()
+    result = game_info.load_game_infos(paths[::-1], cache_dir, columns=["komi"])
+    assert parsed == []
+    assert list(result.columns) == ["komi"]
+    assert list(result.komi) == list(expected.komi[::-1])
+
+    # Files that aren't cached yet, including the empty one, with `columns`.
+    result = game_info.load_game_infos(
+        paths,
+        tmp_path / "new_cache",
+        columns=["komi", "sgf_path"],
+        max_workers=1,
+    )
+    assert parsed == ["A.sgfs", "B.sgfs", "empty.sgfs"]
+    assert list(result.columns) == ["komi", "sgf_path"]
+    assert list(result.komi) == list(expected.komi)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_iter_game_infos(max_workers: int) -> None:
+    """Tests `game_info.iter_game_infos` matches `game_info.parse_game_info`."""
+    paths = sorted(game_info.find_sgf_files(TESTDATA_DIR))
+    expected = [
+        game_info.parse_game_info(sgf_str)
+        for sgf_str in game_info.read_and_concat_all_files(paths)
+    ]
+    kwargs = dict(max_workers=max_workers, shard_size=3, max_in_flight=2)
+    assert list(game_info.iter_game_infos(paths, **kwargs)) == expected
+
+    frames = list(game_info.iter_game_info_frames(paths, chunk_size=4, **kwargs))
+    assert [len(frame) for frame in frames] == [4, 4, 2]
+    assert list(pd.concat(frames).sgf_str) == [info.sgf_str for info in expected]
+
+
+def test_parse_game_info_fast_matches_sgfmill() -> None:
+    """Tests the fast `parse_game_info` path matches the sgfmill path."""
+    paths = game_info.find_sgf_files(TESTDATA_DIR)
+    sgf_strs = game_info.read_and_concat_all_files(paths)
+    # Also cover an escaped bracket in the root comment and a variation.
+    sgf_strs.append(sgf_strs[0].replace("gtype=", r"note=\]\\,gtype=", 1))
+    sgf_strs.append(sgf_strs[0][:-1] + "(;B[])(;W[]))")
+
+    num_passes = 0
+    for sgf_str in sgf_strs:
+        fast = game_info.parse_game_info(sgf_str, fast=True)
+        assert fast == game_info.parse_game_info(sgf_str, fast=False)
+        num_passes += fast.num_b_pass + fast.num_w_pass
+    assert num_passes > 0
@@ -0,0 +1,90 @@
+"""Unit tests for the `game_log` module."""
+
+import pathlib
+
+import pyarrow.parquet as pq
+
+from go_attack.analysis import analysis_table, load_analysis, write_analyses
+from go_attack.game_log import SgfLocation, SgfsGames, SgfsWriter, load_game
+from go_attack.go import Game, Move
+
+
+def _game(*moves: Move) -> Game:
+    game = Game(board_size=5)
+    for move in moves:
+        game.play_move(move)
+    return game
+
+
+def _one_line(sgf: str) -> str:
+    return sgf.replace("\n", "")
+
+
+def test_sgfs_writer(tmp_path: pathlib.Path):
+    """Checks games are buffered, made durable together, and read back."""
+    games = [_game(Move(i, 0), Move(i, 2)) for i in range(5)]
+    sgfs_path = tmp_path / "games.sgfs"
+    analysis_dir = tmp_path / "analyses"
+    durable = []
+
+    writer = SgfsWriter(
+        sgfs_path,
+        analysis_dir,
+        flush_every=2,
+        on_flush=lambda: durable.append("flush"),
+    )
+    locations = []
+    for i, game in enumerate(games):
+        location = writer.write(
+            i,
+            _one_line(game.to_sgf()),
+            analysis_table(i, [{"turn": 2, "move": "A1", "visits": i}]),
+            on_durable=lambda i=i: durable.append(i),
+        )
+        locations.append(location)
+        assert durable.count("flush") == (i + 1) // 2
+    parts = sorted(path.name for path in analysis_dir.iterdir())
+    assert parts == ["games-0.parquet", "games-2.parquet"]
+    writer.close()
+    assert durable == [0, 1, "flush", 2, 3, "flush", 4, "flush"]
+
+    stored = SgfsGames(locations)
+    assert len(stored) == 5
+    assert [game.moves for game in stored] == [game.moves for game in games]
+    assert [game.moves for game in stored[3:]] == [game.moves for game in games[3:]]
+
+    # The analyses of every write are merged into one file on close.
+    assert [path.name for path in analysis_dir.iterdir()] == ["games.parquet"]
+    assert pq.ParquetFile(analysis_dir / "games.parquet").num_row_groups == 5
+    analyses = load_analysis(analysis_dir)
+    assert analyses["game"].tolist() == analyses["visits"].tolist() == [0, 1, 2, 3, 4]
+
+    # After a crash, analyses left unmerged are merged on reopening, and those
+    # of games that weren't kept are dropped.
+    write_analyses(
+        analysis_dir / "games-5.parquet",
+        [analysis_table(i, [{"turn": 2, "move": "A1", "visits": i}]) for i in (5, 6)],
+    )
+    SgfsWriter(sgfs_path, analysis_dir, keep_games={0, 1, 2, 3, 5}).close()
+    assert [path.name for path in analysis_dir.iterdir()] == ["games.parquet"]
+    analyses = load_analysis(analysis_dir)
+    assert analyses["game"].tolist() == [0, 1, 2, 3, 5]
+
+    # Reopening after a crash mid-write keeps the file line-aligned.
+    with open(sgfs_path, "ab") as f:
+        f.write(b"(;FF[4]SZ[5")
+    with SgfsWriter(sgfs_path) as writer:
+        location = writer.write(5, _one_line(games[0].to_sgf()))
+    assert load_game(location).moves == games[0].moves
+    assert load_game(locations[4]).moves == games[4].moves
+
+    # Games after `keep_until` are dropped.
+    with SgfsWriter(sgfs_path, keep_until=locations[2].offset) as writer:
+        location = writer.write(2, _one_line(games[3].to_sgf()))
+    assert location == locations[2]
+    assert len(sgfs_path.read_text().splitlines()) == 3
+    assert load_game(location).moves == games[3].moves
+
+    sgf_path = tmp_path / "game.sgf"
+    sgf_path.write_text(games[1].to_sgf())
+    assert load_game(SgfLocation(sgf_path)).moves == games[1].moves
@@ -5,7 +5,8 @@ from typing import Dict, Sequence
 import numpy as np
 import pytest
 
-from go_attack.go import Game, Move
+from go_attack.go import Color, Game, Move, cartesian_to_numpy, tromp_taylor_scores
+from go_attack.history import CompactBoardHistory
 
 
 def create_game(
@@ -77,3 +78,143 @@ def test_is_suicide():
     # Black taking a square surrounded by white is not suicide if taking the
     # square surrounds a white group and creates a liberty.
     assert not game.is_suicide(Move(x=0, y=1), turn_idx=2)
+
+
+def test_is_repetition_matches_history_scan():
+    """Checks the Zobrist superko index against a scan of `board_states`."""
+    rng = np.random.default_rng(0)
+    game = Game(board_size=5)
+
+    for _ in range(150):
+        # Compare against every candidate move, including illegal ones.
+        for x, y in np.ndindex(5, 5):
+            if game.get_color(x, y) != Color.EMPTY:
+                continue
+            board = game.virtual_move(x, y)
+            expected = any(np.all(board == earlier) for earlier in game.board_states)
+            assert game.is_repetition(board) == expected
+
+        legal_moves = list(game.legal_moves())
+        roll = rng.random()
+        if roll < 0.1 and game.moves:
+            game.undo()
+        elif roll < 0.2 or not legal_moves:
+            game.skip_turn()
+        else:
+            game.play_move(legal_moves[rng.integers(len(legal_moves))])
+
+
+@pytest.mark.parametrize("allow_suicide", [False, True])
+def test_legal_move_mask_matches_is_legal(allow_suicide: bool):
+    """Checks the vectorized `Game.legal_move_mask` against `Game.is_legal`."""
+    rng = np.random.default_rng(1)
+    game = Game(board_size=5)
+
+    for _ in range(150):
+        mask = game.legal_move_mask(allow_suicide=allow_suicide)
+        for x, y in np.ndindex(5, 5):
+            is_legal = game.is_legal(Move(x, y), allow_suicide=allow_suicide)
+            assert mask[cartesian_to_numpy(x, y)] == is_legal
+
+        legal_moves = list(game.legal_moves(allow_suicide=allow_suicide))
+        assert len(legal_moves) == mask.sum()
+        if rng.random() < 0.05 or not legal_moves:
+            game.skip_turn()
+        else:
+            game.play_move(legal_moves[rng.integers(len(legal_moves))])
+
+
+def test_compact_history_matches_full_history():
+    """Checks `compact_history=True` reconstructs the same boards."""
+    rng = np.random.default_rng(2)
+    full = Game(board_size=5)
+    compact = Game(
+        board_size=5,
+        board_states=CompactBoardHistory(5, keyframe_interval=16),
+        compact_history=True,
+    )
+
+    for _ in range(100):
+        legal_moves = list(full.legal_moves())
+        assert legal_moves == list(compact.legal_moves())
+
+        roll = rng.random()
+        if roll < 0.1 and full.moves:
+            np.testing.assert_array_equal(full.undo(), compact.undo())
+        elif roll < 0.2 or not legal_moves:
+            full.skip_turn()
+            compact.skip_turn()
+        else:
+            move = legal_moves[rng.integers(len(legal_moves))]
+            full.play_move(move)
+            compact.play_move(move)
+
+    assert len(full.board_states) == len(compact.board_states)
+    for turn_idx, board in enumerate(compact.board_states):
+        np.testing.assert_array_equal(full.board_states[turn_idx], board)
+        assert full.score(turn_idx=turn_idx) == compact.score(turn_idx=turn_idx)
+        assert full.get_color(0, 0, turn_idx=turn_idx) == compact.get_color(
+            0,
+            0,
+            turn_idx=turn_idx,
+        )
+
+
+def test_tromp_taylor_scores():
+    """Checks `tromp_taylor_scores` on single and batched boards."""
+    boards = np.array(
+        [
+            # The middle column reaches both colors, so it is neutral.
+            [
+                [1, 0, 2],
+                [1, 0, 2],
+                [1, 0, 2],
+            ],
+            # Black owns the left edge, white the bottom right corner, and
+            # the top right corner is neutral.
+            [
+                [0, 1, 0],
+                [0, 1, 2],
+                [1, 2, 0],
+            ],
+            # An empty board reaches nobody.
+            [
+                [0, 0, 0],
+                [0, 0, 0],
+                [0, 0, 0],
+            ],
+        ],
+    )
+    black, white = tromp_taylor_scores(boards, komi=0.5)
+    np.testing.assert_array_equal(black, [3, 5, 0])
+    np.testing.assert_array_equal(white, [3.5, 3.5, 0.5])
+
+    for board, expected in zip(boards, zip(black, white)):
+        assert tromp_taylor_scores(board, komi=0.5) == expected
+        game = create_game(board_size=3, board_states=[board])
+        assert game.score() == (expected[0], expected[1] - 0.5 + game.komi)
+
+
+def test_compact_history_mutation():
+    """Checks `CompactBoardHistory` supports every list mutation."""
+    rng = np.random.default_rng(3)
+    boards = [rng.integers(0, 3, size=(5, 5), dtype=np.uint8) for _ in range(40)]
+    expected = list(boards)
+    history = CompactBoardHistory(5, boards, keyframe_interval=8)
+
+    replacement = np.zeros((5, 5), dtype=np.uint8)
+    for mutate in (
+        lambda seq: seq.__setitem__(3, replacement),
+        lambda seq: seq.__setitem__(-1, replacement),
+        lambda seq: seq.__setitem__(slice(10, 12), boards[:5]),
+        lambda seq: seq.__delitem__(0),
+        lambda seq: seq.__delitem__(slice(5, 20, 2)),
+        lambda seq: seq.insert(7, replacement),
+        lambda seq: seq.pop(2),
+        lambda seq: seq.pop(),
+    ):
+        mutate(expected)
+        mutate(history)
+        assert len(history) == len(expected)
+        for board, expected_board in zip(history, expected):
+            np.testing.assert_array_equal(board, expected_board)
@@ -0,0 +1,81 @@
+"""Unit tests for the `gtp` module."""
+
+import asyncio
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from go_attack.gtp import AsyncGTPEngine, GTPClient, GTPError, parse_header
+
+FAKE_ENGINE = pathlib.Path(__file__).absolute().parent / "testdata/fake_gtp_engine.py"
+
+
+def test_async_gtp_engine():
+    """Checks `AsyncGTPEngine` frames responses and reports errors."""
+
+    async def run():
+        engine = await AsyncGTPEngine.start([sys.executable, str(FAKE_ENGINE)])
+        async with engine:
+            assert await engine.command("name") == "fake"
+            commands = await engine.command("list_commands")
+            assert "genmove" in commands.splitlines()
+            with pytest.raises(GTPError):
+                await engine.command("boardsize nine")
+
+            # Concurrent commands to one engine don't mix up their responses.
+            responses = await asyncio.gather(
+                *(engine.command(cmd) for cmd in ["name", "version", "genmove B"]),
+            )
+            assert responses == ["fake", "2", "pass"]
+
+        assert engine.proc.returncode == 0
+
+    asyncio.run(run())
+
+
+def test_parse_header():
+    """Checks `parse_header` recognizes responses with and without ids."""
+    assert parse_header("=12 D4") == (True, 12, "D4")
+    assert parse_header("?3 unknown command") == (False, 3, "unknown command")
+    assert parse_header("=") == (True, None, "")
+    assert parse_header("= 12") == (True, None, "12")
+    assert parse_header("=12abc") is None
+    assert parse_header("info move D4") is None
+
+
+def test_gtp_client_pipelines_commands():
+    """Checks `GTPClient` matches pipelined responses to their commands."""
+    proc = subprocess.Popen(
+        [sys.executable, str(FAKE_ENGINE)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    gtp = GTPClient(proc.stdin, proc.stdout)
+    try:
+        responses = [
+            gtp.send("name"),
+            gtp.send("boardsize nine"),
+            gtp.send("list_commands"),
+            gtp.send("genmove B"),
+        ]
+        assert not any(response.done() for response in responses)
+
+        # Waiting for the last response reads all the earlier ones too.
+        assert responses[-1].result(timeout=10) == "pass"
+        assert all(response.done() for response in responses)
+        assert responses[0].result() == "fake"
+        assert "genmove" in responses[2].result().splitlines()
+        with pytest.raises(GTPError):
+            responses[1].result()
+
+        assert gtp.command("version") == "2"
+        gtp.send("quit")
+        gtp.flush()
+        assert proc.wait(timeout=10) == 0
+        with pytest.raises((BrokenPipeError, EOFError)):
+            gtp.command("name")
+    finally:
+        proc.kill()
+        proc.wait()
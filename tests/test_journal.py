@@ -0,0 +1,65 @@
+"""Unit tests for the `journal` module."""
+
+import pathlib
+
+import pytest
+
+from go_attack.game_log import SgfLocation
+from go_attack.go import Game, Move
+from go_attack.journal import GameJournal, game_result
+
+
+def test_game_journal(tmp_path: pathlib.Path):
+    """Checks records survive reopening and cut-short records are skipped."""
+    game = Game(board_size=5, komi=0.5)
+    for move in [Move(2, 2), None, None]:
+        game.play_move(move)
+    assert game_result(game) == "B+24.5"
+
+    sgf_path = tmp_path / "game_0.sgf"
+    sgf_path.write_text(game.to_sgf())
+    location = SgfLocation(sgf_path)
+    sgfs_location = SgfLocation(sgf_path, 0)
+    journal = GameJournal(tmp_path)
+    assert journal.completed(seed=1) == {}
+    journal.record(1, 0, "B+24.5", location)
+    journal.record(1, 1, "B+24.5", SgfLocation(tmp_path / "missing.sgf"))
+    journal.record(2, 2, "B+24.5", location)
+
+    # Simulate a crash in the middle of writing a record.
+    with open(journal.path, "a") as f:
+        f.write('{"seed": 1, "game": 3, "res')
+    journal = GameJournal(tmp_path)
+    journal.record(1, 4, "B+24.5", sgfs_location)
+
+    assert journal.completed(seed=1) == {0: location, 4: sgfs_location}
+    assert journal.completed(seed=2) == {2: location}
+
+
+def test_game_journal_config(tmp_path: pathlib.Path):
+    """Checks a journal can only be read with the settings it was written with."""
+    sgfs_path = tmp_path / "games_0.sgfs"
+    sgfs_path.write_text("(;FF[4])\n(;FF[4]SZ[5])\n(;FF[4]")
+    config = {"komi": 6.5, "board_size": 19}
+    journal = GameJournal(tmp_path, config)
+    assert journal.recorded_end(sgfs_path) == 0
+    journal.record(1, 0, "0", SgfLocation(sgfs_path, 0), sync=False)
+    journal.record(1, 1, "0", SgfLocation(sgfs_path, 9), sync=False)
+    journal.sync()
+
+    # Only the complete games that were journaled are kept.
+    assert journal.recorded_end(sgfs_path) == 23
+    assert GameJournal(tmp_path, dict(config)).completed(seed=1) == {
+        0: SgfLocation(sgfs_path, 0),
+        1: SgfLocation(sgfs_path, 9),
+    }
+    assert GameJournal(tmp_path).completed(seed=1).keys() == {0, 1}
+    with pytest.raises(ValueError, match="different settings: komi"):
+        GameJournal(tmp_path, {**config, "komi": 7.5}).completed(seed=1)
+
+    # A journal written without settings can't be checked.
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+    GameJournal(other_dir).record(1, 0, "0", SgfLocation(sgfs_path, 0))
+    with pytest.raises(ValueError, match="doesn't record the settings"):
+        GameJournal(other_dir, config).completed(seed=1)
@@ -0,0 +1,77 @@
+"""Unit tests for the `katago_analysis` module."""
+
+import asyncio
+import pathlib
+import sys
+
+import pytest
+
+from go_attack.go import Game, Move
+from go_attack.katago_analysis import (
+    AnalysisError,
+    AsyncAnalysisEngine,
+    best_move,
+    move_query,
+)
+
+FAKE_ENGINE = (
+    pathlib.Path(__file__).absolute().parent / "testdata/fake_analysis_engine.py"
+)
+
+
+def test_move_query():
+    """Checks `move_query` replays the game and analyzes only the last turn."""
+    game = Game(board_size=9, komi=7.5)
+    game.play_move(Move(2, 3))
+    game.play_move(None)
+
+    query = move_query(game, max_visits=16)
+    assert query["moves"] == [["B", str(Move(2, 3))], ["W", "pass"]]
+    assert query["analyzeTurns"] == [2]
+    assert query["boardXSize"] == query["boardYSize"] == 9
+    assert query["komi"] == 7.5
+    assert query["maxVisits"] == 16
+    assert "maxVisits" not in move_query(game)
+
+
+def test_best_move():
+    """Checks `best_move` picks the top-ranked move and passes without any."""
+    response = {
+        "moveInfos": [
+            {"move": "C4", "order": 1},
+            {"move": "D5", "order": 0},
+            {"move": "pass", "order": 2},
+        ],
+    }
+    assert best_move(response) == Move.from_str("D5")
+    assert best_move({"moveInfos": []}) is None
+    assert best_move({}) is None
+
+
+def test_async_analysis_engine():
+    """Checks responses are routed to the right query and errors are raised."""
+
+    async def run():
+        engine = await AsyncAnalysisEngine.start([sys.executable, str(FAKE_ENGINE)])
+        async with engine:
+            games = [Game(board_size=9) for _ in range(5)]
+            for i, game in enumerate(games):
+                for x in range(i):
+                    game.play_move(Move(x, 0))
+
+            # The fake engine answers concurrent queries in reverse order.
+            responses = await asyncio.gather(
+                *(engine.query(move_query(game)) for game in games),
+            )
+            for game, response in zip(games, responses):
+                assert response["turnNumber"] == len(game.moves)
+                assert best_move(response) is None
+
+            with pytest.raises(AnalysisError):
+                await engine.query(move_query(games[0], rules="bogus"))
+
+        assert engine.proc.returncode == 0
+        with pytest.raises(EOFError):
+            await engine.query(move_query(games[0]))
+
+    asyncio.run(run())
@@ -0,0 +1,133 @@
+"""Unit tests for the `nn_cache` module."""
+
+import pathlib
+
+import numpy as np
+import pytest
+
+from go_attack.adversarial_policy import MyopicWhiteBoxPolicy
+from go_attack.go import Color, Game, Move
+from go_attack.nn_cache import (
+    NNEvalCache,
+    canonical_position,
+    dihedral_transform,
+    inverse_dihedral_transform,
+)
+
+
+def _game(*moves: Move, komi: float = 7.5) -> Game:
+    game = Game(board_size=5, komi=komi)
+    for move in moves:
+        game.play_move(move)
+    return game
+
+
+def _board_query(game: Game):
+    """Returns a fake `kata-raw-nn` that is equivariant, like the real one."""
+    return lambda: {
+        "whiteWin": 0.5,
+        "policy": game.board_states[-1].astype(np.float64),
+    }
+
+
+@pytest.mark.parametrize("index", range(8))
+def test_dihedral_transforms(index: int):
+    """Checks the transforms are invertible and give equal canonical forms."""
+    board = np.arange(25).reshape(5, 5)
+    transformed = dihedral_transform(board, index)
+    np.testing.assert_array_equal(
+        inverse_dihedral_transform(transformed, index),
+        board,
+    )
+    assert canonical_position(transformed)[0] == canonical_position(board)[0]
+
+
+def test_nn_eval_cache_symmetric_hits():
+    """Checks symmetric positions share an entry, in their own orientation."""
+    cache = NNEvalCache()
+    symmetries = [
+        lambda x, y: Move(x, y),
+        lambda x, y: Move(4 - x, y),
+        lambda x, y: Move(x, 4 - y),
+        lambda x, y: Move(y, x),
+    ]
+    for symmetry in symmetries:
+        game = _game(symmetry(0, 0), symmetry(1, 2))
+        outputs = cache.evaluate(game, _board_query(game))
+        np.testing.assert_array_equal(outputs["policy"], game.board_states[-1])
+        assert outputs["whiteWin"] == 0.5
+
+        # Callers may modify the arrays without corrupting the cache.
+        outputs["policy"] += 100
+
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.hit_rate == 0.75
+    assert len(cache) == 1
+
+    # Komi and the player to move are part of the key.
+    for game in [
+        _game(Move(0, 0), Move(1, 2), komi=6.5),
+        _game(Move(0, 0), None, Move(4, 4)),
+        _game(Move(0, 0), None, Move(4, 4), None),
+    ]:
+        cache.evaluate(game, _board_query(game))
+    assert cache.misses == 4
+
+
+def test_nn_eval_cache_spills(tmp_path: pathlib.Path):
+    """Checks evicted entries are spilled to disk and found again later."""
+    games = [_game(Move(0, 0)), _game(Move(1, 1)), _game(Move(2, 2))]
+    with NNEvalCache(maxsize=1, spill_path=tmp_path / "spill") as cache:
+        for game in games:
+            cache.evaluate(game, _board_query(game))
+        assert len(cache) == 1
+        cache.evaluate(games[0], pytest.fail)
+        assert cache.hits == 1
+
+    with NNEvalCache(spill_path=tmp_path / "spill") as cache:
+        for game in games:
+            outputs = cache.evaluate(game, pytest.fail)
+            np.testing.assert_array_equal(outputs["policy"], game.board_states[-1])
+
+
+def test_nn_eval_cache_skips_repeated_positions():
+    """Checks positions that repeat an earlier one are always evaluated."""
+    cache = NNEvalCache()
+    game = _game(Move(0, 0), Move(1, 1))
+    cache.evaluate(game, _board_query(game))
+
+    # Two passes repeat the position, and it's black's turn again.
+    game = _game(Move(0, 0), Move(1, 1), None, None)
+    calls = []
+    cache.evaluate(game, lambda: calls.append(True) or _board_query(game)())
+    assert calls == [True]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+class _FakeGTP:
+    """Answers `kata-raw-nn` with a fixed policy, as KataGo would print it."""
+
+    def __init__(self, policy: np.ndarray):
+        self.policy = policy
+
+    def command(self, command: str) -> str:
+        assert command == "kata-raw-nn 0"
+        rows = [" ".join(f"{p:.3f}".upper() for p in row) for row in self.policy]
+        return "\n".join(["policy", *rows])
+
+
+def test_myopic_policy_rechecks_cached_moves():
+    """Checks a cached policy that suggests an illegal move is re-evaluated."""
+    game = _game(Move(2, 2))
+    # The least likely move of a stale policy is the occupied center point.
+    stale = np.ones((5, 5))
+    stale[2, 2] = 0.0
+    cache = NNEvalCache()
+    cache.evaluate(game, lambda: {"policy": stale})
+
+    fresh = np.ones((5, 5))
+    fresh[2, 2] = np.nan
+    fresh[0, 0] = 0.0
+    policy = MyopicWhiteBoxPolicy(game, Color.WHITE, False, _FakeGTP(fresh), cache)
+    assert policy.next_move() == Move(0, 0)
+    assert cache.hits == 1
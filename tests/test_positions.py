@@ -0,0 +1,96 @@
+"""Unit tests for the `positions` module."""
+
+import pathlib
+
+import numpy as np
+import pytest
+
+from go_attack.go import Color, Game
+from go_attack.positions import NO_MOVE, PASS, PositionDataset, export_positions
+from go_attack.sgf_loader import iter_sgf_strings
+from go_attack.sgf_parsing import root_properties
+
+TESTDATA_DIR = pathlib.Path(__file__).absolute().parent / "testdata"
+SGFS_PATHS = [
+    TESTDATA_DIR / "visits-truncated" / "A.sgfs",
+    TESTDATA_DIR / "visits-truncated" / "B.sgfs",
+    TESTDATA_DIR / "victimplay-truncated/selfplay/t0-s0-d0/sgfs/C.sgfs",
+]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_export_positions(tmp_path: pathlib.Path, processes: int):
+    """Checks every exported position against the replayed game."""
+    dataset = export_positions(SGFS_PATHS, tmp_path, processes=processes)
+    sgf_strs = [sgf for path in SGFS_PATHS for sgf in iter_sgf_strings(path)]
+    assert dataset.num_games == len(sgf_strs)
+
+    index = dataset.index.to_pandas()
+    for game_idx, sgf_str in enumerate(sgf_strs):
+        game = Game.from_sgf(sgf_str, check_legal=False)
+        boards = dataset.game_boards(game_idx)
+        assert np.array_equal(boards, np.stack(list(game.board_states)))
+
+        rows = index.iloc[dataset.game_rows(game_idx)]
+        assert list(rows.game) == [game_idx] * len(boards)
+        assert list(rows.turn) == list(range(len(boards)))
+        assert rows.player.iloc[0] == Color.BLACK.value
+        assert rows.move.iloc[-1] == NO_MOVE
+        assert set(rows.result) == {root_properties(sgf_str)["RE"][0]}
+        for move, expected in zip(rows.move, game.moves):
+            if expected is None:
+                assert move == PASS
+            else:
+                row, col = divmod(move, game.board_size)
+                assert (col, game.board_size - 1 - row) == (expected.x, expected.y)
+
+    assert len(dataset) == len(index)
+
+
+def test_position_dataset_views(tmp_path: pathlib.Path):
+    """Checks reopened positions are memory-mapped and sliced without copies."""
+    export_positions(SGFS_PATHS, tmp_path)
+    dataset = PositionDataset(tmp_path)
+    assert isinstance(dataset.boards, np.memmap)
+    assert not dataset.boards.flags.writeable
+    assert np.shares_memory(dataset.game_boards(1), dataset.boards)
+
+    turn = 10
+    rows = dataset.turn_rows(turn)
+    lengths = np.diff(dataset.offsets)
+    assert len(rows) == np.sum(lengths > turn)
+    assert list(dataset.index.column("turn").to_numpy()[rows]) == [turn] * len(rows)
+    assert list(dataset.turn_rows(0, games=[2, 0])) == [
+        dataset.offsets[2],
+        dataset.offsets[0],
+    ]
+
+
+def test_export_positions_mixed_sizes(tmp_path: pathlib.Path):
+    """Checks games of different sizes can't be exported together."""
+    sgfs_path = tmp_path / "mixed.sgfs"
+    sgfs_path.write_text("(;FF[4]SZ[9];B[aa])\n(;FF[4]SZ[19];B[aa])\n")
+    with pytest.raises(ValueError):
+        export_positions([sgfs_path], tmp_path / "out")
+
+
+def test_export_positions_setup_stones(tmp_path: pathlib.Path):
+    """Checks setup stones are on the first board and players follow the SGF."""
+    sgfs_path = tmp_path / "handicap.sgfs"
+    sgfs_path.write_text("(;FF[4]SZ[5]RE[W+1]AB[aa][ee]AW[ca];W[cc];W[dd];B[])\n")
+    dataset = export_positions([sgfs_path], tmp_path / "out")
+
+    first = np.zeros((5, 5), dtype=np.uint8)
+    # Row 0 of the array is the top of the board, i.e. SGF row "e".
+    first[4, 0] = first[0, 4] = Color.BLACK.value
+    first[4, 2] = Color.WHITE.value
+    boards = dataset.game_boards(0)
+    assert np.array_equal(boards[0], first)
+    assert boards[1][2, 2] == Color.WHITE.value
+    assert boards[2][1, 3] == Color.WHITE.value
+    assert np.array_equal(boards[3], boards[2])
+
+    index = dataset.index.to_pandas()
+    white, black = Color.WHITE.value, Color.BLACK.value
+    assert list(index.player) == [white, white, black, white]
+    assert list(index.move)[-2:] == [PASS, NO_MOVE]
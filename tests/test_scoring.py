@@ -0,0 +1,147 @@
+"""Unit tests for the `scoring` module."""
+
+import pathlib
+import re
+
+import numpy as np
+import pytest
+from sgfmill import sgf, sgf_moves
+
+from go_attack.go import Color, Game, parse_sgf_moves, parse_sgf_record
+from go_attack.scoring import (
+    ScoreCache,
+    katago_scores,
+    pass_alive_area,
+    score_sgf,
+    score_sgfs,
+)
+from go_attack.sgf_loader import final_board, record_final_board
+
+TESTDATA_DIR = pathlib.Path(__file__).absolute().parent / "testdata"
+# Games scored by KataGo, two of which have dead stones in pass-alive areas.
+GOLDEN_SGFS = [
+    line
+    for path in sorted(TESTDATA_DIR.rglob("*.sgfs"))
+    for line in path.read_text().splitlines()
+]
+
+
+def test_pass_alive_area():
+    """Checks a white stone in black's pass-alive territory is removed."""
+    board = np.array(
+        [
+            [0, 1, 0, 2, 0],
+            [1, 1, 1, 1, 1],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0],
+        ],
+    )
+    black_area = pass_alive_area(board, Color.BLACK)
+    assert black_area[:2].all() and not black_area[2:].any()
+    assert not pass_alive_area(board, Color.WHITE).any()
+
+    # Plain Tromp-Taylor leaves the top right points neutral.
+    game = Game(board_size=5, komi=0.0)
+    game.board_states[-1] = board
+    assert game.score() == (22, 1)
+    assert katago_scores(board) == (25.0, 0.0)
+
+    # With one eye, black isn't pass-alive.
+    board[0, 0] = Color.BLACK.value
+    assert not pass_alive_area(board, Color.BLACK).any()
+
+
+@pytest.mark.parametrize("sgf_string", GOLDEN_SGFS)
+def test_score_sgf_matches_katago(sgf_string: str):
+    """Checks games are scored exactly as KataGo scored them."""
+    game = Game.from_sgf(sgf_string, check_legal=False)
+    board_size, komi, moves = parse_sgf_moves(sgf_string)
+    board = final_board(board_size, moves)
+    np.testing.assert_array_equal(board, game.board_states[-1])
+    assert komi == game.komi
+
+    (expected,) = re.findall(r"RE\[([^\]]*)\]", sgf_string)
+    assert score_sgf(sgf_string) == expected
+
+
+@pytest.mark.parametrize(
+    "sgf_string,expected",
+    [
+        # Setup stones count, the players needn't alternate, and komi is 0.
+        ("(;SZ[5]AB[aa][bb];W[ee];B[];W[])", "B+1"),
+        ("(;SZ[5]KM[1.5]AB[aa:bb]AW[ee];W[dd];W[])", "B+0.5"),
+        # Black's setup stones at the top are pass-alive and capture nothing,
+        # so white's stone there is removed.
+        ("(;SZ[5]KM[0]AB[ab][bb][cb][db][eb][ba][da]AW[ca];B[];W[])", "B+25"),
+    ],
+)
+def test_score_sgf_setup(sgf_string: str, expected: str):
+    """Checks setup stones and komi are handled like KataGo replays them."""
+    assert score_sgf(sgf_string) == expected
+
+
+@pytest.mark.parametrize(
+    "sgf_string,expected",
+    [
+        # Seki: black's a column and white's c column share the b column and
+        # neither has an eye. Nothing is pass-alive, so the shared liberties
+        # are neutral and no stones are removed.
+        (
+            "(;SZ[5]KM[0]AB[aa][ab][ac][ad][ae][da][db][dc][dd][de]"
+            "AW[ca][cb][cc][cd][ce];W[];B[])",
+            "B+10",
+        ),
+        # Handicap: white moves first and captures a handicap stone, leaving
+        # white a one point territory in the corner.
+        ("(;SZ[5]KM[0.5]HA[2]AB[aa][ee]AW[ba];W[ab];B[cc];W[];B[])", "W+1.5"),
+        # Black moves seven times in a row to make a pass-alive group, and the
+        # white stone then played inside its territory is removed.
+        (
+            "(;SZ[5]KM[0];B[ab];B[bb];B[cb];B[db];B[eb];B[ba];B[da];W[ca];W[];B[])",
+            "B+25",
+        ),
+    ],
+)
+def test_score_sgf_edge_cases(sgf_string: str, expected: str):
+    """Checks seki, handicap and non-alternating games against KataGo's rules.
+
+    The expected results are worked out by hand under KataGo's scoring, i.e.
+    Tromp-Taylor area scoring after removing stones in pass-alive territory.
+    The final boards are checked against `sgfmill`, which replays the games
+    independently of `parse_sgf_record`.
+    """
+    sgf_game = sgf.Sgf_game.from_string(sgf_string)
+    board, plays = sgf_moves.get_setup_and_moves(sgf_game)
+    for color, point in plays:
+        if point is not None:
+            board.play(*point, color)
+    expected_board = [
+        [{None: 0, "b": 1, "w": 2}[board.get(row, col)] for col in range(5)]
+        for row in range(5)
+    ]
+    record = parse_sgf_record(sgf_string)
+    np.testing.assert_array_equal(record_final_board(record), expected_board)
+    assert score_sgf(sgf_string) == expected
+
+
+def test_score_sgfs():
+    """Checks games scored on a process pool come back in order."""
+    results = score_sgfs(GOLDEN_SGFS, processes=2, chunksize=3)
+    assert results == [score_sgf(sgf_string) for sgf_string in GOLDEN_SGFS]
+
+
+def test_score_cache(tmp_path: pathlib.Path):
+    """Checks results persist and can be read by another connection."""
+    path = tmp_path / "scores.db"
+    with ScoreCache(path) as cache:
+        assert cache.get_many(["a"]) == {}
+        cache.put_many([("a", "B+1.5"), ("b", "W+0.5")])
+        with ScoreCache(path) as reader:
+            assert reader.get_many(["a", "c"]) == {"a": "B+1.5"}
+
+    with ScoreCache(path) as cache:
+        assert len(cache) == 2
+        cache.put_many([("b", "0")])
+        keys = [str(i) for i in range(1200)] + ["b"]
+        assert cache.get_many(keys) == {"b": "0"}
@@ -0,0 +1,68 @@
+"""Unit tests for the `sgf_loader` module."""
+
+import pathlib
+
+import numpy as np
+from sgfmill import sgf
+
+from go_attack.go import Color, Game, Move
+from go_attack.sgf_loader import iter_sgf_strings, load_sgfs, load_sgfs_parallel
+
+TESTDATA_DIR = pathlib.Path(__file__).absolute().parent / "testdata"
+SGFS_PATHS = [
+    TESTDATA_DIR / "visits-truncated" / "A.sgfs",
+    TESTDATA_DIR / "victimplay-truncated/selfplay/t0-s0-d0/sgfs/C.sgfs",
+]
+
+
+def test_load_sgfs_matches_sgfmill():
+    """Checks the fast loader reads the same moves as `sgfmill`."""
+    for path in SGFS_PATHS:
+        sgf_strs = list(iter_sgf_strings(path))
+        games = list(load_sgfs(path, check_legal=True))
+        assert len(games) == len(sgf_strs)
+
+        for sgf_str, game in zip(sgf_strs, games):
+            sgf_game = sgf.Sgf_game.from_string(sgf_str)
+            size = sgf_game.get_size()
+            expected = []
+            for node in sgf_game.get_main_sequence()[1:]:
+                _, point = node.get_move()
+                expected.append(
+                    None if point is None else Move(point[1], size - 1 - point[0]),
+                )
+
+            assert game.board_size == size
+            assert game.komi == sgf_game.get_komi()
+            assert game.moves == expected
+
+
+def test_final_position_only():
+    """Checks final boards match fully replayed games, with and without a pool."""
+    finals = list(load_sgfs_parallel(SGFS_PATHS, final_position_only=True))
+    games = list(load_sgfs_parallel(SGFS_PATHS, processes=1, compact_history=False))
+    assert len(finals) == len(games)
+    for board, game in zip(finals, games):
+        assert isinstance(game, Game)
+        np.testing.assert_array_equal(board, game.board_states[-1])
+
+
+def test_final_position_only_setup_stones(tmp_path: pathlib.Path):
+    """Checks handicap stones and the SGF's move colors are used."""
+    path = tmp_path / "handicap.sgfs"
+    # White moves first after black's handicap, then captures the stone at aa.
+    path.write_text("(;FF[4]SZ[5]AB[aa][ee]AW[ba];W[ab];B[cc];W[dd];W[])\n")
+    (board,) = load_sgfs(path, final_position_only=True)
+
+    sgf_game = sgf.Sgf_game.from_string(path.read_text())
+    black, white, _ = sgf_game.get_root().get_setup_stones()
+    assert len(black) == 2 and len(white) == 1
+    expected = np.zeros((5, 5), dtype=board.dtype)
+    for color, vertices in (
+        (Color.BLACK, ["ee", "cc"]),
+        (Color.WHITE, ["ba", "ab", "dd"]),
+    ):
+        for vertex in vertices:
+            col, row = ord(vertex[0]) - ord("a"), ord(vertex[1]) - ord("a")
+            expected[4 - row, col] = color.value
+    np.testing.assert_array_equal(board, expected)
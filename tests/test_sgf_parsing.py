@@ -0,0 +1,21 @@
+"""Unit tests for the `sgf_parsing` module."""
+
+from go_attack.sgf_parsing import has_variations, iter_properties, root_properties
+
+
+def test_iter_properties_follows_main_line():
+    """Checks escapes, multi-valued properties and variations are handled."""
+    sgf_str = r"(;SZ[9]AB[aa][bb]C[B[cc\] \\];B[dd](;W[ee];B[ff])(;W[gg]))"
+    props = [tuple(prop) for prop in iter_properties(sgf_str)]
+    assert props == [
+        (0, "SZ", "9"),
+        (0, "AB", "aa"),
+        (0, "AB", "bb"),
+        (0, "C", r"B[cc\] \\"),
+        (1, "B", "dd"),
+        (2, "W", "ee"),
+        (3, "B", "ff"),
+    ]
+    assert root_properties(sgf_str)["AB"] == ["aa", "bb"]
+    assert has_variations(sgf_str)
+    assert not has_variations("(;SZ[9]C[(;B[aa])];B[bb])")
@@ -0,0 +1,57 @@
+"""Unit tests for the `sweep` module."""
+
+import time
+
+from go_attack.sweep import (
+    WorkUnit,
+    assign_to_queues,
+    make_work_units,
+    run_work_stealing,
+)
+
+CONFIGS = [("edge", 64), ("edge", 512), ("random", 1), ("random", 4096)]
+
+
+def _run_unit(unit: WorkUnit, home: int):
+    time.sleep(0.01 * unit.num_games)
+    return home, list(range(unit.first_game, unit.first_game + unit.num_games))
+
+
+def test_make_work_units():
+    """Checks every game of every configuration is in exactly one unit."""
+    units = make_work_units(CONFIGS, 25, 10, lambda config: config[1])
+    assert len(units) == 3 * len(CONFIGS)
+    for config_idx, (_, visits) in enumerate(CONFIGS):
+        config_units = [unit for unit in units if unit.config_idx == config_idx]
+        assert [unit.first_game for unit in config_units] == [0, 10, 20]
+        assert [unit.num_games for unit in config_units] == [10, 10, 5]
+        assert [unit.cost for unit in config_units] == [10 * visits] * 2 + [
+            5 * visits,
+        ]
+
+
+def test_assign_to_queues():
+    """Checks configurations stay together and the heaviest are spread out."""
+    units = make_work_units(CONFIGS, 25, 10, lambda config: config[1])
+    queues = assign_to_queues(units, 2)
+    assert sorted(unit for queue in queues for unit in queue) == sorted(units)
+
+    config_queues = [{unit.config_idx for unit in queue} for queue in queues]
+    assert config_queues[0].isdisjoint(config_queues[1])
+    # The 4096-visit configuration costs more than all the others together.
+    assert {3} in config_queues
+    for queue in queues:
+        costs = [unit.cost for unit in queue]
+        assert costs == sorted(costs, reverse=True)
+
+
+def test_run_work_stealing():
+    """Checks idle workers steal work and every unit runs exactly once."""
+    units = make_work_units(CONFIGS[:2], 40, 4, lambda config: config[1])
+    results = run_work_stealing([units, []], _run_unit, workers_per_queue=1)
+
+    assert sorted(unit for unit, _ in results) == sorted(units)
+    for unit, (_, games) in results:
+        assert games == list(range(unit.first_game, unit.first_game + unit.num_games))
+    # The worker for the empty queue had to steal.
+    assert any(home == 1 for _, (home, _) in results)
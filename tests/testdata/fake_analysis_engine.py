@@ -0,0 +1,62 @@
+"""A minimal stand-in for `katago analysis` for tests; it always passes.
+
+Queries that arrive together are answered together, in reverse order, to mimic
+the engine answering queries in whatever order their searches finish.
+"""
+
+import json
+import select
+import sys
+
+
+def respond(response: dict) -> None:
+    """Write one JSON response line."""
+    sys.stdout.write(json.dumps(response) + "\n")
+    sys.stdout.flush()
+
+
+def answer(query: dict) -> None:
+    """Answer `query`, preceded by the noise the real engine can emit."""
+    query_id = query["id"]
+    if query.get("rules") not in ("tromp-taylor", None):
+        respond({"id": query_id, "error": f"Unknown rules {query['rules']}"})
+        return
+
+    respond({"id": query_id, "warning": "Unused field", "field": "foo"})
+    move_infos = [
+        {"move": "A1", "order": 1, "visits": 1},
+        {"move": "pass", "order": 0, "visits": 2},
+    ]
+    respond({"id": query_id, "isDuringSearch": True, "moveInfos": move_infos})
+    respond(
+        {
+            "id": query_id,
+            "isDuringSearch": False,
+            "turnNumber": len(query["moves"]),
+            "moveInfos": move_infos,
+        },
+    )
+
+
+def main() -> None:  # noqa: D103
+    batch = []
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if line.strip():
+            batch.append(json.loads(line))
+
+        # Keep collecting until no more queries are immediately available.
+        if select.select([sys.stdin], [], [], 0.05)[0]:
+            continue
+        for query in reversed(batch):
+            answer(query)
+        batch = []
+
+    for query in reversed(batch):
+        answer(query)
+
+
+if __name__ == "__main__":
+    main()
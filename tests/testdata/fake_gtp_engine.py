@@ -0,0 +1,65 @@
+"""A minimal GTP engine for tests; it always passes."""
+
+import sys
+
+# What `kata-genmove_analyze` prints before the move.
+ANALYSIS = (
+    "info move pass visits 2 utility 0.1 winrate 0.55 scoreMean 0.5 "
+    "scoreLead 0.5 prior 0.9 lcb 0.5 order 0 pv pass "
+    "info move A1 visits 1 utility -0.1 winrate 0.45 scoreMean -0.5 "
+    "scoreLead -0.5 prior 0.1 lcb 0.4 order 1 pv A1 pass"
+)
+
+KNOWN_COMMANDS = (
+    "boardsize",
+    "clear_board",
+    "genmove",
+    "kata-genmove_analyze",
+    "komi",
+    "list_commands",
+    "name",
+    "play",
+    "protocol_version",
+    "quit",
+    "version",
+)
+
+
+def respond(cmd_id: str, text: str = "", success: bool = True) -> None:
+    """Write a GTP response for the command with id `cmd_id`."""
+    prefix = "=" if success else "?"
+    sys.stdout.write(f"{prefix}{cmd_id} {text}".rstrip() + "\n\n")
+    sys.stdout.flush()
+
+
+def main() -> None:  # noqa: D103
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+
+        cmd_id = parts.pop(0) if parts[0].isdigit() else ""
+        command, args = parts[0], parts[1:]
+        if command == "quit":
+            respond(cmd_id)
+            return
+        elif command == "name":
+            respond(cmd_id, "fake")
+        elif command in ("protocol_version", "version"):
+            respond(cmd_id, "2")
+        elif command == "list_commands":
+            respond(cmd_id, "\n".join(KNOWN_COMMANDS))
+        elif command == "genmove":
+            respond(cmd_id, "pass")
+        elif command == "kata-genmove_analyze":
+            respond(cmd_id, f"\n{ANALYSIS}\nplay pass")
+        elif command == "boardsize" and not (args and args[0].isdigit()):
+            respond(cmd_id, "syntax error", success=False)
+        elif command in KNOWN_COMMANDS:
+            respond(cmd_id)
+        else:
+            respond(cmd_id, "unknown command", success=False)
+
+
+if __name__ == "__main__":
+    main()